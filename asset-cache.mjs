@@ -0,0 +1,234 @@
+import crypto from 'crypto';
+import fs from 'fs/promises';
+import path from 'path';
+
+// Content-addressed cache for generated quiz assets (AI narratives, TTS audio,
+// downloaded images), shared by every quiz folder.
+//
+// Files are stored once under blobs/ by the SHA-256 of their content. The
+// index maps a request key (e.g. question text + answer + voice + prompt
+// version, or an image URL) to a blob or a small JSON value, and records when
+// each entry was last used so the cache can be trimmed LRU-first once it grows
+// past maxBytes.
+//
+// Lookups and stores only touch the in-memory index. flush() writes it once
+// the assets of a render are done (and a few seconds after changes, in case
+// the render dies first). Batch runs render several quizzes at once, all
+// sharing one index, so a flush merges the entries this process changed into a
+// fresh read of index.json under a lock file and no process drops another's.
+
+const INDEX_VERSION = 1;
+// A lock older than this was left behind by a killed process
+const LOCK_STALE_MS = 30_000;
+// Changes are flushed in the background at most this long after they happen
+const FLUSH_DELAY_MS = 5_000;
+
+const sleep = (ms) => new Promise(resolve => setTimeout(resolve, ms));
+
+export class AssetCache {
+  constructor(dir, maxBytes) {
+    this.dir = dir;
+    this.blobDir = path.join(dir, 'blobs');
+    this.indexPath = path.join(dir, 'index.json');
+    this.lockPath = `${this.indexPath}.lock`;
+    this.maxBytes = maxBytes;
+    this.entries = {};
+    // Entries this process changed since the last flush (null = deleted)
+    this.changes = new Map();
+    this.hits = 0;
+    this.stored = 0;
+    this.flushing = Promise.resolve();
+    this.flushTimer = null;
+  }
+
+  // Stable key for any JSON-serializable request description
+  static key(...parts) {
+    return crypto.createHash('sha256').update(JSON.stringify(parts)).digest('hex');
+  }
+
+  async load() {
+    await fs.mkdir(this.blobDir, { recursive: true });
+    this.entries = await this.readIndex();
+  }
+
+  async readIndex() {
+    try {
+      const index = JSON.parse(await fs.readFile(this.indexPath, 'utf-8'));
+      if (index.version === INDEX_VERSION) {
+        return index.entries;
+      }
+    } catch {
+      // Missing or corrupt index: start empty, orphaned blobs get reused by hash
+    }
+    return {};
+  }
+
+  // Exclusive across processes: the lock file is created with O_EXCL
+  async withLock(fn) {
+    for (let delay = 10; ; delay = Math.min(delay * 2, 200)) {
+      try {
+        await (await fs.open(this.lockPath, 'wx')).close();
+        break;
+      } catch (err) {
+        if (err.code !== 'EEXIST') {
+          throw err;
+        }
+      }
+      try {
+        const { mtimeMs } = await fs.stat(this.lockPath);
+        if (Date.now() - mtimeMs > LOCK_STALE_MS) {
+          await fs.rm(this.lockPath, { force: true });
+          continue;
+        }
+      } catch {
+        continue; // released between open and stat
+      }
+      await sleep(delay);
+    }
+    try {
+      return await fn();
+    } finally {
+      await fs.rm(this.lockPath, { force: true });
+    }
+  }
+
+  // Set (or with null, delete) an entry; it is written on the next flush()
+  update(key, entry) {
+    if (entry === null) {
+      delete this.entries[key];
+    } else {
+      this.entries[key] = entry;
+    }
+    this.changes.set(key, entry);
+    if (!this.flushTimer) {
+      this.flushTimer = setTimeout(() => {
+        this.flush().catch(err => console.warn(`⚠️  Asset cache index not saved: ${err.message}`));
+      }, FLUSH_DELAY_MS);
+      // A pending flush never keeps the process alive; call flush() before exiting
+      this.flushTimer.unref();
+    }
+  }
+
+  // Write our changes to index.json. Flushes are chained so they never
+  // interleave; each applies our changes on top of the index as it is on disk
+  // now, which also picks up entries other processes added since load().
+  flush() {
+    clearTimeout(this.flushTimer);
+    this.flushTimer = null;
+    this.flushing = this.flushing.catch(() => {}).then(async () => {
+      if (this.changes.size === 0) {
+        return;
+      }
+      await this.withLock(async () => {
+        const entries = await this.readIndex();
+        for (const [key, entry] of this.changes) {
+          if (entry === null) {
+            delete entries[key];
+          } else {
+            entries[key] = { ...entry, lastUsed: Math.max(entry.lastUsed, entries[key]?.lastUsed ?? 0) };
+          }
+        }
+        this.changes.clear();
+        this.entries = entries;
+        await this.evict();
+
+        const tmpPath = `${this.indexPath}.${process.pid}.tmp`;
+        await fs.writeFile(tmpPath, JSON.stringify({ version: INDEX_VERSION, entries: this.entries }));
+        await fs.rename(tmpPath, this.indexPath);
+      });
+    });
+    return this.flushing;
+  }
+
+  entry(key) {
+    return this.entries[key];
+  }
+
+  blobPath(hash, ext) {
+    return path.join(this.blobDir, `${hash}${ext}`);
+  }
+
+  // Copy a cached file to outputPath. Returns false on a miss.
+  async getFile(key, outputPath) {
+    const entry = this.entries[key];
+    if (!entry || !entry.blob) {
+      return false;
+    }
+    try {
+      await fs.copyFile(this.blobPath(entry.blob, entry.ext), outputPath);
+    } catch {
+      // Blob removed behind our back
+      this.update(key, null);
+      return false;
+    }
+    entry.lastUsed = Date.now();
+    this.update(key, entry);
+    this.hits++;
+    return true;
+  }
+
+  // Store the file at sourcePath under key (extra fields are kept on the entry)
+  async putFile(key, sourcePath, extra = {}) {
+    const content = await fs.readFile(sourcePath);
+    const hash = crypto.createHash('sha256').update(content).digest('hex');
+    const ext = path.extname(sourcePath);
+    const blobPath = this.blobPath(hash, ext);
+    try {
+      await fs.access(blobPath);
+    } catch {
+      const tmpPath = `${blobPath}.${process.pid}.tmp`;
+      await fs.writeFile(tmpPath, content);
+      await fs.rename(tmpPath, blobPath);
+    }
+    this.update(key, { ...extra, blob: hash, ext, size: content.length, lastUsed: Date.now() });
+    this.stored++;
+  }
+
+  getJson(key) {
+    const entry = this.entries[key];
+    if (!entry || entry.value === undefined) {
+      return null;
+    }
+    entry.lastUsed = Date.now();
+    this.update(key, entry);
+    this.hits++;
+    return entry.value;
+  }
+
+  putJson(key, value) {
+    this.update(key, { value, size: JSON.stringify(value).length, lastUsed: Date.now() });
+    this.stored++;
+  }
+
+  // Drop least recently used entries (and blobs nothing else points to)
+  // until the unique blob bytes fit in maxBytes. Runs inside flush(), on the
+  // merged index, so it never deletes a blob another process just indexed.
+  async evict() {
+    const blobBytes = new Map();
+    for (const entry of Object.values(this.entries)) {
+      if (entry.blob) {
+        blobBytes.set(entry.blob, entry.size);
+      }
+    }
+    let total = [...blobBytes.values()].reduce((sum, size) => sum + size, 0);
+    if (total <= this.maxBytes) {
+      return;
+    }
+
+    const byAge = Object.entries(this.entries)
+      .filter(([, entry]) => entry.blob)
+      .sort(([, a], [, b]) => a.lastUsed - b.lastUsed);
+
+    for (const [key, entry] of byAge) {
+      if (total <= this.maxBytes) {
+        break;
+      }
+      delete this.entries[key];
+      const stillUsed = Object.values(this.entries).some(other => other.blob === entry.blob);
+      if (!stillUsed) {
+        await fs.rm(this.blobPath(entry.blob, entry.ext), { force: true });
+        total -= entry.size;
+      }
+    }
+  }
+}
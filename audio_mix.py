@@ -0,0 +1,291 @@
+"""
+Streaming audio helpers for the joiner (transition.py).
+
+Audio files are decoded by ffmpeg into fixed-size float32 blocks so long
+background playlists never have to sit in memory as one array.
+"""
+
+from moviepy.config import FFMPEG_BINARY
+import os
+import re
+import json
+import hashlib
+import subprocess
+import tempfile
+import wave
+import numpy as np
+
+# Shared with transition.py (matte frames, ...)
+CACHE_DIR = os.getenv('QUIZ_CACHE_DIR', '.cache')
+
+SAMPLE_RATE = 44100
+CHANNELS = 2
+# Samples per channel handed out per block (~1.5s at 44.1kHz)
+BLOCK_FRAMES = 65536
+
+# Mix buffers larger than this are memory-mapped from the work directory
+# (an hour of stereo float32 at 44.1kHz is ~1.3 GB)
+MEMMAP_THRESHOLD_BYTES = 256 * 1024 * 1024
+
+# Background music ducking: the narration's energy is tracked per 50 ms
+# block and averaged over 200 ms (long enough that the timer's clock ticks
+# stay below the threshold while speech does not). Active blocks duck the
+# music, which stays down for the hold time and fades over the ramp time.
+DUCK_BLOCK_FRAMES = SAMPLE_RATE // 20
+DUCK_DETECT_SECONDS = 0.2
+DUCK_THRESHOLD_DB = -35.0
+DUCK_HOLD_SECONDS = 0.4
+DUCK_RAMP_SECONDS = 0.25
+
+# Bump when the measurement changes so cached values are not reused
+LOUDNESS_VERSION = 1
+
+def file_sha1(path):
+    """Content hash of a file, read in 1 MB chunks"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def iter_pcm_blocks(path, audio_filter=None, stderr=None):
+    """Yield the audio of `path` as float32 (frames, CHANNELS) blocks of BLOCK_FRAMES frames"""
+    cmd = [FFMPEG_BINARY, '-v', 'info', '-nostats', '-hide_banner', '-i', path, '-vn']
+    if audio_filter:
+        cmd.extend(['-af', audio_filter])
+    cmd.extend(['-ar', str(SAMPLE_RATE), '-ac', str(CHANNELS), '-f', 'f32le', '-'])
+
+    block_bytes = BLOCK_FRAMES * CHANNELS * 4
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr or subprocess.DEVNULL)
+    finished = False
+    try:
+        while True:
+            data = proc.stdout.read(block_bytes)
+            if not data:
+                break
+            # A short read can split a frame only at the very end of the stream
+            usable = len(data) - len(data) % (CHANNELS * 4)
+            yield np.frombuffer(data[:usable], dtype=np.float32).reshape(-1, CHANNELS)
+        finished = True
+    finally:
+        proc.stdout.close()
+        if not finished:
+            # Caller stopped early
+            proc.kill()
+        returncode = proc.wait()
+    if returncode != 0:
+        raise RuntimeError(f"ffmpeg failed to decode {path}")
+
+def measure_loudness(path):
+    """Measure RMS level and EBU R128 integrated loudness in one streaming pass.
+
+    RMS is accumulated block by block in NumPy; ffmpeg's ebur128 filter runs
+    on the same decode and reports integrated loudness when it finishes.
+    Returns {'rms_db', 'lufs', 'duration'} (levels are None for silence).
+    """
+    sum_squares = 0.0
+    frames = 0
+    with tempfile.TemporaryFile() as log:
+        for block in iter_pcm_blocks(path, audio_filter='ebur128=framelog=quiet', stderr=log):
+            sum_squares += float(np.sum(np.square(block, dtype=np.float64)))
+            frames += len(block)
+        log.seek(0)
+        summary = log.read().decode(errors='replace')
+
+    rms_db = None
+    if frames and sum_squares > 0:
+        rms_db = float(10 * np.log10(sum_squares / (frames * CHANNELS)))
+
+    lufs = None
+    match = re.findall(r'I:\s+(-?[\d.]+) LUFS', summary)
+    if match and float(match[-1]) > -70.0:
+        lufs = float(match[-1])
+
+    return {'rms_db': rms_db, 'lufs': lufs, 'duration': frames / SAMPLE_RATE}
+
+def load_loudness(path):
+    """measure_loudness(path), cached in CACHE_DIR/loudness/ by file content hash.
+
+    One small file per key, written by rename, so joins running in parallel
+    never overwrite each other's measurements.
+    """
+    cache_path = os.path.join(CACHE_DIR, 'loudness', f"{file_sha1(path)}_v{LOUDNESS_VERSION}.json")
+    try:
+        with open(cache_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        pass
+
+    loudness = measure_loudness(path)
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(loudness, f)
+    os.replace(tmp_path, cache_path)
+    return loudness
+
+def gain_for_level(current_db, target_level, max_gain=10.0):
+    """Linear gain taking `current_db` to `target_level`, capped at `max_gain`"""
+    if current_db is None:
+        return 1.0
+    return min(10 ** ((target_level - current_db) / 20), max_gain)
+
+def loudness_gain(loudness, target_lufs, target_rms_db, max_gain=10.0):
+    """Linear gain for a load_loudness() result.
+
+    Integrated loudness (EBU R128) is used when the track has one; tracks
+    too quiet for its gate fall back to RMS.
+    """
+    if loudness['lufs'] is not None:
+        return gain_for_level(loudness['lufs'], target_lufs, max_gain)
+    return gain_for_level(loudness['rms_db'], target_rms_db, max_gain)
+
+def decode_audio(path):
+    """Whole file as one float32 (frames, CHANNELS) array; meant for short sounds"""
+    blocks = list(iter_pcm_blocks(path))
+    if not blocks:
+        return np.zeros((0, CHANNELS), dtype=np.float32)
+    return np.concatenate(blocks)
+
+def allocate_pcm(frames, work_dir, name):
+    """Zeroed float32 (frames, CHANNELS) buffer, memory-mapped under work_dir when large"""
+    if frames * CHANNELS * 4 > MEMMAP_THRESHOLD_BYTES:
+        return np.lib.format.open_memmap(
+            os.path.join(work_dir, f'{name}.npy'), mode='w+', dtype=np.float32, shape=(frames, CHANNELS)
+        )
+    return np.zeros((frames, CHANNELS), dtype=np.float32)
+
+class AudioBus:
+    """The whole timeline's audio, summed in place into one float32 buffer.
+
+    Sources are streamed in at their timeline offsets block by block, so
+    apart from the bus itself memory stays constant, and write_wav() hands
+    the encoder a single finished PCM track.
+
+    Sources added with sidechain=True (the narration) also feed a coarse
+    energy track that duck_envelope() turns into a gain curve for music.
+    """
+
+    def __init__(self, duration, work_dir, name='audio_bus'):
+        self.frames = int(round(duration * SAMPLE_RATE))
+        self.work_dir = work_dir
+        self.buffer = allocate_pcm(self.frames, work_dir, name)
+        self.sidechain = np.zeros(self.frames // DUCK_BLOCK_FRAMES + 1)
+
+    def add(self, samples, offset, gain=1.0, envelope=None):
+        """Sum samples into the bus starting at frame `offset` (anything past the end is dropped).
+
+        envelope is an optional per-DUCK_BLOCK_FRAMES gain curve over the
+        whole bus (see duck_envelope), interpolated to the samples added.
+        """
+        if offset < 0:
+            samples = samples[-offset:]
+            offset = 0
+        end = min(offset + len(samples), self.frames)
+        if end <= offset:
+            return
+        samples = samples[:end - offset]
+        if envelope is not None:
+            positions = np.arange(offset, end) / DUCK_BLOCK_FRAMES - 0.5
+            gains = np.interp(positions, np.arange(len(envelope)), envelope).astype(np.float32)
+            self.buffer[offset:end] += samples * (gain * gains)[:, None]
+        elif gain == 1.0:
+            self.buffer[offset:end] += samples
+        else:
+            self.buffer[offset:end] += gain * samples
+
+    def feed_sidechain(self, samples, offset):
+        """Accumulate the energy of samples placed at `offset` per envelope block"""
+        end = min(offset + len(samples), self.frames)
+        if end <= offset:
+            return
+        energy = np.mean(np.square(samples[:end - offset], dtype=np.float64), axis=1)
+        first = offset // DUCK_BLOCK_FRAMES
+        blocks = np.arange(offset, end) // DUCK_BLOCK_FRAMES - first
+        sums = np.bincount(blocks, weights=energy)
+        self.sidechain[first:first + len(sums)] += sums
+
+    def add_file(self, path, start, gain=1.0, sidechain=False):
+        """Stream a whole file into the bus at `start` seconds"""
+        offset = int(round(start * SAMPLE_RATE))
+        for block in iter_pcm_blocks(path):
+            if offset >= self.frames:
+                break
+            self.add(block, offset, gain)
+            if sidechain:
+                self.feed_sidechain(block, offset)
+            offset += len(block)
+
+    def add_repeated(self, samples, starts, gain=1.0):
+        """Add one decoded sound at each of `starts` (seconds)"""
+        for start in starts:
+            self.add(samples, int(round(start * SAMPLE_RATE)), gain)
+
+    def duck_envelope(self, depth_db, threshold_db=DUCK_THRESHOLD_DB, hold=DUCK_HOLD_SECONDS,
+                      ramp=DUCK_RAMP_SECONDS):
+        """Gain per envelope block: -depth_db wherever the sidechain is active, 1.0 elsewhere.
+
+        The sidechain is averaged over DUCK_DETECT_SECONDS before the
+        threshold, activity is held for `hold` seconds so pauses between
+        words don't pump the music, and the steps are smoothed into
+        `ramp`-second fades. Whole-array NumPy on 20 values per second.
+        """
+        block_seconds = DUCK_BLOCK_FRAMES / SAMPLE_RATE
+        detect_blocks = max(1, int(round(DUCK_DETECT_SECONDS / block_seconds)))
+        energy = np.convolve(self.sidechain / DUCK_BLOCK_FRAMES, np.ones(detect_blocks) / detect_blocks, mode='same')
+        level_db = 10 * np.log10(energy + 1e-12)
+        active = (level_db > threshold_db).astype(np.float64)
+
+        hold_blocks = max(1, int(round(hold / block_seconds)))
+        held = np.convolve(active, np.ones(hold_blocks), mode='full')[:len(active)] > 0
+        target = np.where(held, 10 ** (-depth_db / 20), 1.0)
+
+        ramp_blocks = max(1, int(round(ramp / block_seconds)))
+        padded = np.pad(target, (ramp_blocks // 2, ramp_blocks - 1 - ramp_blocks // 2), mode='edge')
+        return np.convolve(padded, np.ones(ramp_blocks) / ramp_blocks, mode='valid')
+
+    def add_looped(self, tracks, envelope=None):
+        """Play (path, gain, duration) tracks back to back, looping them to fill the bus.
+
+        A playlist at least as long as the bus is streamed straight in.
+        A shorter one is decoded once into its own buffer and tiled. The
+        optional envelope (see duck_envelope) is applied in bus time.
+        """
+        playlist_frames = sum(int(round(duration * SAMPLE_RATE)) for _, _, duration in tracks)
+        if playlist_frames >= self.frames:
+            offset = 0
+            for path, gain, _ in tracks:
+                for block in iter_pcm_blocks(path):
+                    if offset >= self.frames:
+                        break
+                    self.add(block, offset, gain, envelope)
+                    offset += len(block)
+                if offset >= self.frames:
+                    break
+            return
+
+        loop_bus = AudioBus(playlist_frames / SAMPLE_RATE, self.work_dir, name='audio_loop')
+        offset = 0
+        for path, gain, _ in tracks:
+            for block in iter_pcm_blocks(path):
+                if offset >= loop_bus.frames:
+                    break
+                loop_bus.add(block, offset, gain)
+                offset += len(block)
+        loop = loop_bus.buffer[:min(offset, loop_bus.frames)]
+        if len(loop) == 0:
+            return
+        for loop_offset in range(0, self.frames, len(loop)):
+            for i in range(0, len(loop), BLOCK_FRAMES):
+                self.add(loop[i:i + BLOCK_FRAMES], loop_offset + i, envelope=envelope)
+
+    def write_wav(self, path):
+        """Write the mix as 16-bit PCM WAV, one block at a time"""
+        with wave.open(path, 'wb') as wav:
+            wav.setnchannels(CHANNELS)
+            wav.setsampwidth(2)
+            wav.setframerate(SAMPLE_RATE)
+            for i in range(0, self.frames, BLOCK_FRAMES):
+                block = np.clip(self.buffer[i:i + BLOCK_FRAMES], -1.0, 1.0)
+                wav.writeframes((block * 32767).astype('<i2').tobytes())
+        return path
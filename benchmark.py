@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the join pipeline (transition.py) on synthetic clips.
+
+Generates question-N.mp4 test-pattern clips with tone audio (30 fps, 14 s,
+1920x1080 and 1080x1920), a luma matte, a transition SFX and background
+music under .cache/benchmark, then times join_multiple_videos for each
+combination of clip count, size, background music and --live. Every case
+runs in its own process so peak memory is measured per case.
+
+Results (frames/s, wall/CPU time, peak RSS, output size) are saved as JSON,
+tagged with the git commit, so runs of different commits can be compared:
+
+    python benchmark.py                              # full matrix
+    python benchmark.py --counts 5,20 --sizes 1920x1080 --music off --live off
+    python benchmark.py --compare benchmarks/<earlier run>.json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import subprocess
+from datetime import datetime
+from moviepy.config import FFMPEG_BINARY
+import run_log
+
+BENCH_DIR = os.path.join(os.getenv('QUIZ_CACHE_DIR', '.cache'), 'benchmark')
+RESULTS_DIR = "benchmarks"
+FPS = 30
+CLIP_SECONDS = 14
+MATTE_SECONDS = 1.33
+SFX_SECONDS = 0.7
+MUSIC_SECONDS = 60  # shorter than most timelines, so the playlist loop is exercised
+DEFAULT_COUNTS = (5, 20, 50, 100)
+DEFAULT_SIZES = ((1920, 1080), (1080, 1920))
+
+def ffmpeg(*args):
+    subprocess.run([FFMPEG_BINARY, '-y', '-v', 'error', *args], check=True)
+
+def make_clip(path, size, index):
+    """Moving test pattern (hue shifted per clip so every clip hashes differently) with a tone"""
+    w, h = size
+    tmp_path = f"{path}.tmp.mp4"
+    ffmpeg(
+        '-f', 'lavfi', '-i', f'testsrc2=s={w}x{h}:r={FPS}:d={CLIP_SECONDS},hue=h={index * 37 % 360}',
+        '-f', 'lavfi', '-i', f'sine=f={300 + index * 7 % 400}:d={CLIP_SECONDS}:sample_rate=44100',
+        # Same stream layout as the Remotion renders (h264/yuv420p, 1 s GOP, AAC)
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-pix_fmt', 'yuv420p', '-g', str(FPS),
+        '-c:a', 'aac', '-shortest', tmp_path
+    )
+    os.replace(tmp_path, path)
+
+def make_assets(sizes, max_count):
+    """Create (or reuse) the synthetic clips, matte, SFX and music; returns their paths"""
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    assets = {
+        'matte': os.path.join(BENCH_DIR, 'luma.mp4'),
+        'sfx': os.path.join(BENCH_DIR, 'transition-audio.m4a'),
+        'music': os.path.join(BENCH_DIR, 'bg-music.m4a'),
+        'clips': {},
+    }
+
+    if not os.path.exists(assets['matte']):
+        print("🎨 Generating luma matte...")
+        # White disc growing to cover the frame and shrinking again
+        ffmpeg(
+            '-f', 'lavfi', '-i', f'color=c=black:s=1920x1080:r={FPS}:d={MATTE_SECONDS},format=gray',
+            '-vf', f"geq=lum='255*lt(hypot(X-W/2,Y-H/2),1.3*W*sin(PI*T/{MATTE_SECONDS}))'",
+            '-c:v', 'libx264', '-preset', 'ultrafast', '-pix_fmt', 'yuv420p', assets['matte']
+        )
+    if not os.path.exists(assets['sfx']):
+        ffmpeg('-f', 'lavfi', '-i', f'sine=f=880:d={SFX_SECONDS}', '-c:a', 'aac', assets['sfx'])
+    if not os.path.exists(assets['music']):
+        ffmpeg(
+            '-f', 'lavfi', '-i', f'sine=f=220:d={MUSIC_SECONDS}',
+            '-f', 'lavfi', '-i', f'sine=f=277:d={MUSIC_SECONDS}',
+            '-filter_complex', 'amix=inputs=2', '-ac', '2', '-c:a', 'aac', assets['music']
+        )
+
+    for w, h in sizes:
+        clip_dir = os.path.join(BENCH_DIR, f'clips_{w}x{h}')
+        os.makedirs(clip_dir, exist_ok=True)
+        paths = []
+        for i in range(1, max_count + 1):
+            path = os.path.join(clip_dir, f'question-{i}.mp4')
+            if not os.path.exists(path):
+                print(f"🎞️  Generating {w}x{h} clip {i}/{max_count}", end='\r')
+                make_clip(path, (w, h), i)
+            paths.append(path)
+        print()
+        assets['clips'][(w, h)] = paths
+    return assets
+
+def case_folder(clip_paths, size, count, work_dir):
+    """Folder holding links to the first `count` clips (join picks up every question-N.mp4)"""
+    folder = os.path.join(work_dir, f'clips_{size[0]}x{size[1]}_{count}')
+    os.makedirs(folder, exist_ok=True)
+    for path in clip_paths[:count]:
+        os.symlink(os.path.abspath(path), os.path.join(folder, os.path.basename(path)))
+    return folder
+
+def probe_duration(path):
+    result = subprocess.run(
+        [os.getenv('FFPROBE_BINARY', 'ffprobe'), '-v', 'error', '-show_entries', 'format=duration',
+         '-of', 'json', path],
+        check=True, capture_output=True, text=True
+    )
+    return float(json.loads(result.stdout)['format']['duration'])
+
+def git_revision():
+    """Commit the benchmark ran on (with -dirty for uncommitted changes)"""
+    try:
+        result = subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True, text=True, check=True)
+        return result.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_case(case):
+    """Child process entry point: one join_multiple_videos call; returns the output path, None if it failed"""
+    from transition import join_multiple_videos
+    return join_multiple_videos(
+        case['folder'], case['matte'], case['output'],
+        bg_music_paths=[case['music_path']] if case['music_path'] else None,
+        transition_audio_path=case['sfx'],
+        is_short=case['is_short'],
+        is_live=case['live'],
+        mode=case['mode'],
+        workers=case['workers'],
+        # Every run renders from scratch, so runs (and commits) stay comparable
+        segment_cache=False
+    )
+
+def measure_case(case, log_path):
+    """Run a case in a child process; returns its result entry"""
+    case_log = f"{log_path}.{case['name']}"
+    env = dict(os.environ, **{run_log.RUN_LOG_ENV: case_log, run_log.RUN_ID_ENV: case['name']})
+    cmd = [sys.executable, os.path.abspath(__file__), '--run-case', json.dumps(case)]
+
+    start = time.time()
+    with open(log_path, 'a') as log:
+        log.write(f"\n===== {case['name']} =====\n")
+        log.flush()
+        returncode, usage = run_log.wait_measured(subprocess.Popen(cmd, env=env, stdout=log, stderr=subprocess.STDOUT))
+    wall = time.time() - start
+
+    result = {'name': case['name'], **{key: case[key] for key in ('count', 'size', 'music', 'live', 'mode')}}
+    result.update({'ok': returncode == 0, 'wall_s': round(wall, 3), **usage})
+    if result['ok']:
+        try:
+            frames = round(probe_duration(case['output']) * FPS)
+        except (subprocess.CalledProcessError, ValueError, KeyError):
+            # The join exited cleanly but left no readable video
+            result['ok'] = False
+    if not result['ok']:
+        if os.path.exists(case_log):
+            os.remove(case_log)
+        return result
+
+    encoded = sum(e.get('frames', 0) for e in run_log.load_events(case_log) if e['event'] == 'encode')
+    result.update({
+        'frames': frames,
+        'encoded_frames': encoded,
+        'fps': round(frames / wall, 2),
+        'output_bytes': os.path.getsize(case['output']),
+    })
+    os.remove(case_log)
+    return result
+
+def print_results(results, baseline=None):
+    baseline = {r['name']: r for r in (baseline or {}).get('results', []) if r.get('ok')}
+    header = f"{'Case':<34}{'Wall':>9}{'fps':>9}{'CPU':>9}{'Peak RSS':>11}{'Output':>11}"
+    print("\n" + header + (f"{'vs base':>10}" if baseline else ""))
+    for r in results:
+        if not r['ok']:
+            print(f"{r['name']:<34}{'FAILED':>9}")
+            continue
+        row = (f"{r['name']:<34}{r['wall_s']:>8.1f}s{r['fps']:>9.1f}{r.get('cpu_s', 0):>8.1f}s"
+               f"{r.get('peak_rss_bytes', 0) / 2**20:>8.0f} MB{r['output_bytes'] / 2**20:>8.1f} MB")
+        if r['name'] in baseline:
+            row += f"{baseline[r['name']]['wall_s'] / r['wall_s']:>9.2f}x"
+        print(row)
+
+def parse_size(text):
+    w, h = text.lower().split('x')
+    return int(w), int(h)
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Benchmark transition.py joins on synthetic clips')
+    parser.add_argument('--counts', default=','.join(map(str, DEFAULT_COUNTS)), help='Comma separated clip counts (default: 5,20,50,100)')
+    parser.add_argument('--sizes', default=','.join(f'{w}x{h}' for w, h in DEFAULT_SIZES), help='Comma separated WxH sizes (default: 1920x1080,1080x1920)')
+    parser.add_argument('--music', choices=['off', 'on', 'both'], default='both', help='Background music (default: both)')
+    parser.add_argument('--live', choices=['off', 'on', 'both'], default='both', help='--live encoding (default: both)')
+    parser.add_argument('--mode', choices=['full', 'segment', 'parallel'], default='full', help='Join mode (default: full)')
+    parser.add_argument('--workers', type=int, help='Worker processes for segment/parallel modes')
+    parser.add_argument('--output', help=f'Results JSON (default: {RESULTS_DIR}/<time>_<commit>.json)')
+    parser.add_argument('--compare', metavar='RESULTS', help='Earlier results JSON to show speedups against')
+    parser.add_argument('--run-case', help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    if args.run_case:
+        # join_multiple_videos reports most failures by returning None
+        return 0 if run_case(json.loads(args.run_case)) else 1
+
+    counts = sorted(int(n) for n in args.counts.split(','))
+    sizes = [parse_size(size) for size in args.sizes.split(',')]
+    switches = {'off': [False], 'on': [True], 'both': [False, True]}
+
+    assets = make_assets(sizes, max(counts))
+    revision = git_revision()
+    started_at = datetime.now()
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{started_at:%Y%m%d-%H%M%S}_{revision or 'unknown'}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    log_path = os.path.splitext(output)[0] + '.log'
+
+    report = {
+        'revision': revision,
+        'started_at': started_at.isoformat(timespec='seconds'),
+        'host': platform.node(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'python': platform.python_version(),
+        'settings': {'fps': FPS, 'clip_seconds': CLIP_SECONDS, 'mode': args.mode, 'workers': args.workers},
+        'results': [],
+    }
+    results = report['results']
+
+    work_dir = os.path.join(BENCH_DIR, f'run_{os.getpid()}')
+    try:
+        for w, h in sizes:
+            for count in counts:
+                folder = case_folder(assets['clips'][(w, h)], (w, h), count, work_dir)
+                for music in switches[args.music]:
+                    for live in switches[args.live]:
+                        name = f"{count}x{w}x{h}" + ("_music" if music else "") + ("_live" if live else "")
+                        case = {
+                            'name': name, 'count': count, 'size': [w, h], 'music': music, 'live': live,
+                            'mode': args.mode, 'workers': args.workers,
+                            'folder': folder, 'matte': assets['matte'], 'sfx': assets['sfx'],
+                            'music_path': assets['music'] if music else None,
+                            'is_short': h > w,
+                            'output': os.path.join(work_dir, f'{name}.mp4'),
+                        }
+                        print(f"⏱️  {name} ...", end=' ', flush=True)
+                        result = measure_case(case, log_path)
+                        results.append(result)
+                        if result['ok']:
+                            print(f"{result['wall_s']:.1f}s ({result['fps']:.1f} frames/s)")
+                            os.remove(case['output'])
+                        else:
+                            print(f"FAILED (see {log_path})")
+                        # Saved after every case so an interrupted run keeps what it measured
+                        with open(output, 'w') as f:
+                            json.dump(report, f, indent=2)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    print(f"\n💾 Results saved to: {output}")
+    return 0 if all(r['ok'] for r in results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
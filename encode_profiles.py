@@ -0,0 +1,227 @@
+"""
+Named x264 encode profiles for the joined video.
+
+Each profile picks the x264 preset, rate control (CRF, or a capped bitrate
+for live), tune and keyframe interval for one kind of output; the thread
+count always follows os.cpu_count(). transition.py picks shorts, long-form
+or live from the output format unless --encode-profile names one.
+
+A faster preset encodes sooner but writes a bigger file that takes longer to
+upload. `python encode_profiles.py --upload-mbps 20` encodes a sample clip
+with every candidate preset on this machine, picks the one with the lowest
+encode + upload time per minute of video and saves it in
+CACHE_DIR/encode_calibration.json, where the profile picks it up from then on.
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime
+
+CACHE_DIR = os.getenv('QUIZ_CACHE_DIR', '.cache')
+CALIBRATION_PATH = os.path.join(CACHE_DIR, 'encode_calibration.json')
+
+PROFILES = {
+    'shorts': {
+        'description': 'Vertical Shorts/Reels: short, watched on phones',
+        'preset': 'faster',
+        'crf': 20,
+    },
+    'long-form': {
+        'description': 'Horizontal YouTube/Facebook video',
+        'preset': 'veryfast',
+        'crf': 21,
+    },
+    'live': {
+        'description': 'YouTube Live ingest: 4500 kbps, 2 s fixed GOP, no lookahead',
+        'preset': 'veryfast',
+        'tune': 'zerolatency',
+        'bitrate': '4500k',
+        'maxrate': '4500k',
+        'bufsize': '9000k',    # 2x bitrate
+        'gop_seconds': 2,
+    },
+    'archive': {
+        'description': 'Master copy: small and close to the source, slow to encode',
+        'preset': 'slow',
+        'crf': 17,
+    },
+}
+
+# Presets tried by calibration, fastest first
+CALIBRATION_PRESETS = ['ultrafast', 'superfast', 'veryfast', 'faster', 'fast', 'medium', 'slow']
+CALIBRATION_SECONDS = 20
+
+def cpu_threads():
+    return os.cpu_count() or 1
+
+def default_profile(is_short=False, is_live=False):
+    """Profile name for an output format"""
+    if is_live:
+        return 'live'
+    return 'shorts' if is_short else 'long-form'
+
+def load_calibration():
+    try:
+        with open(CALIBRATION_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def get_profile(name, use_calibration=True):
+    """Settings of profile `name`, with this machine's thread count and calibrated preset"""
+    if name not in PROFILES:
+        raise ValueError(f"Unknown encode profile '{name}' (choose from {', '.join(PROFILES)})")
+    profile = dict(PROFILES[name], name=name, threads=cpu_threads(), calibrated=False)
+
+    calibration = load_calibration().get(name) if use_calibration else None
+    # A preset measured on other hardware says nothing about this one
+    if calibration and calibration.get('host') == socket.gethostname() \
+            and calibration.get('cpu_count') == cpu_threads():
+        profile['preset'] = calibration['preset']
+        profile['calibrated'] = True
+    return profile
+
+def ffmpeg_args(profile, fps):
+    """x264 rate control, tune and GOP arguments (preset and threads are passed separately)"""
+    args = ['-pix_fmt', 'yuv420p', '-profile:v', 'high']
+    if profile.get('crf') is not None:
+        args.extend(['-crf', str(profile['crf'])])
+    if profile.get('bitrate'):
+        args.extend(['-b:v', profile['bitrate']])
+    if profile.get('maxrate'):
+        args.extend(['-maxrate', profile['maxrate'], '-bufsize', profile['bufsize']])
+    if profile.get('tune'):
+        args.extend(['-tune', profile['tune']])
+    if profile.get('gop_seconds'):
+        gop = str(round(profile['gop_seconds'] * fps))
+        # Fixed keyframe interval, no extra keyframes on scene cuts
+        args.extend(['-g', gop, '-keyint_min', gop, '-sc_threshold', '0'])
+    return args
+
+def describe(profile):
+    """One line summary for the render log"""
+    rate = f"CRF {profile['crf']}" if profile.get('crf') is not None else f"{profile['bitrate']}bps"
+    source = "calibrated" if profile['calibrated'] else "default"
+    return (f"🎛️  Encode profile: {profile['name']} (x264 {profile['preset']} [{source}], {rate}"
+            f"{', tune ' + profile['tune'] if profile.get('tune') else ''}, {profile['threads']} thread(s))")
+
+# ==================== CALIBRATION ====================
+
+def find_sample_clip():
+    """A rendered question clip from the most recent quiz in out/, if any"""
+    if not os.path.isdir('out'):
+        return None
+    folders = sorted(
+        (os.path.join('out', name) for name in os.listdir('out')),
+        key=lambda path: os.path.getmtime(path), reverse=True
+    )
+    for folder in folders:
+        sample = os.path.join(folder, 'question-1.mp4')
+        if os.path.exists(sample):
+            return sample
+    return None
+
+def encode_sample(input_args, preset, profile, fps, seconds, output_path):
+    """Encode `seconds` of the sample with one preset; returns (wall seconds, output bytes)"""
+    from moviepy.config import FFMPEG_BINARY
+    cmd = [FFMPEG_BINARY, '-y', '-v', 'error', *input_args, '-t', str(seconds), '-an',
+           '-c:v', 'libx264', '-preset', preset, '-threads', str(profile['threads']),
+           *ffmpeg_args(profile, fps), output_path]
+    start = time.time()
+    subprocess.run(cmd, check=True)
+    return time.time() - start, os.path.getsize(output_path)
+
+def calibrate(name, upload_mbps, sample=None, seconds=CALIBRATION_SECONDS, presets=CALIBRATION_PRESETS, save=True):
+    """Pick the preset with the lowest encode + upload time per minute of video.
+
+    Every preset encodes the same `seconds` of the sample (looped if it is
+    shorter) with the profile's rate control and this machine's threads.
+    Decoding the sample costs the same for every preset, so it does not
+    change the ranking. Returns the result record (also saved unless save=False).
+    """
+    profile = get_profile(name, use_calibration=False)
+    if profile.get('crf') is None:
+        raise ValueError(f"'{name}' encodes at a fixed bitrate, so the preset does not change upload time")
+
+    sample = sample or find_sample_clip()
+    if sample:
+        import media_probe
+        fps = media_probe.probe_clip(sample)['fps']
+        input_args = ['-stream_loop', '-1', '-i', sample]
+        print(f"📏 Calibrating '{name}' on {sample} ({seconds}s, {profile['threads']} thread(s), {upload_mbps:g} Mbps upload)")
+    else:
+        # Synthetic motion is a rough stand-in for rendered quiz frames
+        fps = 30
+        size = '1080x1920' if name == 'shorts' else '1920x1080'
+        input_args = ['-f', 'lavfi', '-i', f'testsrc2=size={size}:rate={fps}']
+        print(f"📏 No rendered clip found, calibrating '{name}' on a synthetic {size} test pattern")
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix='calibrate_') as work_dir:
+        for preset in presets:
+            print(f"  Encoding with {preset}...", end='\r')
+            wall, size_bytes = encode_sample(
+                input_args, preset, profile, fps, seconds, os.path.join(work_dir, f'{preset}.mp4')
+            )
+            per_minute = 60 / seconds
+            encode_s = wall * per_minute
+            upload_s = size_bytes * 8 / (upload_mbps * 1e6) * per_minute
+            results.append({
+                'preset': preset,
+                'encode_fps': round(seconds * fps / wall, 1),
+                'mb_per_minute': round(size_bytes * per_minute / 1e6, 2),
+                'encode_s_per_minute': round(encode_s, 2),
+                'upload_s_per_minute': round(upload_s, 2),
+                'total_s_per_minute': round(encode_s + upload_s, 2),
+            })
+
+    best = min(results, key=lambda r: r['total_s_per_minute'])
+    print(f"\n{'Preset':<12}{'Encode fps':>12}{'MB/min':>10}{'Encode s/min':>14}{'Upload s/min':>14}{'Total s/min':>13}")
+    for r in results:
+        print(f"{r['preset']:<12}{r['encode_fps']:>12.1f}{r['mb_per_minute']:>10.1f}{r['encode_s_per_minute']:>14.1f}"
+              f"{r['upload_s_per_minute']:>14.1f}{r['total_s_per_minute']:>13.1f}"
+              + ("  ◀ best" if r is best else ""))
+
+    record = {
+        'preset': best['preset'],
+        'upload_mbps': upload_mbps,
+        'host': socket.gethostname(),
+        'cpu_count': cpu_threads(),
+        'sample': sample,
+        'calibrated_at': datetime.now().isoformat(timespec='seconds'),
+        'results': results,
+    }
+    if save:
+        calibration = load_calibration()
+        calibration[name] = record
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = f"{CALIBRATION_PATH}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(calibration, f, indent=2)
+        os.replace(tmp_path, CALIBRATION_PATH)
+        print(f"\n✅ '{name}' will encode with {best['preset']} on this machine (saved to {CALIBRATION_PATH})")
+    return record
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Pick the x264 preset that minimizes encode + upload time on this machine')
+    parser.add_argument('--upload-mbps', type=float, required=True, help='Upload bandwidth to optimize for, in Mbit/s')
+    parser.add_argument('--encode-profile', choices=[name for name, p in PROFILES.items() if p.get('crf') is not None],
+                        default='long-form', help='Profile to calibrate (default: long-form)')
+    parser.add_argument('--sample', help='Clip to encode (default: question-1.mp4 of the latest quiz in out/)')
+    parser.add_argument('--seconds', type=int, default=CALIBRATION_SECONDS, help=f'Seconds of video per preset (default: {CALIBRATION_SECONDS})')
+    parser.add_argument('--presets', nargs='+', default=CALIBRATION_PRESETS, help='x264 presets to try')
+    parser.add_argument('--dry-run', action='store_true', help='Print the results without saving the pick')
+    args = parser.parse_args()
+
+    try:
+        calibrate(args.encode_profile, args.upload_mbps, sample=args.sample, seconds=args.seconds,
+                  presets=args.presets, save=not args.dry_run)
+    except (ValueError, subprocess.CalledProcessError) as e:
+        print(f"❌ Calibration failed: {e}")
+        sys.exit(1)
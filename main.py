@@ -7,11 +7,19 @@ Orchestrates the entire pipeline: render → transition → publish
 import os
 import sys
 import subprocess
+import re
 import json
 import argparse
 from pathlib import Path
 from dotenv import load_dotenv
 import readline  # For better input experience
+import time
+import atexit
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pipeline_state import PipelineState, PIPELINE_STATE_NAME, PIPELINE_STAGES, render_artifacts, video_artifact, \
+    published_platforms, DONE_SUFFIX, mark_written, clear_write_markers
+import run_log
+import encode_profiles
 
 # Load environment variables
 load_dotenv()
@@ -35,24 +43,24 @@ def yes_no_prompt(question, default=True):
         return default
     return response in ['y', 'yes']
 
-def run_command(cmd, description, cwd=None):
-    """Run a shell command and handle errors"""
+def run_command(cmd, description, stage, quiz=None, cwd=None):
+    """Run a shell command and handle errors (timed into the run log as `stage`)"""
     print(f"\n{'='*60}")
     print(f"📍 {description}")
     print(f"{'='*60}")
     print(f"Command: {' '.join(cmd)}\n")
     
     try:
-        result = subprocess.run(cmd, cwd=cwd, check=True, text=True, capture_output=False)
-        print(f"\n✅ {description} - Complete!")
-        return True
-    except subprocess.CalledProcessError as e:
-        print(f"\n❌ {description} - Failed!")
-        print(f"Error code: {e.returncode}")
-        return False
+        returncode = run_log.run_measured(cmd, stage, quiz=quiz, cwd=cwd)
     except FileNotFoundError:
         print(f"\n❌ Command not found: {cmd[0]}")
         return False
+    if returncode != 0:
+        print(f"\n❌ {description} - Failed!")
+        print(f"Error code: {returncode}")
+        return False
+    print(f"\n✅ {description} - Complete!")
+    return True
 
 def get_latest_quiz_folder():
     """Find the most recently created quiz folder"""
@@ -68,6 +76,358 @@ def get_latest_quiz_folder():
     latest = max(quiz_folders, key=lambda f: f.stat().st_mtime)
     return str(latest)
 
+def report_render_manifest(quiz_folder):
+    """Print how many clips the last render reused vs rebuilt (from render-manifest.json)"""
+    manifest_path = Path(quiz_folder) / "render-manifest.json"
+    try:
+        with open(manifest_path) as f:
+            last_run = json.load(f).get("lastRun", {})
+    except (OSError, ValueError):
+        return
+    print(f"♻️  Clips: {last_run.get('reused', 0)} reused, {last_run.get('rendered', 0)} rebuilt")
+
+def quiz_folder_name(name):
+    """Folder name render.mjs uses for a quiz name"""
+    return re.sub(r'\s+', '-', name.strip().lower())
+
+def default_title(quiz_name):
+    """Title for a quiz that has none, e.g. World Capitals Quiz for world-capitals"""
+    name = quiz_name.strip()
+    if name == name.lower():
+        name = name.replace('-', ' ').replace('_', ' ').title()
+    return name if name.lower().endswith('quiz') else f"{name} Quiz"
+
+def python_command():
+    """Python interpreter for the pipeline scripts (project venv if present)"""
+    return ".venv/bin/python" if os.path.exists(".venv/bin/python") else "python3"
+
+def build_render_cmd(args, quiz_name=None):
+    """render.mjs command line for the given options"""
+    cmd = ["node", "render.mjs"]
+    if args.short:
+        cmd.append("--short")
+    if args.vertical:
+        cmd.append("--vertical")
+    if args.long:
+        cmd.append("--long")
+    if args.comp:
+        cmd.extend(["--comp", args.comp])
+    if args.no_asset_cache:
+        cmd.append("--no-cache")
+    if args.force_render:
+        cmd.append("--force")
+    if args.render_workers:
+        cmd.extend(["--workers", str(args.render_workers)])
+    if quiz_name:
+        cmd.extend(["--name", quiz_name])
+    if args.api_url:
+        cmd.append(args.api_url)
+    return cmd
+
+def build_join_cmd(args, quiz_folder, output_name):
+    """transition.py command line for the given options"""
+    cmd = [python_command(), "transition.py", quiz_folder, output_name]
+    if args.short or args.vertical:
+        cmd.append("--short")
+    if args.long:
+        cmd.append("--long")
+    if args.live:
+        cmd.append("--live")
+    if args.intro:
+        cmd.extend(["--intro", args.intro])
+    if args.outro:
+        cmd.extend(["--outro", args.outro])
+    if args.join_mode != 'full':
+        cmd.extend(["--mode", args.join_mode])
+    if args.join_workers:
+        cmd.extend(["--workers", str(args.join_workers)])
+    if args.no_segment_cache:
+        cmd.append("--no-segment-cache")
+    if args.duck_db is not None:
+        cmd.extend(["--duck-db", str(args.duck_db)])
+    if args.encode_profile:
+        cmd.extend(["--encode-profile", args.encode_profile])
+    return cmd
+
+def build_publish_cmd(args, video_path, title, description, youtube, facebook):
+    """publish.py command line for the given options"""
+    cmd = [python_command(), "publish.py", video_path]
+    if youtube:
+        cmd.append("--youtube")
+    if facebook:
+        cmd.append("--facebook")
+    if args.short or args.vertical:
+        cmd.append("--short")
+    if args.long:
+        cmd.append("--long")
+    cmd.extend(["--title", title, "--description", description])
+    return cmd
+
+def planned_stages(args, should_render, interactive):
+    """Stages a run will go through (interactive runs add each one when it is chosen)"""
+    if interactive:
+        return ['render'] if should_render else []
+    return [stage for stage, wanted in (
+        ('render', should_render),
+        ('join', args.join and not args.skip_join),
+        ('publish', args.publish and not args.skip_publish),
+    ) if wanted]
+
+def record_plan(state, args, quiz_name, quiz_folder, stages):
+    """Save the planned stages and everything needed to run them in the quiz's state.
+
+    --resume runs every planned stage that is not complete, so the publish
+    stage must be known (with its video, title and platforms) before an
+    earlier stage can crash. Interactive runs overwrite these when asked.
+    """
+    joined = args.join and not args.skip_join
+    state.set_options(args)
+    state.options.update(
+        quiz_name=quiz_name,
+        quiz_folder=quiz_folder,
+        output=(args.output if joined else args.video_path) or f"final_{quiz_name}.mp4",
+        title=args.title or default_title(quiz_name),
+        description=args.description or "Test your knowledge with this quiz!",
+        # Non-interactive runs publish to both platforms unless one is named
+        youtube=args.youtube or not args.facebook,
+        facebook=args.facebook or not args.youtube,
+    )
+    state.plan(stages)
+    state.save()
+
+def run_stage(job, stage, state, run):
+    """Run one pipeline stage of a quiz and record the outcome in its PipelineState.
+
+    job carries the command line options plus quiz_name, quiz_folder, output,
+    title, description, youtube and facebook. run(cmd, description, stage, quiz) executes
+    a command (timed into the run log as stage of quiz) and returns True on success. Platforms the quiz was already
+    published to are not uploaded again.
+    """
+    state.set_options(job)
+    if stage == 'render':
+        state.begin('render')
+        ok = run(build_render_cmd(job, quiz_name=job.quiz_name), "Rendering question videos", 'render', job.quiz_name)
+        state.finish('render', ok, clips=render_artifacts(job.quiz_folder) if ok else {})
+    elif stage == 'join':
+        state.begin('join', output=job.output)
+        ok = run(build_join_cmd(job, job.quiz_folder, job.output), "Joining videos with transitions", 'join', job.quiz_name)
+        state.finish('join', ok, **(video_artifact(job.output) if ok else {}))
+    else:
+        published = state.published()
+        youtube = job.youtube and 'youtube' not in published
+        facebook = job.facebook and 'facebook' not in published
+        started = state.begin('publish', video=job.output)
+        if youtube or facebook:
+            cmd = build_publish_cmd(job, job.output, job.title, job.description, youtube, facebook)
+            run(cmd, "Publishing video to platforms", 'publish', job.quiz_name)
+            state.record_published(published_platforms(job.output, since=started))
+        published = state.published()
+        ok = (not job.youtube or 'youtube' in published) and (not job.facebook or 'facebook' in published)
+        state.finish('publish', ok)
+    return ok
+
+def resume_pipeline(args):
+    """Continue a quiz from its pipeline_state.json. Returns an exit code."""
+    quiz_folder = os.path.join("out", quiz_folder_name(args.resume))
+    state = PipelineState.load(quiz_folder)
+    if state is None:
+        print(f"❌ No {PIPELINE_STATE_NAME} in {quiz_folder}, nothing to resume")
+        return 1
+
+    job = argparse.Namespace(**{**vars(args), **state.options})
+    print(f"🔁 Resuming {job.quiz_name} ({' → '.join(state.stages)})")
+
+    # Once a stage is redone, everything after it is stale too
+    redo = False
+    for stage in list(state.stages):
+        if not redo and state.is_complete(stage):
+            print(f"⏭️  {stage}: already done")
+            continue
+        redo = True
+        if not run_stage(job, stage, state, run_command):
+            print(f"\n⚠️  {stage} did not complete. Run --resume {job.quiz_name} again to retry.")
+            return 1
+
+    print(f"\n🎉 {job.quiz_name}: all stages complete")
+    return 0
+
+# ==================== BATCH MODE ====================
+# main.py --batch manifest.json runs many quizzes through render -> join ->
+# publish. Each stage has its own worker pool and a quiz moves to the next
+# stage as soon as it finishes the current one, so quiz k+1 renders while
+# quiz k joins and quiz k-1 uploads.
+
+BATCH_STAGES = PIPELINE_STAGES
+
+# Manifest keys that map straight onto command line options
+BATCH_OPTION_KEYS = {
+    'source': 'api_url', 'api_url': 'api_url', 'comp': 'comp',
+    'short': 'short', 'vertical': 'vertical', 'long': 'long', 'live': 'live',
+    'intro': 'intro', 'outro': 'outro', 'join_mode': 'join_mode',
+    'duck_db': 'duck_db', 'encode_profile': 'encode_profile',
+    'description': 'description',
+}
+
+def load_batch_manifest(path, args):
+    """Read a batch manifest into one options namespace per quiz.
+
+    The manifest is a list of quizzes (or {"quizzes": [...]}), each with a
+    "name" plus optional "source" (API URL or JSON path), "comp", "short",
+    "vertical", "long", "live", "output", "publish" (list of "youtube" /
+    "facebook"), "title", "description", "render" and "join" (false to
+    reuse existing clips / video). Unset options fall back to the command line,
+    except the title: each quiz without one is titled after its own name.
+    """
+    with open(path) as f:
+        manifest = json.load(f)
+    entries = manifest.get('quizzes', []) if isinstance(manifest, dict) else manifest
+
+    jobs = []
+    for entry in entries:
+        if not entry.get('name'):
+            raise ValueError(f"Batch entry without a name: {entry}")
+        job = argparse.Namespace(**vars(args))
+        for key, option in BATCH_OPTION_KEYS.items():
+            if key in entry:
+                setattr(job, option, entry[key])
+
+        job.quiz_name = quiz_folder_name(entry['name'])
+        job.quiz_folder = os.path.join("out", job.quiz_name)
+        job.output = entry.get('output', f"final_{job.quiz_name}.mp4")
+        platforms = entry.get('publish', [])
+        job.youtube = 'youtube' in platforms
+        job.facebook = 'facebook' in platforms
+        job.title = entry.get('title') or default_title(entry['name'])
+        job.description = job.description or "Test your knowledge with this quiz!"
+
+        job.stages = [
+            stage for stage in BATCH_STAGES
+            if entry.get(stage, True) and (stage != 'publish' or job.youtube or job.facebook)
+        ]
+        if 'render' in job.stages and not job.api_url:
+            # render.mjs would otherwise prompt for the questions' source
+            raise ValueError(f"Batch entry '{entry['name']}' renders but has no \"source\" (and no --api-url given)")
+        # Fresh state per batch run, planned up front so each quiz can be
+        # finished later with --resume
+        job.state = PipelineState(job.quiz_folder)
+        job.state.set_options(job)
+        job.state.plan(job.stages)
+        jobs.append(job)
+    return jobs
+
+def run_batch_stage(job, stage):
+    """Run one stage of a batch quiz with its output in out/<quiz>/<stage>.log"""
+    os.makedirs(job.quiz_folder, exist_ok=True)
+    log_path = os.path.join(job.quiz_folder, f"{stage}.log")
+    start = time.time()
+    with open(log_path, 'w') as log:
+        def run(cmd, description, stage, quiz):
+            log.write(f"$ {' '.join(cmd)}\n\n")
+            log.flush()
+            try:
+                # stdin closed so a stray prompt fails the stage instead of hanging the batch
+                returncode = run_log.run_measured(cmd, stage, quiz=quiz, stdin=subprocess.DEVNULL,
+                                                  stdout=log, stderr=subprocess.STDOUT)
+            except FileNotFoundError:
+                log.write(f"Command not found: {cmd[0]}\n")
+                return False
+            return returncode == 0
+
+        ok = run_stage(job, stage, job.state, run)
+    return ok, time.time() - start, log_path
+
+def run_batch(args):
+    """Run every quiz in the batch manifest through the pipelined stages. Returns an exit code."""
+    try:
+        jobs = load_batch_manifest(args.batch, args)
+    except (OSError, ValueError) as e:
+        print(f"❌ Could not read batch manifest {args.batch}: {e}")
+        return 1
+    if not jobs:
+        print("⚠️  Batch manifest has no quizzes")
+        return 0
+    if args.title:
+        print("⚠️  --title is not used in batch mode, give each quiz a \"title\" in the manifest")
+
+    concurrency = {
+        'render': args.render_concurrency,
+        'join': args.join_concurrency,
+        'publish': args.publish_concurrency,
+    }
+    print(f"📦 Batch: {len(jobs)} quizzes | concurrency render={concurrency['render']}"
+          f" join={concurrency['join']} publish={concurrency['publish']}\n")
+
+    pools = {stage: ThreadPoolExecutor(max_workers=max(1, n)) for stage, n in concurrency.items()}
+    results = {job.quiz_name: {} for job in jobs}
+    pending = {}
+
+    def submit(job, stage_index):
+        stage = job.stages[stage_index]
+        print(f"▶️  [{job.quiz_name}] {stage} started")
+        pending[pools[stage].submit(run_batch_stage, job, stage)] = (job, stage_index)
+
+    batch_start = time.time()
+    try:
+        for job in jobs:
+            job.state.save()
+            if job.stages:
+                submit(job, 0)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                job, stage_index = pending.pop(future)
+                stage = job.stages[stage_index]
+                ok, elapsed, log_path = future.result()
+                results[job.quiz_name][stage] = (ok, elapsed)
+                if ok:
+                    print(f"✅ [{job.quiz_name}] {stage} done in {elapsed:.1f}s")
+                    if stage_index + 1 < len(job.stages):
+                        submit(job, stage_index + 1)
+                else:
+                    # Later stages of this quiz are skipped, the others carry on
+                    print(f"❌ [{job.quiz_name}] {stage} failed after {elapsed:.1f}s (see {log_path})")
+    finally:
+        for pool in pools.values():
+            pool.shutdown()
+
+    print("\n" + "=" * 60)
+    print(f"📦 BATCH COMPLETE in {time.time() - batch_start:.1f}s")
+    print("=" * 60)
+    print(f"{'Quiz':<30}" + "".join(f"{stage:>12}" for stage in BATCH_STAGES))
+    failed = False
+    for job in jobs:
+        row = f"{job.quiz_name:<30}"
+        for stage in BATCH_STAGES:
+            if stage not in job.stages:
+                cell = "-"
+            elif stage not in results[job.quiz_name]:
+                cell = "skipped"
+                failed = True
+            else:
+                ok, elapsed = results[job.quiz_name][stage]
+                cell = f"{elapsed:.0f}s" if ok else "FAILED"
+                failed = failed or not ok
+            row += f"{cell:>12}"
+        print(row)
+    return 1 if failed else 0
+
+def print_run_profile(run_id):
+    """Summary table of the stages this run logged (main.py --profile)"""
+    print("\n" + "=" * 60)
+    print(f"⏱️  PROFILE (run {run_id}, log {run_log.run_log_path()})")
+    print("=" * 60)
+    run_log.print_profile(run_log.load_events(run_id=run_id))
+
+def calibrate_encoder(args):
+    """Run the encode preset calibration; returns the exit code"""
+    if not args.upload_mbps:
+        print("❌ --calibrate-encoder needs --upload-mbps")
+        return 1
+    cmd = [python_command(), "encode_profiles.py", "--upload-mbps", str(args.upload_mbps)]
+    if args.encode_profile:
+        cmd.extend(["--encode-profile", args.encode_profile])
+    return 0 if run_command(cmd, "Calibrating encoder presets", 'calibrate') else 1
+
 def parse_arguments():
     """Parse command line arguments"""
     parser = argparse.ArgumentParser(
@@ -94,6 +454,22 @@ Examples:
   # Join and publish only (use existing quiz folder)
   python main.py --skip-render --join --publish --youtube \\
                  --quiz-name quiz5 --output final_quiz5.mp4
+  
+  # Continue an interrupted run (skips finished renders/uploads)
+  python main.py --resume quiz5
+  
+  # Batch: render/join/publish many quizzes, stages overlapping
+  python main.py --batch quizzes.json --join-concurrency 2
+  
+  # Start uploading while the long-form video is still being encoded
+  python main.py --skip-render --join --publish --youtube --quiz-name quiz5 \\
+                 --long --stream-upload
+  
+  # Time each stage (wall/CPU/peak RSS/I/O/frames) and print a summary
+  python main.py --all --quiz-name quiz5 --profile
+  
+  # Pick the x264 preset that gets long-form videos uploaded soonest on 20 Mbps
+  python main.py --calibrate-encoder --upload-mbps 20 --encode-profile long-form
         """
     )
     
@@ -120,14 +496,34 @@ Examples:
     parser.add_argument('--long', action='store_true', help='Generate horizontal videos (16:9)')
     parser.add_argument('--live', action='store_true', help='Optimize for YouTube Live (30fps, 4500kbps, 2s GOP)')
     parser.add_argument('--comp', type=str, help='Remotion composition ID to render')
+    parser.add_argument('--render-workers', type=int, help='Question clips to render concurrently (shares one bundle, splits CPUs between renders)')
+    parser.add_argument('--force-render', action='store_true', help='Re-render every question clip even if its inputs are unchanged')
+    parser.add_argument('--no-asset-cache', action='store_true', help='Regenerate narratives, TTS audio and images instead of reusing cached ones')
     parser.add_argument('--intro', type=str, help='Path to intro video file')
     parser.add_argument('--outro', type=str, help='Path to outro video file')
+    parser.add_argument('--join-mode', choices=['full', 'segment', 'parallel'], default='full', help='full: single-pass render, segment: re-encode transition windows only, parallel: render all segments on a process pool')
+    parser.add_argument('--duck-db', type=float, help='Lower background music by this many dB under narration (default 10, 0 to disable)')
+    parser.add_argument('--no-segment-cache', action='store_true', help='Re-render every join segment instead of reusing unchanged ones')
+    parser.add_argument('--join-workers', type=int, help='Worker processes for segment/parallel join modes (default: CPU count)')
+    parser.add_argument('--encode-profile', choices=list(encode_profiles.PROFILES), help='Encode profile for the joined video (default: shorts, long-form or live to match the format)')
+    parser.add_argument('--calibrate-encoder', action='store_true', help='Measure x264 presets on this machine, save the one with the lowest encode + upload time and exit (needs --upload-mbps)')
+    parser.add_argument('--upload-mbps', type=float, help='Upload bandwidth in Mbit/s for --calibrate-encoder')
     
     # Publishing configuration
     parser.add_argument('--youtube', action='store_true', help='Publish to YouTube')
     parser.add_argument('--facebook', action='store_true', help='Publish to Facebook')
     parser.add_argument('--title', type=str, help='Video title')
     parser.add_argument('--description', type=str, help='Video description')
+    parser.add_argument('--stream-upload', action='store_true', help='Upload while the video is being joined (fragmented MP4; needs --join --publish, non-interactive)')
+    
+    # Batch mode
+    parser.add_argument('--batch', type=str, metavar='MANIFEST', help='Run every quiz in a JSON manifest through render → join → publish (pipelined)')
+    parser.add_argument('--render-concurrency', type=int, default=1, help='Batch: quizzes rendered at the same time')
+    parser.add_argument('--join-concurrency', type=int, default=1, help='Batch: quizzes joined at the same time')
+    parser.add_argument('--publish-concurrency', type=int, default=1, help='Batch: quizzes uploaded at the same time')
+    
+    parser.add_argument('--profile', action='store_true', help=f'Print wall time, CPU, peak RSS, I/O and frames per stage at the end (events always go to ${run_log.RUN_LOG_ENV}, default {run_log.DEFAULT_RUN_LOG})')
+    parser.add_argument('--resume', type=str, metavar='QUIZ', help='Continue an interrupted run of a quiz from out/<quiz>/pipeline_state.json')
     
     # Utility
     parser.add_argument('--interactive', action='store_true', help='Force interactive mode (default if no flags)')
@@ -138,6 +534,18 @@ Examples:
 def main():
     args = parse_arguments()
     
+    # Stage timings and resource use of this run go to the run log
+    run_id = run_log.start_run()
+    if args.profile:
+        atexit.register(print_run_profile, run_id)
+    
+    if args.calibrate_encoder:
+        sys.exit(calibrate_encoder(args))
+    if args.batch:
+        sys.exit(run_batch(args))
+    if args.resume:
+        sys.exit(resume_pipeline(args))
+    
     # Determine if running in interactive mode
     has_workflow_flags = args.render or args.join or args.publish or args.all or \
                          args.skip_render or args.skip_join or args.skip_publish or \
@@ -187,6 +595,8 @@ def main():
     
     quiz_name = None
     quiz_folder = None
+    state = None
+    stages = planned_stages(args, should_render, interactive)
     
     if should_render:
         # Check if render.mjs exists
@@ -194,34 +604,45 @@ def main():
             print("❌ render.mjs not found!")
             sys.exit(1)
         
-        # Run render.mjs
-        cmd = ["node", "render.mjs"]
-        if args.short:
-            cmd.append("--short")
-        if args.vertical:
-            cmd.append("--vertical")
-        if args.long:
-            cmd.append("--long")
-        if args.comp:
-            cmd.extend(["--comp", args.comp])
+        # Run render.mjs (named up front when --quiz-name is given, so the
+        # folder doesn't have to be guessed afterwards)
+        cmd = build_render_cmd(args, quiz_name=args.quiz_name)
         if args.api_url:
-            cmd.append(args.api_url)
             print(f"✓ Using API URL: {args.api_url}")
         
+        # Progress is recorded in out/<quiz>/pipeline_state.json for --resume
+        if args.quiz_name:
+            state = PipelineState(os.path.join("out", quiz_folder_name(args.quiz_name)))
+            record_plan(state, args, quiz_folder_name(args.quiz_name), state.quiz_folder, stages)
+            state.begin('render')
+        
         success = run_command(
             cmd,
-            "Rendering question videos"
+            "Rendering question videos",
+            'render',
+            quiz=quiz_folder_name(args.quiz_name) if args.quiz_name else None
         )
         
         if not success:
+            if state:
+                state.finish('render', False)
             print("\n⚠️  Rendering failed. Exiting...")
             sys.exit(1)
         
         # Get the quiz name from user or find latest folder
-        quiz_folder = get_latest_quiz_folder()
+        if args.quiz_name:
+            quiz_folder = os.path.join("out", quiz_folder_name(args.quiz_name))
+        else:
+            quiz_folder = get_latest_quiz_folder()
         if quiz_folder:
             quiz_name = Path(quiz_folder).name
             print(f"\n✓ Using quiz folder: {quiz_folder}")
+            report_render_manifest(quiz_folder)
+            
+            if state is None:
+                state = PipelineState(quiz_folder)
+                state.begin('render')
+            state.finish('render', True, clips=render_artifacts(quiz_folder))
     else:
         # Use provided quiz name or ask for it
         if args.quiz_name:
@@ -250,6 +671,11 @@ def main():
         if not os.path.exists(quiz_folder):
             print(f"❌ Quiz folder not found: {quiz_folder}")
             sys.exit(1)
+        
+        state = PipelineState.load(quiz_folder) or PipelineState(quiz_folder)
+    
+    if state:
+        record_plan(state, args, quiz_name, quiz_folder, stages)
     
     # ==================== STEP 2: TRANSITIONS ====================
     print("\n\n🎞️  STEP 2: Join Videos with Transitions")
@@ -267,6 +693,11 @@ def main():
     
     final_video_path = None
     
+    stream_upload = args.stream_upload and should_join and not interactive and \
+        args.publish and not args.skip_publish
+    if args.stream_upload and not stream_upload:
+        print("⚠️  --stream-upload needs a non-interactive --join --publish run, uploading after the join")
+    
     if should_join:
         # Check if transition.py exists
         if not os.path.exists("transition.py"):
@@ -295,27 +726,62 @@ def main():
         
         final_video_path = output_name
         
-        # Check for Python virtual environment
-        python_cmd = ".venv/bin/python" if os.path.exists(".venv/bin/python") else "python3"
-        
         # Run transition.py
-        transition_cmd = [python_cmd, "transition.py", quiz_folder, output_name]
-        if args.short or args.vertical:
-            transition_cmd.append("--short")
-        if args.long:
-            transition_cmd.append("--long")
-        if args.live:
-            transition_cmd.append("--live")
-        if args.intro:
-            transition_cmd.extend(["--intro", args.intro])
-        if args.outro:
-            transition_cmd.extend(["--outro", args.outro])
+        transition_cmd = build_join_cmd(args, quiz_folder, output_name)
+        
+        # --stream-upload: publish.py follows the fragmented MP4 while it is written
+        publisher = None
+        if stream_upload:
+            transition_cmd.append("--fragmented")
+            publish_youtube = args.youtube or not args.facebook
+            publish_facebook = args.facebook or not args.youtube
+            title = args.title or default_title(quiz_name)
+            description = args.description or "Test your knowledge with this quiz!"
+            publish_cmd = build_publish_cmd(args, output_name, title, description, publish_youtube, publish_facebook)
+            publish_cmd.append("--follow")
+            if state:
+                state.options.update(output=output_name, title=title, description=description,
+                                     youtube=publish_youtube, facebook=publish_facebook)
+                publish_started = state.begin('publish', video=output_name)
+            # The follower must not see a finished video or .done marker from an earlier run
+            clear_write_markers(output_name)
+            if os.path.exists(output_name):
+                os.remove(output_name)
+            print("📡 Uploading while joining (--stream-upload)")
+            publisher = ThreadPoolExecutor(max_workers=1)
+            publish_future = publisher.submit(
+                run_command, publish_cmd, "Publishing video while it is joined", 'publish', quiz_name
+            )
             
+        if state:
+            state.options['output'] = output_name
+            state.begin('join', output=output_name)
+        
         success = run_command(
             transition_cmd,
-            "Joining videos with transitions"
+            "Joining videos with transitions",
+            'join',
+            quiz=quiz_name
         )
         
+        if state:
+            state.finish('join', success, **(video_artifact(output_name) if success else {}))
+        
+        if publisher:
+            if not success and not os.path.exists(output_name + DONE_SUFFIX):
+                # transition.py died without saying so; stop the follower
+                mark_written(output_name, False)
+            published_ok = publish_future.result()
+            publisher.shutdown()
+            if state:
+                state.record_published(published_platforms(output_name, since=publish_started))
+                published = state.published()
+                state.finish('publish', (not publish_youtube or 'youtube' in published)
+                             and (not publish_facebook or 'facebook' in published))
+            if success:
+                print("\n✅ Video published successfully!" if published_ok
+                      else "\n⚠️  Publishing failed. Check credentials and try again.")
+        
         if not success:
             print("\n⚠️  Video joining failed. Exiting...")
             sys.exit(1)
@@ -341,7 +807,10 @@ def main():
     print("-" * 60)
     
     # Determine if we should publish
-    if interactive and not args.skip_publish:
+    if stream_upload:
+        should_publish = False
+        print("✓ Already published while joining (--stream-upload)")
+    elif interactive and not args.skip_publish:
         should_publish = yes_no_prompt("Do you want to publish the video?", default=False)
     else:
         should_publish = args.publish and not args.skip_publish
@@ -379,9 +848,9 @@ def main():
                 title = args.title
                 print(f"✓ Title: {title}")
             elif interactive:
-                title = prompt_input("Enter video title", default=f"{quiz_name.replace('-', ' ').title()} Quiz")
+                title = prompt_input("Enter video title", default=default_title(quiz_name))
             else:
-                title = f"{quiz_name.replace('-', ' ').title()} Quiz"
+                title = default_title(quiz_name)
                 print(f"✓ Title: {title}")
             
             if args.description:
@@ -394,26 +863,27 @@ def main():
                 print(f"✓ Description: {description}")
             
             # Build command
-            python_cmd = ".venv/bin/python" if os.path.exists(".venv/bin/python") else "python3"
-            cmd = [python_cmd, "publish.py", final_video_path]
+            cmd = build_publish_cmd(args, final_video_path, title, description, publish_youtube, publish_facebook)
             
-            if publish_youtube:
-                cmd.append("--youtube")
-            if publish_facebook:
-                cmd.append("--facebook")
-            if args.short or args.vertical:
-                cmd.append("--short")
-            if args.long:
-                cmd.append("--long")
-            
-            cmd.extend(["--title", title, "--description", description])
+            if state:
+                state.options.update(output=final_video_path, title=title, description=description,
+                                     youtube=publish_youtube, facebook=publish_facebook)
+                publish_started = state.begin('publish', video=final_video_path)
             
             # Run publish.py
             success = run_command(
                 cmd,
-                "Publishing video to platforms"
+                "Publishing video to platforms",
+                'publish',
+                quiz=quiz_name
             )
             
+            if state:
+                state.record_published(published_platforms(final_video_path, since=publish_started))
+                published = state.published()
+                state.finish('publish', (not publish_youtube or 'youtube' in published)
+                             and (not publish_facebook or 'facebook' in published))
+            
             if success:
                 print("\n✅ Video published successfully!")
             else:
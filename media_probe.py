@@ -0,0 +1,190 @@
+"""
+Clip metadata without opening decoders.
+
+probe_clip() asks ffprobe (JSON output) for a file's duration, size, frame
+rate, codecs and whether it has audio. Results are kept in
+CACHE_DIR/probe.json keyed by path, size and mtime, so re-joining a quiz
+starts no subprocesses for clips that did not change. probe_clips() probes a
+whole quiz in parallel and validate_clips() checks the clips can be joined
+before any rendering starts.
+
+Without ffprobe, the same fields are parsed from `ffmpeg -i` (MoviePy's
+ffmpeg_parse_infos), which is slower but needs nothing extra.
+"""
+
+import os
+import json
+import shutil
+import subprocess
+from fractions import Fraction
+from concurrent.futures import ThreadPoolExecutor
+
+CACHE_DIR = os.getenv('QUIZ_CACHE_DIR', '.cache')
+FFPROBE_BINARY = os.getenv('FFPROBE_BINARY', 'ffprobe')
+
+# Probes run as subprocesses, so threads are enough to overlap them
+PROBE_WORKERS = 8
+
+# Bump when the probed fields change so cached entries are not reused
+PROBE_VERSION = 1
+
+class ProbeError(Exception):
+    """A clip could not be probed (missing, unreadable, no video stream)"""
+
+def parse_rate(rate):
+    """'30000/1001' -> 29.97; None for missing or 0/0 rates"""
+    try:
+        value = float(Fraction(rate))
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+    return value or None
+
+def run_ffprobe(path):
+    """Probe one file with ffprobe; returns the clip info dict"""
+    cmd = [
+        FFPROBE_BINARY, '-v', 'error',
+        '-show_entries',
+        'format=duration:stream=codec_type,codec_name,pix_fmt,width,height,avg_frame_rate,r_frame_rate,duration',
+        '-of', 'json', path
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        # ffprobe already names the file in its message
+        raise ProbeError(result.stderr.strip() or f"{path}: ffprobe failed")
+    data = json.loads(result.stdout)
+    streams = data.get('streams', [])
+    video = next((s for s in streams if s.get('codec_type') == 'video'), None)
+    audio = next((s for s in streams if s.get('codec_type') == 'audio'), None)
+    if video is None:
+        raise ProbeError(f"{path}: no video stream")
+
+    duration = data.get('format', {}).get('duration') or video.get('duration')
+    return {
+        'path': path,
+        'duration': float(duration) if duration not in (None, 'N/A') else None,
+        'width': video.get('width'),
+        'height': video.get('height'),
+        'fps': parse_rate(video.get('avg_frame_rate')) or parse_rate(video.get('r_frame_rate')),
+        'codec': video.get('codec_name'),
+        'pix_fmt': video.get('pix_fmt'),
+        'has_audio': audio is not None,
+        'audio_codec': audio.get('codec_name') if audio else None,
+    }
+
+def run_ffmpeg_parse(path):
+    """Fallback probe through `ffmpeg -i` when ffprobe is not installed"""
+    from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+    try:
+        infos = ffmpeg_parse_infos(path)
+    except (IOError, OSError) as e:
+        raise ProbeError(f"{path}: {e}")
+    if not infos.get('video_found'):
+        raise ProbeError(f"{path}: no video stream")
+    width, height = infos.get('video_size') or (None, None)
+    return {
+        'path': path,
+        'duration': infos.get('duration'),
+        'width': width,
+        'height': height,
+        'fps': infos.get('video_fps'),
+        'codec': infos.get('video_codec_name'),
+        'pix_fmt': None,
+        'has_audio': bool(infos.get('audio_found')),
+        'audio_codec': None,
+    }
+
+def cache_key(path):
+    stat = os.stat(path)
+    return f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}:{PROBE_VERSION}"
+
+def load_cache():
+    try:
+        with open(os.path.join(CACHE_DIR, 'probe.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_cache(cache):
+    cache_path = os.path.join(CACHE_DIR, 'probe.json')
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(cache, f)
+    os.replace(tmp_path, cache_path)
+
+def probe_clips(paths, workers=PROBE_WORKERS):
+    """Clip info dicts for `paths` (same order), probed in parallel and cached.
+
+    Each dict has path, duration, width, height, fps, codec, pix_fmt,
+    has_audio and audio_codec. Raises ProbeError for the first clip that
+    cannot be probed.
+    """
+    probe = run_ffprobe if shutil.which(FFPROBE_BINARY) else run_ffmpeg_parse
+    cache = load_cache()
+
+    infos = [None] * len(paths)
+    missing = []
+    for i, path in enumerate(paths):
+        if not os.path.exists(path):
+            raise ProbeError(f"{path}: file not found")
+        key = cache_key(path)
+        if key in cache:
+            infos[i] = dict(cache[key], path=path)
+        else:
+            missing.append((i, key))
+
+    if missing:
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(missing)))) as pool:
+            probed = pool.map(lambda item: probe(paths[item[0]]), missing)
+            for (i, key), info in zip(missing, probed):
+                infos[i] = info
+                cache[key] = info
+        save_cache(cache)
+    return infos
+
+def probe_clip(path):
+    """probe_clips() for a single file"""
+    return probe_clips([path])[0]
+
+def validate_clips(infos):
+    """Check clips can be joined; prints warnings and returns a list of errors.
+
+    Clips without a usable duration, size or frame rate are errors. Clips
+    whose size or frame rate differ from the first one are warnings: they
+    are scaled and resampled to the first clip's format.
+    """
+    errors = []
+    for info in infos:
+        name = os.path.basename(info['path'])
+        if not info.get('duration') or info['duration'] <= 0:
+            errors.append(f"{name}: unknown or zero duration")
+        if not info.get('width') or not info.get('height'):
+            errors.append(f"{name}: unknown frame size")
+        if not info.get('fps'):
+            errors.append(f"{name}: unknown frame rate")
+    if errors or not infos:
+        return errors
+
+    first = infos[0]
+    for info in infos[1:]:
+        name = os.path.basename(info['path'])
+        if (info['width'], info['height']) != (first['width'], first['height']):
+            print(f"⚠️ Warning: {name} is {info['width']}x{info['height']}, "
+                  f"will be scaled to {first['width']}x{first['height']}")
+        if abs(info['fps'] - first['fps']) > 0.01:
+            print(f"⚠️ Warning: {name} is {info['fps']:g}fps, will be resampled to {first['fps']:g}fps")
+    return errors
+
+def probe_keyframes(path):
+    """Return the sorted presentation times (seconds) of a clip's video keyframes"""
+    cmd = [
+        FFPROBE_BINARY, '-v', 'error', '-select_streams', 'v:0',
+        '-show_entries', 'packet=pts_time,flags',
+        '-of', 'json', path
+    ]
+    result = subprocess.run(cmd, check=True, capture_output=True, text=True)
+    packets = json.loads(result.stdout).get('packets', [])
+    return sorted(
+        float(p['pts_time']) for p in packets
+        if 'K' in p.get('flags', '') and p.get('pts_time') not in (None, 'N/A')
+    )
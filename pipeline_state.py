@@ -0,0 +1,183 @@
+"""
+Per-quiz pipeline state (out/<quiz>/pipeline_state.json).
+
+Records which stages (render, join, publish) a run of a quiz planned, which
+of them finished and what they produced, so `main.py --resume <quiz>` can
+carry on after a crash without redoing renders or uploads that already
+succeeded.
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+from datetime import datetime
+
+PIPELINE_STATE_NAME = "pipeline_state.json"
+STATE_VERSION = 1
+
+PIPELINE_STAGES = ('render', 'join', 'publish')
+
+# Options needed to rebuild the stage commands when resuming
+STATE_OPTION_KEYS = (
+    'quiz_name', 'quiz_folder', 'api_url', 'comp', 'short', 'vertical', 'long', 'live',
+    'intro', 'outro', 'join_mode', 'join_workers', 'no_segment_cache', 'duck_db', 'encode_profile',
+    'render_workers', 'no_asset_cache', 'force_render',
+    'output', 'title', 'description', 'youtube', 'facebook',
+)
+
+# Left next to a video that is written while publish.py --follow uploads it
+DONE_SUFFIX = ".done"
+FAILED_SUFFIX = ".failed"
+
+def clear_write_markers(video_path):
+    for suffix in (DONE_SUFFIX, FAILED_SUFFIX):
+        if os.path.exists(video_path + suffix):
+            os.remove(video_path + suffix)
+
+def mark_written(video_path, ok):
+    """Tell a follower the video is complete (with its final size) or will never be"""
+    if ok:
+        with open(video_path + DONE_SUFFIX, 'w') as f:
+            f.write(str(os.path.getsize(video_path)))
+    else:
+        open(video_path + FAILED_SUFFIX, 'w').close()
+
+def file_sha1(path):
+    """Content hash of a file, read in 1 MB chunks"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def clip_artifact(path):
+    """Size and hash of a rendered clip"""
+    return {'size': os.path.getsize(path), 'sha1': file_sha1(path)}
+
+def render_artifacts(quiz_folder):
+    """{clip name: {size, sha1}} of the rendered question clips"""
+    return {
+        name: clip_artifact(os.path.join(quiz_folder, name))
+        for name in sorted(os.listdir(quiz_folder))
+        if re.match(r'question-\d+\.mp4$', name)
+    }
+
+def video_artifact(path):
+    """Path, size and hash of a joined video"""
+    return {'output': path, 'size': os.path.getsize(path), 'sha1': file_sha1(path)}
+
+def published_platforms(video_path, since):
+    """{platform: result} from the publish log written by publish.py after `since`"""
+    log_file = video_path.replace('.mp4', '_publish_log.json')
+    try:
+        if os.path.getmtime(log_file) < since:
+            return {}
+        with open(log_file) as f:
+            return {result['platform']: result for result in json.load(f).get('platforms', [])}
+    except (OSError, ValueError, KeyError):
+        return {}
+
+class PipelineState:
+    """Stage progress of one quiz, saved after every change"""
+
+    def __init__(self, quiz_folder, data=None):
+        self.quiz_folder = quiz_folder
+        self.path = os.path.join(quiz_folder, PIPELINE_STATE_NAME)
+        self.data = data or {
+            'version': STATE_VERSION,
+            'options': {},
+            'stages': [],
+            'progress': {},
+        }
+
+    @classmethod
+    def load(cls, quiz_folder):
+        """Saved state of a quiz, or None if there is none"""
+        try:
+            with open(os.path.join(quiz_folder, PIPELINE_STATE_NAME)) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get('version') != STATE_VERSION:
+            return None
+        return cls(quiz_folder, data)
+
+    @property
+    def options(self):
+        return self.data['options']
+
+    @property
+    def stages(self):
+        """Stages planned for this quiz, in pipeline order"""
+        return self.data['stages']
+
+    def plan(self, stages):
+        """Set the stages the current run will go through"""
+        self.data['stages'] = [stage for stage in PIPELINE_STAGES if stage in stages]
+
+    def save(self):
+        self.data['updated_at'] = datetime.now().isoformat(timespec='seconds')
+        os.makedirs(self.quiz_folder, exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.data, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def set_options(self, args):
+        """Remember the options the stages are run with (for --resume)"""
+        for key in STATE_OPTION_KEYS:
+            if hasattr(args, key):
+                self.options[key] = getattr(args, key)
+
+    def begin(self, stage, **details):
+        """Mark a stage as running; returns its start time"""
+        if stage not in self.stages:
+            self.plan(self.stages + [stage])
+        entry = self.data['progress'].setdefault(stage, {})
+        entry.update(details)
+        entry['status'] = 'running'
+        entry['started_at'] = time.time()
+        self.save()
+        return entry['started_at']
+
+    def finish(self, stage, ok, **details):
+        entry = self.data['progress'].setdefault(stage, {})
+        entry.update(details)
+        entry['status'] = 'done' if ok else 'failed'
+        entry['finished_at'] = time.time()
+        self.save()
+
+    def published(self):
+        """{platform: result} of every upload of this quiz that succeeded"""
+        return self.data['progress'].get('publish', {}).get('platforms', {})
+
+    def record_published(self, platforms):
+        """Merge newly published platforms into the state"""
+        entry = self.data['progress'].setdefault('publish', {})
+        entry['platforms'] = {**entry.get('platforms', {}), **platforms}
+
+    def is_complete(self, stage):
+        """True if the stage finished and what it produced is still there, unchanged"""
+        entry = self.data['progress'].get(stage, {})
+        if entry.get('status') != 'done':
+            return False
+
+        if stage == 'render':
+            clips = entry.get('clips', {})
+            # Size first, so a missing or truncated clip is caught without hashing.
+            # States saved before clips were hashed only hold sizes: not trusted.
+            return bool(clips) and all(
+                isinstance(artifact, dict)
+                and os.path.exists(os.path.join(self.quiz_folder, name))
+                and os.path.getsize(os.path.join(self.quiz_folder, name)) == artifact.get('size')
+                and file_sha1(os.path.join(self.quiz_folder, name)) == artifact.get('sha1')
+                for name, artifact in clips.items()
+            )
+        if stage == 'join':
+            path = entry.get('output')
+            return bool(path) and os.path.exists(path) \
+                and os.path.getsize(path) == entry.get('size') \
+                and file_sha1(path) == entry.get('sha1')
+        return True
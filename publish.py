@@ -6,14 +6,36 @@ Publishes videos to Facebook Page and YouTube Channel
 
 import os
 import sys
+import time
+import threading
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import json
 
 # Load environment variables
 load_dotenv()
 
-def upload_to_youtube(video_path, title, description, tags=None, category_id="27", privacy="public"):
+class PublishProgress:
+    """One status line for all uploads running at the same time"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.status = {}
+
+    def tracker(self, platform):
+        """progress(sent, total) callback for one platform"""
+        def progress(sent, total):
+            with self.lock:
+                self.status[platform] = int(sent * 100 / total)
+                line = " | ".join(f"{name} {percent}%" for name, percent in self.status.items())
+                print(f"  Progress: {line}", end='\r')
+        return progress
+
+def print_progress(sent, total):
+    print(f"  Progress: {int(sent * 100 / total)}%", end='\r')
+
+def upload_to_youtube(video_path, title, description, tags=None, category_id="27", privacy="public", chunk_size=None, progress=None, limiter=None, growing=None):
     """
     Upload video to YouTube using YouTube Data API v3
     
@@ -24,13 +46,16 @@ def upload_to_youtube(video_path, title, description, tags=None, category_id="27
         tags: List of tags (optional)
         category_id: YouTube category ID (27 = Education, 24 = Entertainment)
         privacy: Privacy status (public, private, unlisted)
+        chunk_size: Upload chunk size in bytes (default: $YOUTUBE_CHUNK_MB or 8 MB)
+        progress: progress(sent, total) callback (default: print a progress line)
+        limiter: BandwidthLimiter shared with other uploads (optional)
+        growing: GrowingFile to upload while it is still being written (optional)
     """
     try:
         from google.oauth2.credentials import Credentials
         from google_auth_oauthlib.flow import InstalledAppFlow
-        from google.auth.transport.requests import Request
-        from googleapiclient.discovery import build
-        from googleapiclient.http import MediaFileUpload
+        from google.auth.transport.requests import Request, AuthorizedSession
+        from resumable_upload import YouTubeUpload, chunk_size_from_env
         import pickle
         
         print("\n📹 Uploading to YouTube...")
@@ -74,9 +99,6 @@ def upload_to_youtube(video_path, title, description, tags=None, category_id="27
             with open(token_file, 'wb') as token:
                 pickle.dump(creds, token)
         
-        # Build YouTube API client
-        youtube = build('youtube', 'v3', credentials=creds)
-        
         # Prepare video metadata
         body = {
             'snippet': {
@@ -91,23 +113,16 @@ def upload_to_youtube(video_path, title, description, tags=None, category_id="27
             }
         }
         
-        # Create media upload
-        media = MediaFileUpload(video_path, chunksize=-1, resumable=True)
+        # Resumable upload in chunks; an interrupted upload of the same file
+        # continues from the last acknowledged byte on the next run
+        chunk_size = chunk_size or chunk_size_from_env('YOUTUBE_CHUNK_MB')
+        print(f"  Uploading in {chunk_size / (1024*1024):.0f} MB chunks... (this may take a while)")
         
-        # Execute upload
-        print("  Uploading... (this may take a while)")
-        request = youtube.videos().insert(
-            part='snippet,status',
-            body=body,
-            media_body=media
+        upload = YouTubeUpload(
+            AuthorizedSession(creds), video_path, body,
+            chunk_size=chunk_size, progress=progress or print_progress, limiter=limiter, growing=growing
         )
-        
-        response = None
-        while response is None:
-            status, response = request.next_chunk()
-            if status:
-                progress = int(status.progress() * 100)
-                print(f"  Progress: {progress}%", end='\r')
+        response = upload.run()
         
         video_id = response['id']
         video_url = f"https://www.youtube.com/watch?v={video_id}"
@@ -124,14 +139,14 @@ def upload_to_youtube(video_path, title, description, tags=None, category_id="27
         
     except ImportError:
         print("\n❌ YouTube upload requires additional packages:")
-        print("  pip install google-auth google-auth-oauthlib google-auth-httplib2 google-api-python-client")
+        print("  pip install google-auth google-auth-oauthlib requests")
         return None
     except Exception as e:
         print(f"\n❌ YouTube upload failed: {str(e)}")
         return None
 
 
-def upload_to_facebook(video_path, message, page_id=None, access_token=None):
+def upload_to_facebook(video_path, message, page_id=None, access_token=None, chunk_size=None, progress=None, limiter=None, growing=None):
     """
     Upload video to Facebook Page using Graph API
     
@@ -140,9 +155,13 @@ def upload_to_facebook(video_path, message, page_id=None, access_token=None):
         message: Post caption/description
         page_id: Facebook Page ID (from env if not provided)
         access_token: Facebook Page Access Token (from env if not provided)
+        chunk_size: Upload chunk size in bytes (default: $FACEBOOK_CHUNK_MB or 8 MB)
+        progress: progress(sent, total) callback (default: print a progress line)
+        limiter: BandwidthLimiter shared with other uploads (optional)
+        growing: GrowingFile still being written; the upload starts once it is complete
     """
     try:
-        import requests
+        from resumable_upload import FacebookUpload, chunk_size_from_env
         
         print("\n📘 Uploading to Facebook...")
         
@@ -167,45 +186,36 @@ def upload_to_facebook(video_path, message, page_id=None, access_token=None):
         print(f"  Page ID: {page_id}")
         print(f"  Message: {message[:50]}...")
         
-        # Use /me/videos endpoint which works with page access token
-        url = f"https://graph.facebook.com/v18.0/me/videos"
+        # Facebook needs the final size up front
+        if growing:
+            print("  Waiting for the video to be finished...")
+            growing.wait_finished()
         
         # Get file size
         file_size = os.path.getsize(video_path)
         print(f"  File size: {file_size / (1024*1024):.2f} MB")
         
-        # Upload video
-        print("  Uploading... (this may take a while)")
+        # Chunked start/transfer/finish upload to /me/videos (works with a page
+        # access token); an interrupted upload continues where it stopped
+        chunk_size = chunk_size or chunk_size_from_env('FACEBOOK_CHUNK_MB')
+        print(f"  Uploading in chunks of up to {chunk_size / (1024*1024):.0f} MB... (this may take a while)")
         
-        with open(video_path, 'rb') as video_file:
-            files = {
-                'file': video_file
-            }
-            data = {
-                'access_token': access_token,
-                'description': message
-            }
-            
-            response = requests.post(url, data=data, files=files)
+        upload = FacebookUpload(
+            video_path, access_token, {'description': message},
+            chunk_size=chunk_size, progress=progress or print_progress, limiter=limiter
+        )
+        video_id = upload.run()
+        post_url = f"https://www.facebook.com/{page_id}/videos/{video_id}"
         
-        if response.status_code == 200:
-            result = response.json()
-            video_id = result.get('id')
-            post_url = f"https://www.facebook.com/{page_id}/videos/{video_id}"
-            
-            print(f"\n✅ Facebook upload complete!")
-            print(f"  Video ID: {video_id}")
-            print(f"  URL: {post_url}")
-            
-            return {
-                'platform': 'facebook',
-                'video_id': video_id,
-                'url': post_url
-            }
-        else:
-            print(f"\n❌ Facebook upload failed: {response.status_code}")
-            print(f"  Error: {response.text}")
-            return None
+        print(f"\n✅ Facebook upload complete!")
+        print(f"  Video ID: {video_id}")
+        print(f"  URL: {post_url}")
+        
+        return {
+            'platform': 'facebook',
+            'video_id': video_id,
+            'url': post_url
+        }
             
     except ImportError:
         print("\n❌ Facebook upload requires additional packages:")
@@ -234,22 +244,31 @@ def save_publish_log(video_path, results):
 
 def main():
     if len(sys.argv) < 2:
-        print("Usage: python publish.py <video_path> [--youtube] [--facebook] [--title 'Title'] [--description 'Desc'] [--short]")
+        print("Usage: python publish.py <video_path> [--youtube] [--facebook] [--title 'Title'] [--description 'Desc'] [--short] [--chunk-mb N] [--max-upload-mbps N] [--follow]")
         print("\nExample:")
         print("  python publish.py output.mp4 --youtube --facebook --title 'Quiz Video' --description 'Test your knowledge!'")
         print("\nEnvironment Variables Required:")
         print("  YouTube: YOUTUBE_CLIENT_SECRETS (path to OAuth client secrets JSON)")
+        print("  Optional: YOUTUBE_CHUNK_MB, FACEBOOK_CHUNK_MB (upload chunk sizes), UPLOAD_MAX_RETRIES, UPLOAD_MAX_MBPS")
         print("  Facebook: FACEBOOK_PAGE_ID, FACEBOOK_ACCESS_TOKEN")
         sys.exit(1)
     
     video_path = sys.argv[1]
     
-    if not os.path.exists(video_path):
+    # Parse arguments
+    args = sys.argv[2:]
+    
+    # --follow: the video is still being written (transition.py --fragmented);
+    # upload what exists and finish once <video>.done appears
+    growing = None
+    if '--follow' in args:
+        from resumable_upload import GrowingFile
+        from pipeline_state import DONE_SUFFIX, FAILED_SUFFIX
+        growing = GrowingFile(video_path, video_path + DONE_SUFFIX, video_path + FAILED_SUFFIX)
+    elif not os.path.exists(video_path):
         print(f"❌ Video file not found: {video_path}")
         sys.exit(1)
     
-    # Parse arguments
-    args = sys.argv[2:]
     upload_youtube = '--youtube' in args
     upload_facebook = '--facebook' in args
     is_short = '--short' in args
@@ -268,6 +287,20 @@ def main():
         desc_index = args.index('--description')
         if desc_index + 1 < len(args):
             description = args[desc_index + 1]
+    
+    # Upload chunk size in MB (default: YOUTUBE_CHUNK_MB / FACEBOOK_CHUNK_MB env or 8)
+    chunk_size = None
+    if '--chunk-mb' in args:
+        chunk_index = args.index('--chunk-mb')
+        if chunk_index + 1 < len(args):
+            chunk_size = int(float(args[chunk_index + 1]) * 1024 * 1024)
+    
+    # Combined upload rate limit in Mbit/s (default: UPLOAD_MAX_MBPS env, unlimited)
+    max_upload_mbps = float(os.getenv('UPLOAD_MAX_MBPS', 0))
+    if '--max-upload-mbps' in args:
+        rate_index = args.index('--max-upload-mbps')
+        if rate_index + 1 < len(args):
+            max_upload_mbps = float(args[rate_index + 1])
             
     # Add Shorts tags if needed
     if is_short:
@@ -285,39 +318,67 @@ def main():
     
     print(f"\n🎬 Publishing Video")
     print(f"  File: {video_path}")
-    print(f"  Size: {os.path.getsize(video_path) / (1024*1024):.2f} MB")
+    if growing:
+        print("  Size: (still being written, uploading as it grows)")
+    else:
+        print(f"  Size: {os.path.getsize(video_path) / (1024*1024):.2f} MB")
     print(f"  Platforms: {'YouTube' if upload_youtube else ''}{' & ' if upload_youtube and upload_facebook else ''}{'Facebook' if upload_facebook else ''}")
     
-    results = []
+    # Both platforms upload at the same time, sharing the bandwidth limit (if any)
+    limiter = None
+    if max_upload_mbps:
+        from resumable_upload import BandwidthLimiter
+        limiter = BandwidthLimiter(max_upload_mbps * 1_000_000 / 8)
+        print(f"  Bandwidth limit: {max_upload_mbps:g} Mbit/s shared")
+    progress = PublishProgress()
     
-    # Upload to YouTube
+    uploads = []
     if upload_youtube:
-        youtube_result = upload_to_youtube(
-            video_path,
+        uploads.append(('youtube', upload_to_youtube, dict(
             title=title,
             description=description,
             tags=['quiz', 'trivia', 'knowledge', 'education'],
             category_id='27',  # Education
-            privacy='public'
-        )
-        if youtube_result:
-            results.append(youtube_result)
-    
-    # Upload to Facebook
+            privacy='public',
+            chunk_size=chunk_size,
+            progress=progress.tracker('YouTube'),
+            limiter=limiter,
+            growing=growing
+        )))
     if upload_facebook:
-        facebook_result = upload_to_facebook(
-            video_path,
-            message=f"{title}\n\n{description}\n\n#quiz #trivia #knowledge"
-        )
-        if facebook_result:
-            results.append(facebook_result)
+        uploads.append(('facebook', upload_to_facebook, dict(
+            message=f"{title}\n\n{description}\n\n#quiz #trivia #knowledge",
+            chunk_size=chunk_size,
+            progress=progress.tracker('Facebook'),
+            limiter=limiter,
+            growing=growing
+        )))
+    
+    def timed_upload(upload, kwargs):
+        start = time.time()
+        result = upload(video_path, **kwargs)
+        if result:
+            result['elapsed_s'] = round(time.time() - start, 1)
+        return result
+    
+    with ThreadPoolExecutor(max_workers=len(uploads)) as pool:
+        futures = [pool.submit(timed_upload, upload, kwargs) for _, upload, kwargs in uploads]
+        results = [result for result in (future.result() for future in futures) if result]
     
     # Save results
     if results:
         save_publish_log(video_path, results)
+    
+    # Non-zero exit when any requested platform failed, so main.py can retry just that one
+    requested = int(upload_youtube) + int(upload_facebook)
+    if len(results) == requested:
         print("\n✅ Publishing complete!")
+    elif results:
+        print("\n⚠️  Some platforms failed to publish")
+        sys.exit(1)
     else:
         print("\n⚠️  No videos were published successfully")
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,123 @@
+import crypto from 'crypto';
+import fs from 'fs/promises';
+import path from 'path';
+
+// Per-quiz record of rendered question clips (out/<quiz>/render-manifest.json).
+//
+// Each clip is stored with a hash of everything that decides its pixels: the
+// inputProps, the content of the public/ assets they point at, the
+// composition ID and the Remotion bundle inputs. On a re-run only clips whose
+// hash changed (or whose mp4 is missing) are rendered again.
+
+const MANIFEST_VERSION = 1;
+export const RENDER_MANIFEST_NAME = 'render-manifest.json';
+
+async function listFiles(target) {
+  let stat;
+  try {
+    stat = await fs.stat(target);
+  } catch {
+    return [];
+  }
+  if (!stat.isDirectory()) {
+    return [target];
+  }
+  const entries = await fs.readdir(target);
+  const nested = await Promise.all(entries.map(entry => listFiles(path.join(target, entry))));
+  return nested.flat();
+}
+
+export class RenderManifest {
+  constructor(quizOutputPath) {
+    this.dir = quizOutputPath;
+    this.path = path.join(quizOutputPath, RENDER_MANIFEST_NAME);
+    this.clips = {};
+    this.reused = 0;
+    this.rendered = 0;
+    this.saving = Promise.resolve();
+  }
+
+  // Stable hash of any JSON-serializable description
+  static hash(...parts) {
+    return crypto.createHash('sha256').update(JSON.stringify(parts)).digest('hex');
+  }
+
+  static async hashFile(filePath) {
+    try {
+      return crypto.createHash('sha256').update(await fs.readFile(filePath)).digest('hex');
+    } catch {
+      return null;
+    }
+  }
+
+  // Hash of the files the Remotion bundle is built from. Computed from the
+  // sources rather than the bundle output so an up-to-date quiz can skip
+  // bundling altogether.
+  static async hashBundleInputs(rootDir, inputs) {
+    const files = (await Promise.all(inputs.map(input => listFiles(path.join(rootDir, input))))).flat().sort();
+    const hash = crypto.createHash('sha256');
+    for (const file of files) {
+      hash.update(path.relative(rootDir, file));
+      hash.update('\0');
+      hash.update(await fs.readFile(file));
+      hash.update('\0');
+    }
+    return hash.digest('hex');
+  }
+
+  async load() {
+    try {
+      const manifest = JSON.parse(await fs.readFile(this.path, 'utf-8'));
+      if (manifest.version === MANIFEST_VERSION) {
+        this.clips = manifest.clips;
+      }
+    } catch {
+      // First render of this quiz (or unreadable manifest): render everything
+      this.clips = {};
+    }
+  }
+
+  // Writes are chained so concurrent renders never interleave them
+  save() {
+    this.saving = this.saving.then(async () => {
+      const tmpPath = `${this.path}.${process.pid}.tmp`;
+      const manifest = {
+        version: MANIFEST_VERSION,
+        clips: this.clips,
+        lastRun: { reused: this.reused, rendered: this.rendered },
+      };
+      await fs.writeFile(tmpPath, JSON.stringify(manifest, null, 2));
+      await fs.rename(tmpPath, this.path);
+    });
+    return this.saving;
+  }
+
+  // True if fileName was rendered from exactly these inputs and still exists
+  async isCurrent(fileName, hash) {
+    const clip = this.clips[fileName];
+    if (!clip || clip.hash !== hash) {
+      return false;
+    }
+    try {
+      await fs.access(path.join(this.dir, fileName));
+    } catch {
+      return false;
+    }
+    return true;
+  }
+
+  async record(fileName, hash) {
+    this.clips[fileName] = { hash, renderedAt: new Date().toISOString() };
+    this.rendered++;
+    await this.save();
+  }
+
+  // Forget clips that are no longer part of the quiz
+  prune(fileNames) {
+    for (const fileName of Object.keys(this.clips)) {
+      if (!fileNames.includes(fileName)) {
+        delete this.clips[fileName];
+      }
+    }
+  }
+}
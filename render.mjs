@@ -5,6 +5,9 @@ import fs from 'fs/promises';
 import path from 'path';
 import { fileURLToPath } from 'url';
 import readline from 'readline';
+import os from 'os';
+import { AssetCache } from './asset-cache.mjs';
+import { RenderManifest } from './render-manifest.mjs';
 
 // Load environment variables
 import 'dotenv/config';
@@ -12,14 +15,45 @@ import 'dotenv/config';
 // The directory of the current file
 const __dirname = path.dirname(fileURLToPath(import.meta.url));
 
+// Append an event to the run log main.py set up (see run_log.py); no-op when run on its own
+async function logRunEvent(event, fields) {
+  if (!process.env.QUIZ_RUN_LOG) {
+    return;
+  }
+  const record = {
+    event,
+    run_id: process.env.QUIZ_RUN_ID || null,
+    stage: process.env.QUIZ_RUN_STAGE || null,
+    quiz: process.env.QUIZ_RUN_QUIZ || null,
+    time: Date.now() / 1000,
+    pid: process.pid,
+    host: os.hostname(),
+    ...fields,
+  };
+  try {
+    await fs.appendFile(path.resolve(process.env.QUIZ_RUN_LOG), JSON.stringify(record) + '\n');
+  } catch (err) {
+    console.warn(`⚠️  Could not write run log: ${err.message}`);
+  }
+}
+
 // Get CLI arguments
 const args = process.argv.slice(2);
 const isShort = args.includes('--short');
 const isLong = args.includes('--long');
 const isVertical = args.includes('--vertical');
-const compArgIndex = args.indexOf('--comp');
-const explicitComp = compArgIndex !== -1 ? args[compArgIndex + 1] : null;
-const apiUrlArg = args.find(arg => !arg.startsWith('--') && arg !== explicitComp); // Can be API URL or JSON file path
+const useAssetCache = !args.includes('--no-cache');
+const forceRender = args.includes('--force');
+// Flags that take a value; their values must not be mistaken for the API URL
+const VALUE_FLAGS = ['--comp', '--workers', '--name'];
+function getFlagValue(flag) {
+  const index = args.indexOf(flag);
+  return index !== -1 ? args[index + 1] : null;
+}
+const explicitComp = getFlagValue('--comp');
+const quizNameArg = getFlagValue('--name'); // Skips the quiz name prompt (batch runs)
+const renderWorkersArg = Number(getFlagValue('--workers') || 1);
+const apiUrlArg = args.find((arg, i) => !arg.startsWith('--') && !VALUE_FLAGS.includes(args[i - 1])); // Can be API URL or JSON file path
 
 // The composition you want to render
 let compositionId = 'MCQQuiz'; // Default to MCQQuiz (16:9)
@@ -34,38 +68,113 @@ if (explicitComp) {
   compositionId = 'VerticalMCQ';
 }
 
-// Rate limiting configuration
-const RATE_LIMIT_PER_MINUTE = 30;
-const RATE_LIMIT_DELAY = 60000 / RATE_LIMIT_PER_MINUTE; // milliseconds between requests
-let lastRequestTime = 0;
-
-// Function to prompt user for input
+// Rate limiting / concurrency configuration (one budget per backend)
+const RATE_LIMIT_PER_MINUTE = Number(process.env.GROQ_RATE_PER_MINUTE || 30); // Groq requests per minute
+const RATE_LIMIT_BURST = Number(process.env.GROQ_BURST || 1); // Groq requests allowed back to back
+const TTS_CONCURRENCY = Number(process.env.TTS_CONCURRENCY || 4); // parallel Google TTS calls
+const IMAGE_CONCURRENCY = Number(process.env.IMAGE_CONCURRENCY || 8); // parallel image downloads
+
+// Generated assets are reused across quizzes from a content-addressed cache.
+// Bump NARRATIVE_PROMPT_VERSION whenever the narrative prompts change so old
+// answers are not served for the new prompt.
+const NARRATIVE_MODEL = 'llama-3.1-8b-instant';
+const NARRATIVE_PROMPT_VERSION = 1;
+const ASSET_CACHE_MAX_MB = Number(process.env.ASSET_CACHE_MAX_MB || 2048);
+const assetCache = useAssetCache
+  ? new AssetCache(
+      path.join(__dirname, process.env.QUIZ_CACHE_DIR || '.cache', 'assets'),
+      ASSET_CACHE_MAX_MB * 1024 * 1024,
+    )
+  : null;
+
+// Question clips rendered at the same time (--workers N). They share one
+// bundle and split the CPUs between them.
+const RENDER_WORKERS = Number.isInteger(renderWorkersArg) && renderWorkersArg > 0 ? renderWorkersArg : 1;
+
+// Files the Remotion bundle is built from; any change re-renders every clip
+const BUNDLE_INPUTS = ['src', 'remotion.config.ts', 'package.json', 'package-lock.json'];
+
+// Keyframe every second so transition.py --mode segment can stream-copy
+// clip bodies right up to the transition windows (x264 default is ~8s)
+const KEYFRAME_INTERVAL_SECONDS = 1;
+
+// Function to prompt user for input. Rejects if stdin closes before an
+// answer (e.g. batch runs, where stdin is /dev/null), so the render fails
+// instead of exiting 0 with nothing rendered.
 function askQuestion(query) {
   const rl = readline.createInterface({
     input: process.stdin,
     output: process.stdout,
   });
 
-  return new Promise(resolve => rl.question(query, ans => {
-    rl.close();
-    resolve(ans);
-  }));
+  return new Promise((resolve, reject) => {
+    let answered = false;
+    rl.on('close', () => {
+      if (!answered) {
+        reject(new Error(`stdin closed before an answer to: ${query.trim()}`));
+      }
+    });
+    rl.question(query, ans => {
+      answered = true;
+      rl.close();
+      resolve(ans);
+    });
+  });
 }
 
-// Rate limiting helper
-async function rateLimitedDelay() {
-  const now = Date.now();
-  const timeSinceLastRequest = now - lastRequestTime;
-  
-  if (timeSinceLastRequest < RATE_LIMIT_DELAY) {
-    const delayNeeded = RATE_LIMIT_DELAY - timeSinceLastRequest;
-    console.log(`  Rate limiting: waiting ${Math.ceil(delayNeeded / 1000)}s...`);
-    await new Promise(resolve => setTimeout(resolve, delayNeeded));
-  }
-  
-  lastRequestTime = Date.now();
+// Rate limiting helper: token bucket refilled at `perMinute`, holding at most
+// `burst` tokens. Each call waits for and takes one token.
+function createTokenBucket(perMinute, burst) {
+  const refillMs = 60000 / perMinute;
+  let tokens = burst;
+  let lastRefill = Date.now();
+  let queue = Promise.resolve();
+
+  const take = async () => {
+    const now = Date.now();
+    tokens = Math.min(burst, tokens + (now - lastRefill) / refillMs);
+    lastRefill = now;
+    if (tokens < 1) {
+      const delayNeeded = (1 - tokens) * refillMs;
+      console.log(`  Rate limiting: waiting ${Math.ceil(delayNeeded / 1000)}s...`);
+      await new Promise(resolve => setTimeout(resolve, delayNeeded));
+      tokens = 1;
+      lastRefill = Date.now();
+    }
+    tokens -= 1;
+  };
+
+  // Callers are served in order
+  return () => (queue = queue.then(take));
 }
 
+// Concurrency helper: runs at most `limit` of the submitted tasks at once
+function createPool(limit) {
+  let active = 0;
+  const waiting = [];
+
+  const next = () => {
+    if (active >= limit || waiting.length === 0) {
+      return;
+    }
+    active++;
+    const { task, resolve, reject } = waiting.shift();
+    task().then(resolve, reject).finally(() => {
+      active--;
+      next();
+    });
+  };
+
+  return task => new Promise((resolve, reject) => {
+    waiting.push({ task, resolve, reject });
+    next();
+  });
+}
+
+const groqLimiter = createTokenBucket(RATE_LIMIT_PER_MINUTE, RATE_LIMIT_BURST);
+const ttsPool = createPool(TTS_CONCURRENCY);
+const imagePool = createPool(IMAGE_CONCURRENCY);
+
 // Initialize Google Cloud Text-to-Speech client
 const ttsClient = new textToSpeech.TextToSpeechClient({
   keyFilename: process.env.GOOGLE_APPLICATION_CREDENTIALS,
@@ -73,9 +182,27 @@ const ttsClient = new textToSpeech.TextToSpeechClient({
 
 // Function to download image from URL
 async function downloadImage(url, outputPath) {
-  const response = await fetch(url);
+  const cacheKey = AssetCache.key('image', url);
+  const cached = assetCache?.entry(cacheKey);
+
+  // Without an ETag the URL is trusted as-is; with one, a 304 means "still current"
+  if (cached && !cached.etag && await assetCache.getFile(cacheKey, outputPath)) {
+    return outputPath;
+  }
+  const headers = cached?.etag ? { 'If-None-Match': cached.etag } : {};
+  let response = await fetch(url, { headers });
+  if (response.status === 304) {
+    if (await assetCache.getFile(cacheKey, outputPath)) {
+      return outputPath;
+    }
+    response = await fetch(url);
+  }
+
   const buffer = await response.arrayBuffer();
   await fs.writeFile(outputPath, Buffer.from(buffer));
+  if (assetCache && response.ok) {
+    await assetCache.putFile(cacheKey, outputPath, { etag: response.headers.get('etag') });
+  }
   return outputPath;
 }
 
@@ -109,8 +236,14 @@ async function fetchQuestionsFromAPI(apiUrl) {
 
 // Function to generate narrative versions using Groq
 async function generateNarrative(question, correctAnswer, correctAnswerIndex = -1) {
+  const cacheKey = AssetCache.key('narrative', NARRATIVE_MODEL, NARRATIVE_PROMPT_VERSION, question, correctAnswer, correctAnswerIndex);
+  const cached = await assetCache?.getJson(cacheKey);
+  if (cached) {
+    return cached;
+  }
+
   // Apply rate limiting
-  await rateLimitedDelay();
+  await groqLimiter();
   
   let prompt;
   
@@ -157,7 +290,7 @@ Return ONLY a JSON object with this format:
       'Content-Type': 'application/json'
     },
     body: JSON.stringify({
-      model: 'llama-3.1-8b-instant',
+      model: NARRATIVE_MODEL,
       messages: [
         {
           role: 'system',
@@ -183,10 +316,12 @@ Return ONLY a JSON object with this format:
   const parsed = JSON.parse(content);
   
   // Return question as-is, only modify answer
-  return {
+  const narrative = {
     questionNarrative: question,
     answerNarrative: parsed.answerNarrative
   };
+  await assetCache?.putJson(cacheKey, narrative);
+  return narrative;
 }
 
 // Function to generate audio using Google TTS
@@ -204,8 +339,16 @@ async function generateAudio(text, outputPath, voiceName = 'en-US-Chirp3-HD-Ache
     },
   };
 
+  // The full request (text, voice, audio config) identifies the audio
+  const cacheKey = AssetCache.key('tts', request);
+  if (await assetCache?.getFile(cacheKey, outputPath)) {
+    console.log(`Audio reused from cache: ${outputPath}`);
+    return outputPath;
+  }
+
   const [response] = await ttsClient.synthesizeSpeech(request);
   await fs.writeFile(outputPath, response.audioContent, 'binary');
+  await assetCache?.putFile(cacheKey, outputPath);
   console.log(`Audio saved to ${outputPath}`);
   return outputPath;
 }
@@ -215,8 +358,8 @@ async function renderQuiz() {
   console.log('Starting quiz generation...\n');
 
   try {
-    // Ask for quiz name
-    const quizName = await askQuestion('Enter quiz name (e.g., geography-quiz): ');
+    // Ask for quiz name unless given with --name
+    const quizName = quizNameArg || await askQuestion('Enter quiz name (e.g., geography-quiz): ');
     if (!quizName || quizName.trim() === '') {
       console.error('❌ Quiz name is required!');
       process.exit(1);
@@ -258,61 +401,63 @@ async function renderQuiz() {
       questions = await fetchQuestionsFromAPI(apiUrl.trim());
     }
 
+    if (assetCache) {
+      await assetCache.load();
+    }
+
     // Process each question to generate assets first
     console.log('Generating all assets before bundling...\n');
-    for (let i = 0; i < questions.length; i++) {
-      const q = questions[i];
+    // Questions are processed concurrently: each backend (Groq, TTS, image
+    // downloads) has its own limit, so downloads and TTS overlap with LLM calls
+    let assetsReady = 0;
+    await Promise.all(questions.map(async (q, i) => {
       const questionNumber = i + 1;
-      console.log(`\n========== Generating Assets for Question ${questionNumber}/${questions.length} ==========`);
-      console.log(`Question: ${q.question}`);
-      console.log(`Correct Answer: ${q.answers[q.correctAnswerIndex]}\n`);
-
-      // 2. Generate narrative versions using AI
-      console.log('2. Generating narrative versions with AI...');
-      const narrative = await generateNarrative(q.question, q.answers[q.correctAnswerIndex], q.correctAnswerIndex);
-      console.log(`Question Narrative: ${narrative.questionNarrative}`);
-      console.log(`Answer Narrative: ${narrative.answerNarrative}\n`);
-
-      // Download images
-      console.log('3. Downloading images...');
-      const questionImageFilename = `question-${questionNumber}.jpg`;
-      const answerImageFilename = `answer-${questionNumber}.jpg`;
-      const questionImagePath = path.join(quizPublicPath, questionImageFilename);
-      const answerImagePath = path.join(quizPublicPath, answerImageFilename);
-      await downloadImage(q.questionImage, questionImagePath);
-      await downloadImage(q.answerImage, answerImagePath);
-      console.log('Images downloaded\n');
-
-      // 4. Generate audio using Google TTS
-      console.log('4. Generating audio with Google Cloud TTS...');
-      const questionAudioFilename = `question-${questionNumber}.mp3`;
-      const answerAudioFilename = `answer-${questionNumber}.mp3`;
-      const questionAudioPath = path.join(quizPublicPath, questionAudioFilename);
-      const answerAudioPath = path.join(quizPublicPath, answerAudioFilename);
-      await generateAudio(narrative.questionNarrative, questionAudioPath);
-      await generateAudio(narrative.answerNarrative, answerAudioPath);
-      console.log('Audio files generated\n');
+      const tag = `[Q${questionNumber}]`;
+      const correctAnswer = q.answers[q.correctAnswerIndex];
+      console.log(`${tag} Question: ${q.question}`);
+      console.log(`${tag} Correct Answer: ${correctAnswer}`);
+
+      const questionImagePath = path.join(quizPublicPath, `question-${questionNumber}.jpg`);
+      const answerImagePath = path.join(quizPublicPath, `answer-${questionNumber}.jpg`);
+      const questionAudioPath = path.join(quizPublicPath, `question-${questionNumber}.mp3`);
+      const answerAudioPath = path.join(quizPublicPath, `answer-${questionNumber}.mp3`);
+
+      // Images and the question audio don't depend on the AI narrative
+      const images = Promise.all([
+        imagePool(() => downloadImage(q.questionImage, questionImagePath)),
+        imagePool(() => downloadImage(q.answerImage, answerImagePath)),
+      ]);
+      // The question is narrated as-is
+      const questionAudio = ttsPool(() => generateAudio(q.question, questionAudioPath));
+
+      const narrative = await generateNarrative(q.question, correctAnswer, q.correctAnswerIndex);
+      console.log(`${tag} Answer Narrative: ${narrative.answerNarrative}`);
+      const answerAudio = ttsPool(() => generateAudio(narrative.answerNarrative, answerAudioPath));
+
+      await Promise.all([images, questionAudio, answerAudio]);
+      assetsReady++;
+      console.log(`${tag} ✅ Assets ready (${assetsReady}/${questions.length})`);
+    }));
+
+    console.log('\n✅ All assets generated!');
+    if (assetCache) {
+      await assetCache.flush();
+      console.log(`♻️  Asset cache: ${assetCache.hits} reused, ${assetCache.stored} generated\n`);
+    } else {
+      console.log();
     }
 
-    console.log('\n✅ All assets generated!\n');
-
-    // Bundle Remotion project once (reuse for all renders)
-    console.log('Bundling Remotion project...');
-    const bundleLocation = await bundle({
-      entryPoint: path.resolve(__dirname, './src/index.ts'),
-      webpackOverride: (config) => config,
-      publicDir: path.resolve(__dirname, './public'),
-    });
-    console.log('Bundle complete!\n');
-
     const bgColors = ['#239df3', '#de60a3', '#1daa88', '#f78f6e'];
 
-    // Now render each question
-    for (let i = 0; i < questions.length; i++) {
-      const q = questions[i];
-      const questionNumber = i + 1;
-      console.log(`\n========== Rendering Question ${questionNumber}/${questions.length} ==========`);
+    // Work out which clips actually need rendering. A clip is reused when its
+    // inputProps, the assets they point at, the composition and the bundle
+    // inputs are all unchanged since it was last rendered.
+    const renderManifest = new RenderManifest(quizOutputPath);
+    await renderManifest.load();
+    const bundleHash = await RenderManifest.hashBundleInputs(__dirname, BUNDLE_INPUTS);
 
+    const clips = await Promise.all(questions.map(async (q, i) => {
+      const questionNumber = i + 1;
       const inputProps = {
         questionNumber,
         questionText: q.question,
@@ -330,27 +475,114 @@ async function renderQuiz() {
         inputProps.correctAnswerIndex = q.correctAnswerIndex;
       }
 
+      // *Src props are paths into public/, so hash what they point at
+      const assetHashes = {};
+      for (const [key, value] of Object.entries(inputProps)) {
+        if (key.endsWith('Src')) {
+          assetHashes[key] = await RenderManifest.hashFile(path.join(__dirname, 'public', value));
+        }
+      }
+
+      const fileName = `question-${questionNumber}.mp4`;
+      const hash = RenderManifest.hash(
+        compositionId, bundleHash, inputProps, assetHashes, KEYFRAME_INTERVAL_SECONDS,
+      );
+      return { questionNumber, inputProps, fileName, hash };
+    }));
+
+    const pending = [];
+    for (const clip of clips) {
+      if (!forceRender && await renderManifest.isCurrent(clip.fileName, clip.hash)) {
+        renderManifest.reused++;
+        console.log(`[Q${clip.questionNumber}] ♻️  Unchanged, reusing ${clip.fileName}`);
+      } else {
+        pending.push(clip);
+      }
+    }
+    renderManifest.prune(clips.map(clip => clip.fileName));
+    await renderManifest.save();
+
+    if (pending.length === 0) {
+      console.log(`\n♻️  All ${clips.length} clips are up to date, nothing to render`);
+      return;
+    }
+    console.log(`\n🎬 Rendering ${pending.length} clip(s), reusing ${renderManifest.reused}\n`);
+
+    // Bundle Remotion project once (reuse for all renders)
+    console.log('Bundling Remotion project...');
+    const bundleLocation = await bundle({
+      entryPoint: path.resolve(__dirname, './src/index.ts'),
+      webpackOverride: (config) => config,
+      publicDir: path.resolve(__dirname, './public'),
+    });
+    console.log('Bundle complete!\n');
+
+    // Render the pending clips on RENDER_WORKERS concurrent renders, each
+    // pulling the next one. Remotion's own frame concurrency is divided
+    // between them so the machine is not oversubscribed.
+    const renderWorkers = Math.min(RENDER_WORKERS, pending.length);
+    const concurrencyPerWorker = renderWorkers > 1
+      ? Math.max(1, Math.floor(os.cpus().length / renderWorkers))
+      : null; // single render keeps Remotion's default
+    if (renderWorkers > 1) {
+      console.log(`Rendering on ${renderWorkers} workers (concurrency ${concurrencyPerWorker} each)`);
+    }
+
+    const renderClip = async ({ questionNumber, inputProps, fileName, hash }) => {
+      const tag = `[Q${questionNumber}]`;
+      console.log(`\n========== Rendering Question ${questionNumber}/${questions.length} ==========`);
+
       const composition = await selectComposition({
         serveUrl: bundleLocation,
         id: compositionId,
         inputProps,
       });
 
-      const outputPath = path.join(quizOutputPath, `question-${questionNumber}.mp4`);
+      const outputPath = path.join(quizOutputPath, fileName);
+      const clipStart = Date.now();
       await renderMedia({
         composition,
         serveUrl: bundleLocation,
         codec: 'h264',
         outputLocation: outputPath,
         inputProps,
+        ...(concurrencyPerWorker ? { concurrency: concurrencyPerWorker } : {}),
+        ffmpegOverride: ({ args }) => {
+          if (!args.includes('libx264')) {
+            return args;
+          }
+          // Encoder options have to go before the output path (last argument)
+          const gop = String(composition.fps * KEYFRAME_INTERVAL_SECONDS);
+          return [...args.slice(0, -1), '-g', gop, args[args.length - 1]];
+        },
       });
 
-      console.log(`✅ Video rendered: ${outputPath}\n`);
-    }
+      // Recorded per clip so an interrupted run keeps what it finished
+      await renderManifest.record(fileName, hash);
+      const wallSeconds = (Date.now() - clipStart) / 1000;
+      await logRunEvent('clip', {
+        file: fileName,
+        frames: composition.durationInFrames,
+        wall_s: wallSeconds,
+        fps: composition.durationInFrames / wallSeconds,
+        output_bytes: (await fs.stat(outputPath)).size,
+      });
+      console.log(`${tag} ✅ Video rendered: ${outputPath} (${renderManifest.rendered}/${pending.length})\n`);
+    };
+
+    let nextClip = 0;
+    const renderWorker = async () => {
+      while (nextClip < pending.length) {
+        await renderClip(pending[nextClip++]);
+      }
+    };
+    await Promise.all(Array.from({ length: renderWorkers }, renderWorker));
 
-    console.log('\n🎉 All videos rendered successfully!');
+    console.log(`\n🎉 All videos rendered successfully! (${renderManifest.rendered} rendered, ${renderManifest.reused} reused)`);
   } catch (err) {
     console.error('❌ Error:', err);
+    // Keep the assets that were generated before the failure
+    await assetCache?.flush().catch(() => {});
     process.exit(1);
   }
 }
@@ -0,0 +1,466 @@
+"""
+Resumable, chunked video uploads with retries (used by publish.py).
+
+Uploads are sent in fixed-size chunks read straight from the file. Connection
+errors and 5xx/429 responses are retried with exponential backoff, and the
+upload session is saved next to the video (<video>_<platform>_upload.json)
+after every chunk the server acknowledges, so a publish.py that crashed or
+was killed carries on from the last acknowledged byte on its next run.
+
+Uploads running at the same time can share a BandwidthLimiter that caps
+their combined rate and splits it evenly between them.
+
+The endpoints can be overridden (YOUTUBE_UPLOAD_ENDPOINT, FACEBOOK_GRAPH_URL)
+to test against a local server that implements the same protocol, like the
+stand-ins in tests/mock_upload_server.py (`python -m pytest tests`).
+"""
+
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+import requests
+
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+# YouTube wants every chunk but the last to be a multiple of 256 KB
+YOUTUBE_CHUNK_ALIGN = 256 * 1024
+YOUTUBE_UPLOAD_ENDPOINT = os.getenv('YOUTUBE_UPLOAD_ENDPOINT', 'https://www.googleapis.com/upload/youtube/v3/videos')
+FACEBOOK_GRAPH_URL = os.getenv('FACEBOOK_GRAPH_URL', 'https://graph-video.facebook.com/v18.0')
+# Graph API error subcode for a transfer at the wrong offset; error_data has the right one
+FACEBOOK_OFFSET_MISMATCH = 1363037
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRIES = int(os.getenv('UPLOAD_MAX_RETRIES', 8))
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 64.0
+# (connect, read) timeouts; the read timeout has to cover one chunk on a slow link
+REQUEST_TIMEOUT = (15, 300)
+# Upload sessions stay valid for about a week; start over well before that
+SESSION_MAX_AGE = 5 * 24 * 3600
+# Give up on a growing file that has not grown (nor finished) for this long
+FOLLOW_IDLE_TIMEOUT = float(os.getenv('UPLOAD_FOLLOW_TIMEOUT', 600))
+FOLLOW_POLL_SECONDS = 1.0
+
+class UploadError(Exception):
+    """Upload failed for good (non-retryable response or retries exhausted)"""
+
+class SessionExpired(UploadError):
+    """The saved upload session is no longer known to the server"""
+
+class OffsetMismatch(UploadError):
+    """Facebook expected a chunk at another offset (given in error_data)"""
+
+    def __init__(self, message, error_data):
+        super().__init__(message)
+        self.error_data = error_data
+
+def chunk_size_from_env(name, default=DEFAULT_CHUNK_SIZE):
+    """Chunk size in bytes from an env var given in MB"""
+    value = os.getenv(name)
+    return int(float(value) * 1024 * 1024) if value else default
+
+def backoff_delay(attempt):
+    """Exponential backoff with full jitter: up to 1, 2, 4, ... BACKOFF_MAX seconds"""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1)))
+
+def request_with_retries(session, method, url, description, max_retries=MAX_RETRIES, retryable=None, **kwargs):
+    """Send a request, retrying connection errors and retryable statuses.
+
+    retryable(response) can flag more responses as temporary failures by
+    returning an error message (None otherwise). Returns the first response
+    that is not retried; raises UploadError once the retries are used up.
+    """
+    kwargs.setdefault('timeout', REQUEST_TIMEOUT)
+    for attempt in range(1, max_retries + 2):
+        try:
+            response = session.request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = str(e)
+        else:
+            if response.status_code in RETRY_STATUSES:
+                error = f"HTTP {response.status_code}"
+            else:
+                error = retryable(response) if retryable else None
+                if error is None:
+                    return response
+        if attempt > max_retries:
+            break
+        delay = backoff_delay(attempt)
+        print(f"  ⚠️  {description} failed ({error}), retry {attempt}/{max_retries} in {delay:.1f}s")
+        time.sleep(delay)
+    raise UploadError(f"{description} failed after {max_retries} retries: {error}")
+
+def facebook_error(response):
+    """The Graph API error object of a response ({} if there is none)"""
+    try:
+        body = response.json()
+    except ValueError:
+        return {}
+    return (body.get('error') or {}) if isinstance(body, dict) else {}
+
+def facebook_transient_error(response):
+    """Message of an error the Graph API flags as temporary (throttling, backend hiccups), else None"""
+    error = facebook_error(response)
+    return error.get('message', 'transient error') if error.get('is_transient') else None
+
+class BandwidthLimiter:
+    """Caps the combined rate of every upload sharing it.
+
+    Bytes are booked in small slices on a shared clock before each request
+    is sent, so concurrent uploads take turns and each gets an even share.
+    The rate is bounded per chunk on average; smaller chunks pace more
+    smoothly.
+    """
+
+    SLICE_BYTES = 256 * 1024
+
+    def __init__(self, bytes_per_second):
+        self.rate = bytes_per_second
+        self.lock = threading.Lock()
+        self.next_free = time.monotonic()
+
+    def consume(self, size):
+        """Block until `size` more bytes fit under the limit"""
+        while size > 0:
+            part = min(size, self.SLICE_BYTES)
+            size -= part
+            with self.lock:
+                # No credit for idle time, so a paused upload can't burst
+                slot = max(time.monotonic(), self.next_free)
+                self.next_free = slot + part / self.rate
+            delay = slot - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+class GrowingFile:
+    """A video another process is still writing (publish.py --follow).
+
+    The writer leaves done_path (holding the final size) once the file is
+    complete, or failed_path if it gave up.
+    """
+
+    def __init__(self, path, done_path, failed_path, idle_timeout=FOLLOW_IDLE_TIMEOUT):
+        self.path = path
+        self.done_path = done_path
+        self.failed_path = failed_path
+        self.idle_timeout = idle_timeout
+
+    def size(self):
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def final_size(self):
+        """Size of the finished file, or None while it is still being written"""
+        if os.path.exists(self.failed_path):
+            raise UploadError(f"Writing {self.path} failed")
+        try:
+            with open(self.done_path) as f:
+                return int(f.read().strip())
+        except (OSError, ValueError):
+            return None
+
+    def wait(self, size):
+        """Block until the file has `size` bytes or is finished; returns (bytes available, final size or None)"""
+        last_size, last_change = -1, time.time()
+        while True:
+            final = self.final_size()
+            if final is not None:
+                return final, final
+            current = self.size()
+            if current >= size:
+                return current, None
+            if current != last_size:
+                last_size, last_change = current, time.time()
+            elif time.time() - last_change > self.idle_timeout:
+                raise UploadError(f"{self.path} stopped growing for {self.idle_timeout:.0f}s")
+            time.sleep(FOLLOW_POLL_SECONDS)
+
+    def wait_finished(self):
+        """Block until the file is complete; returns its size"""
+        return self.wait(float('inf'))[1]
+
+def read_chunk(path, offset, size):
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        return f.read(size)
+
+class UploadState:
+    """Upload session of one video and platform, saved as JSON next to the video"""
+
+    def __init__(self, video_path, platform):
+        self.path = video_path.replace('.mp4', f'_{platform}_upload.json')
+
+    def load(self, fingerprint):
+        """Saved session for this exact file and metadata, or None"""
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get('fingerprint') != fingerprint or time.time() - data.get('created_at', 0) > SESSION_MAX_AGE:
+            return None
+        return data
+
+    def save(self, data):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+def file_fingerprint(path, *extra):
+    """Identifies a file version (and whatever else a session depends on) without hashing it"""
+    stat = os.stat(path)
+    return hashlib.sha1(json.dumps([os.path.abspath(path), stat.st_size, stat.st_mtime_ns, *extra]).encode()).hexdigest()
+
+class YouTubeUpload:
+    """YouTube Data API resumable upload of one video.
+
+    session is a requests.Session that adds authorization (AuthorizedSession
+    for the real API, a plain Session against a local stand-in server).
+    progress(sent, total) is called after every acknowledged chunk.
+
+    With growing (a GrowingFile) the upload starts while the video is still
+    being written: full chunks are sent as soon as they exist and the total
+    size is declared with the last one. Such uploads are not resumed across
+    runs, since the file they started from is gone.
+    """
+
+    label = "YouTube"
+
+    def __init__(self, session, video_path, metadata, chunk_size=DEFAULT_CHUNK_SIZE,
+                 endpoint=YOUTUBE_UPLOAD_ENDPOINT, progress=None, max_retries=MAX_RETRIES, limiter=None,
+                 growing=None):
+        self.session = session
+        self.limiter = limiter
+        self.growing = growing
+        self.video_path = video_path
+        self.metadata = metadata
+        self.chunk_size = max(YOUTUBE_CHUNK_ALIGN, chunk_size // YOUTUBE_CHUNK_ALIGN * YOUTUBE_CHUNK_ALIGN)
+        self.endpoint = endpoint
+        self.progress = progress
+        self.max_retries = max_retries
+        self.state = UploadState(video_path, 'youtube')
+        if growing:
+            self.total = growing.final_size()
+            self.fingerprint = None
+        else:
+            self.total = os.path.getsize(video_path)
+            self.fingerprint = file_fingerprint(video_path, metadata, endpoint)
+
+    @property
+    def declared_total(self):
+        """Total size for Content-Range, '*' while the file is still growing"""
+        return '*' if self.total is None else self.total
+
+    def start_session(self):
+        """Create an upload session; returns its URI"""
+        response = request_with_retries(
+            self.session, 'POST', self.endpoint, f"{self.label}: starting upload session", self.max_retries,
+            params={'uploadType': 'resumable', 'part': ','.join(self.metadata)},
+            json=self.metadata,
+            headers={
+                'X-Upload-Content-Type': 'video/*',
+                **({'X-Upload-Content-Length': str(self.total)} if self.total is not None else {}),
+            },
+        )
+        if response.status_code != 200 or 'Location' not in response.headers:
+            raise UploadError(f"Could not start upload session: HTTP {response.status_code} {response.text[:200]}")
+        session_uri = response.headers['Location']
+        if self.fingerprint:
+            self.state.save({'fingerprint': self.fingerprint, 'session_uri': session_uri, 'created_at': time.time()})
+        return session_uri
+
+    def handle(self, response):
+        """(offset, result) from an upload response; result is the video resource once complete"""
+        if response.status_code in (200, 201):
+            return self.total, response.json()
+        if response.status_code == 308:
+            # Range: bytes=0-N is what the server has; no header means nothing yet
+            received = response.headers.get('Range')
+            return (int(received.rsplit('-', 1)[1]) + 1 if received else 0), None
+        if response.status_code in (404, 410):
+            raise SessionExpired(f"Upload session expired (HTTP {response.status_code})")
+        raise UploadError(f"Upload failed: HTTP {response.status_code} {response.text[:200]}")
+
+    def query_offset(self, session_uri):
+        """Ask the server how much of the file it has"""
+        response = request_with_retries(
+            self.session, 'PUT', session_uri, f"{self.label}: querying upload status", self.max_retries,
+            headers={'Content-Range': f'bytes */{self.declared_total}', 'Content-Length': '0'},
+        )
+        return self.handle(response)
+
+    def send(self, session_uri, offset):
+        """Upload chunks from offset until done; returns the video resource"""
+        attempt = 0
+        while True:
+            if self.growing and self.total is None:
+                # Only whole chunks until the writer is done (the size is declared with the last one)
+                _, self.total = self.growing.wait(offset + self.chunk_size)
+            chunk = read_chunk(self.video_path, offset, self.chunk_size)
+            if not chunk:
+                # Everything was sent before the size was known: just declare it
+                offset, result = self.query_offset(session_uri)
+                if result is None:
+                    raise UploadError(f"{self.label}: server has {offset} of {self.total} bytes after the last chunk")
+                return result
+            headers = {'Content-Range': f'bytes {offset}-{offset + len(chunk) - 1}/{self.declared_total}'}
+            if self.limiter:
+                self.limiter.consume(len(chunk))
+            try:
+                response = self.session.put(session_uri, data=chunk, headers=headers, timeout=REQUEST_TIMEOUT)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = str(e)
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    offset, result = self.handle(response)
+                    attempt = 0
+                    if self.progress:
+                        self.progress(offset, self.total or self.growing.size())
+                    if result is not None:
+                        return result
+                    continue
+                error = f"HTTP {response.status_code}"
+
+            attempt += 1
+            if attempt > self.max_retries:
+                raise UploadError(f"{self.label}: chunk at byte {offset} failed after {self.max_retries} retries: {error}")
+            delay = backoff_delay(attempt)
+            print(f"  ⚠️  {self.label}: chunk at byte {offset} failed ({error}), retry {attempt}/{self.max_retries} in {delay:.1f}s")
+            time.sleep(delay)
+            # The server may have kept part of the chunk
+            offset, result = self.query_offset(session_uri)
+            if result is not None:
+                return result
+
+    def run(self):
+        """Upload the video, resuming a saved session if there is one; returns the video resource"""
+        saved = self.state.load(self.fingerprint) if self.fingerprint else None
+        if saved:
+            try:
+                offset, result = self.query_offset(saved['session_uri'])
+                print(f"  ↩️  {self.label}: resuming upload at {offset / (1024 * 1024):.1f} MB of {self.total / (1024 * 1024):.1f} MB")
+                if result is None:
+                    result = self.send(saved['session_uri'], offset)
+                self.state.clear()
+                return result
+            except SessionExpired:
+                print(f"  {self.label}: saved upload session expired, starting over")
+
+        result = self.send(self.start_session(), 0)
+        if self.fingerprint:
+            self.state.clear()
+        return result
+
+class FacebookUpload:
+    """Graph API chunked (start / transfer / finish) upload of one video.
+
+    The server decides the byte range it wants next; chunk_size only caps
+    how much of it goes into a single request. progress(sent, total) is
+    called after every acknowledged chunk.
+    """
+
+    label = "Facebook"
+
+    def __init__(self, video_path, access_token, params, chunk_size=DEFAULT_CHUNK_SIZE,
+                 graph_url=FACEBOOK_GRAPH_URL, node='me', progress=None, max_retries=MAX_RETRIES,
+                 session=None, limiter=None):
+        self.video_path = video_path
+        self.limiter = limiter
+        self.access_token = access_token
+        self.params = params
+        self.total = os.path.getsize(video_path)
+        self.chunk_size = chunk_size
+        self.url = f"{graph_url.rstrip('/')}/{node}/videos"
+        self.progress = progress
+        self.max_retries = max_retries
+        self.session = session or requests.Session()
+        self.state = UploadState(video_path, 'facebook')
+        self.fingerprint = file_fingerprint(video_path, params, self.url)
+
+    def post(self, description, data, files=None):
+        """POST one upload phase; returns the JSON response or raises UploadError"""
+        response = request_with_retries(
+            self.session, 'POST', self.url, description, self.max_retries,
+            retryable=facebook_transient_error, data={'access_token': self.access_token, **data}, files=files
+        )
+        error = facebook_error(response)
+        if response.status_code == 200 and not error:
+            try:
+                return response.json()
+            except ValueError:
+                raise UploadError(f"{description} failed: unreadable response {response.text[:200]}")
+        message = f"{description} failed: HTTP {response.status_code} {error.get('message', response.text[:200])}"
+        if error.get('error_subcode') == FACEBOOK_OFFSET_MISMATCH:
+            error_data = error.get('error_data') or {}
+            raise OffsetMismatch(message, json.loads(error_data) if isinstance(error_data, str) else error_data)
+        raise UploadError(message)
+
+    def save_state(self, session_id, video_id, start, end):
+        self.state.save({
+            'fingerprint': self.fingerprint,
+            'upload_session_id': session_id,
+            'video_id': video_id,
+            'start_offset': start,
+            'end_offset': end,
+            'created_at': self.created_at,
+        })
+
+    def start(self):
+        body = self.post(f"{self.label}: starting upload session", {'upload_phase': 'start', 'file_size': self.total})
+        self.created_at = time.time()
+        session_id, video_id = body['upload_session_id'], body['video_id']
+        start, end = int(body['start_offset']), int(body['end_offset'])
+        self.save_state(session_id, video_id, start, end)
+        return session_id, video_id, start, end
+
+    def transfer(self, session_id, video_id, start, end):
+        """Send chunks until the server has the whole file"""
+        while start < end:
+            chunk = read_chunk(self.video_path, start, min(end - start, self.chunk_size))
+            if self.limiter:
+                self.limiter.consume(len(chunk))
+            try:
+                body = self.post(
+                    f"{self.label}: chunk at byte {start}",
+                    {'upload_phase': 'transfer', 'upload_session_id': session_id, 'start_offset': start},
+                    files={'video_file_chunk': ('chunk', chunk, 'application/octet-stream')},
+                )
+            except OffsetMismatch as e:
+                # The server has a different offset (e.g. a resumed session): continue from it
+                body = e.error_data
+                if 'start_offset' not in body:
+                    raise
+            start, end = int(body['start_offset']), int(body['end_offset'])
+            self.save_state(session_id, video_id, start, end)
+            if self.progress:
+                self.progress(start if start < end else self.total, self.total)
+
+    def run(self):
+        """Upload and publish the video, resuming a saved session if there is one; returns the video ID"""
+        saved = self.state.load(self.fingerprint)
+        if saved:
+            self.created_at = saved['created_at']
+            session_id, video_id = saved['upload_session_id'], saved['video_id']
+            start, end = saved['start_offset'], saved['end_offset']
+            print(f"  ↩️  {self.label}: resuming upload at {start / (1024 * 1024):.1f} MB of {self.total / (1024 * 1024):.1f} MB")
+            try:
+                self.transfer(session_id, video_id, start, end)
+            except UploadError as e:
+                print(f"  {self.label}: saved upload session could not be resumed ({e}), starting over")
+                saved = None
+        if not saved:
+            session_id, video_id, start, end = self.start()
+            self.transfer(session_id, video_id, start, end)
+
+        self.post(f"{self.label}: finishing upload", {'upload_phase': 'finish', 'upload_session_id': session_id, **self.params})
+        self.state.clear()
+        return video_id
@@ -0,0 +1,178 @@
+"""
+Structured run log (JSON lines) for the video pipeline.
+
+Every stage main.py runs (render, join, publish) appends one "stage" event
+with its wall time, CPU time, peak RSS and block I/O, measured on the stage's
+process tree. The stage scripts add their own events (frames encoded,
+segments rendered, ...) through emit(), which finds the log, run id, stage
+and quiz in the environment main.py hands them.
+
+The log defaults to logs/run_log.jsonl and can be moved with QUIZ_RUN_LOG.
+`main.py --profile` prints a per-stage summary of the current run.
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import socket
+import subprocess
+from datetime import datetime
+
+RUN_LOG_ENV = "QUIZ_RUN_LOG"
+RUN_ID_ENV = "QUIZ_RUN_ID"
+RUN_STAGE_ENV = "QUIZ_RUN_STAGE"
+RUN_QUIZ_ENV = "QUIZ_RUN_QUIZ"
+DEFAULT_RUN_LOG = os.path.join("logs", "run_log.jsonl")
+
+# ru_maxrss is in kilobytes on Linux and in bytes on macOS
+MAXRSS_BYTES = 1 if sys.platform == 'darwin' else 1024
+# ru_inblock / ru_oublock count 512-byte blocks of real storage I/O
+BLOCK_BYTES = 512
+
+def start_run():
+    """Set up the run log for this process and its children; returns the run id"""
+    # Absolute, so children started in another directory write to the same file
+    os.environ[RUN_LOG_ENV] = os.path.abspath(os.environ.get(RUN_LOG_ENV) or DEFAULT_RUN_LOG)
+    os.environ.setdefault(RUN_ID_ENV, f"{datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:6]}")
+    return os.environ[RUN_ID_ENV]
+
+def run_log_path():
+    return os.environ.get(RUN_LOG_ENV)
+
+def emit(event, **fields):
+    """Append one event to the run log (no-op when no run log is set up).
+
+    stage and quiz default to the ones main.py set for this process. Each
+    event is a single O_APPEND write, so concurrent stages never interleave.
+    """
+    path = run_log_path()
+    if not path:
+        return
+    record = {
+        'event': event,
+        'run_id': os.environ.get(RUN_ID_ENV),
+        'stage': os.environ.get(RUN_STAGE_ENV),
+        'quiz': os.environ.get(RUN_QUIZ_ENV),
+        'time': time.time(),
+        'pid': os.getpid(),
+        'host': socket.gethostname(),
+    }
+    record.update(fields)
+    line = json.dumps(record) + "\n"
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line.encode())
+        finally:
+            os.close(fd)
+    except OSError as e:
+        print(f"⚠️  Could not write run log {path}: {e}")
+
+def wait_measured(proc):
+    """Wait for a Popen child; returns (exit code, resource usage of its process tree).
+
+    The child is reaped with os.wait4, so the usage covers exactly this
+    process and everything it waited for (ffmpeg, node, ...) even when
+    several children run on threads at once. Usage is {} where wait4 is
+    not available.
+    """
+    if not hasattr(os, 'wait4'):
+        return proc.wait(), {}
+    try:
+        _, status, usage = os.wait4(proc.pid, 0)
+    except BaseException:
+        proc.kill()
+        proc.wait()
+        raise
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return proc.returncode, {
+        'cpu_s': round(usage.ru_utime + usage.ru_stime, 3),
+        'peak_rss_bytes': usage.ru_maxrss * MAXRSS_BYTES,
+        'read_bytes': usage.ru_inblock * BLOCK_BYTES,
+        'write_bytes': usage.ru_oublock * BLOCK_BYTES,
+    }
+
+def run_measured(cmd, stage, quiz=None, **popen_kwargs):
+    """Run cmd like subprocess.run and log a "stage" event for it; returns the exit code"""
+    env = dict(popen_kwargs.pop('env', None) or os.environ)
+    env[RUN_STAGE_ENV] = stage
+    if quiz:
+        env[RUN_QUIZ_ENV] = quiz
+
+    start = time.time()
+    returncode, usage = wait_measured(subprocess.Popen(cmd, env=env, **popen_kwargs))
+    end = time.time()
+
+    fields = {
+        'start': start,
+        'end': end,
+        'wall_s': round(end - start, 3),
+        'returncode': returncode,
+        'ok': returncode == 0,
+        'cmd': [str(part) for part in cmd],
+        **usage,
+    }
+    if quiz:
+        fields['quiz'] = quiz
+    emit('stage', stage=stage, **fields)
+    return returncode
+
+def load_events(path=None, run_id=None):
+    """Events in the run log, optionally only those of one run"""
+    path = path or run_log_path() or DEFAULT_RUN_LOG
+    events = []
+    try:
+        with open(path) as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    # Torn last line of a crashed run
+                    continue
+                if run_id is None or event.get('run_id') == run_id:
+                    events.append(event)
+    except OSError:
+        pass
+    return events
+
+def print_profile(events):
+    """Per stage (and quiz) table of wall time, CPU, peak RSS, I/O and frames"""
+    stages = [e for e in events if e['event'] == 'stage']
+    if not stages:
+        print("No stage events recorded")
+        return
+
+    frames = {}
+    for e in events:
+        if e.get('frames'):
+            key = (e.get('quiz'), e.get('stage'))
+            frames[key] = frames.get(key, 0) + e['frames']
+
+    def cell(value, spec, width, unit=""):
+        text = f"{value:{spec}}{unit}" if value is not None else "-"
+        return f"{text:>{width}}"
+
+    mb = 1024 * 1024
+    print(f"\n{'Quiz':<24}{'Stage':<10}{'Wall':>9}{'CPU':>9}{'CPU/Wall':>10}"
+          f"{'Peak RSS':>11}{'Read':>11}{'Written':>11}{'Frames':>9}{'fps':>8}")
+    for e in stages:
+        n = frames.get((e.get('quiz'), e['stage']), 0)
+        wall = e['wall_s']
+        cpu = e.get('cpu_s')
+        rss, read, written = (e[key] / mb if key in e else None
+                              for key in ('peak_rss_bytes', 'read_bytes', 'write_bytes'))
+        print(
+            f"{(e.get('quiz') or '-')[:23]:<24}{e['stage']:<10}"
+            + cell(wall, '.1f', 9, 's')
+            + cell(cpu, '.1f', 9, 's')
+            + cell(cpu / wall if cpu is not None and wall else None, '.2f', 10)
+            + cell(rss, '.0f', 11, ' MB')
+            + cell(read, '.0f', 11, ' MB')
+            + cell(written, '.0f', 11, ' MB')
+            + cell(n or None, 'd', 9)
+            + cell(n / wall if n and wall else None, '.1f', 8)
+            + ("" if e['ok'] else "  FAILED")
+        )
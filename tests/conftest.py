@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+
+# The pipeline modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_upload_server import MockYouTubeServer, MockGraphServer
+
+@pytest.fixture
+def youtube():
+    with MockYouTubeServer() as server:
+        yield server
+
+@pytest.fixture
+def graph():
+    with MockGraphServer() as server:
+        yield server
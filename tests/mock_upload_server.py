@@ -0,0 +1,244 @@
+"""
+Local stand-ins for the upload APIs resumable_upload.py talks to.
+
+MockYouTubeServer speaks the YouTube Data API resumable upload protocol:
+a POST starts a session (Location header), PUTs with Content-Range carry
+chunks, and `bytes */total` queries answer 308 with the Range received so
+far. Point YouTubeUpload(endpoint=server.endpoint) (or
+YOUTUBE_UPLOAD_ENDPOINT) at it.
+
+MockGraphServer speaks the Graph API chunked video upload: start, transfer
+and finish phases POSTed to /<node>/videos, with the server choosing the
+byte range of every chunk. Point FacebookUpload(graph_url=server.graph_url)
+(or FACEBOOK_GRAPH_URL) at it.
+
+Faults appended to server.faults are applied, in order, to the next chunk
+requests: None passes, an int status is returned without keeping the
+chunk, 'partial' (YouTube) keeps half the chunk and drops the connection,
+and 'transient' (Graph) answers with an error flagged is_transient.
+"""
+
+import re
+import json
+import itertools
+import threading
+from email.parser import BytesParser
+from email.policy import HTTP
+from urllib.parse import parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class MockHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    @property
+    def mock(self):
+        return self.server.mock
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def reply(self, status, body=None, headers=None):
+        data = json.dumps(body).encode() if body is not None else b''
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if body is not None:
+            self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+class MockServer:
+    """Serves `handler` on a free localhost port from a background thread (use as a context manager)"""
+
+    handler = MockHandler
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.faults = []
+        # (method, detail) of every request, in arrival order
+        self.requests = []
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), self.handler)
+        self.httpd.mock = self
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.httpd.server_port}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def record(self, method, detail):
+        with self.lock:
+            self.requests.append((method, detail))
+
+    def next_fault(self):
+        with self.lock:
+            return self.faults.pop(0) if self.faults else None
+
+# ==================== YOUTUBE ====================
+
+class YouTubeHandler(MockHandler):
+    def do_POST(self):
+        self.read_body()
+        session_id = self.mock.new_session()
+        self.mock.record('POST', self.path)
+        self.reply(200, headers={'Location': f"{self.mock.url}/upload/session/{session_id}"})
+
+    def do_PUT(self):
+        body = self.read_body()
+        content_range = self.headers.get('Content-Range', '')
+        self.mock.record('PUT', content_range)
+        received = self.mock.sessions.get(self.path.rsplit('/', 1)[-1])
+        match = re.match(r'bytes (\*|(\d+)-(\d+))/(\*|\d+)$', content_range)
+        if received is None:
+            return self.reply(404, {'error': {'message': 'Unknown upload session'}})
+        if not match:
+            return self.reply(400, {'error': {'message': f'Bad Content-Range: {content_range}'}})
+        total = None if match[4] == '*' else int(match[4])
+
+        if match[1] != '*':
+            fault = self.mock.next_fault()
+            if isinstance(fault, int):
+                return self.reply(fault)
+            if int(match[2]) != len(received):
+                return self.reply(400, {'error': {'message': f'Expected a chunk at byte {len(received)}'}})
+            if fault == 'partial':
+                received.extend(body[:len(body) // 2])
+                # No response at all: the client sees a dropped connection
+                self.close_connection = True
+                return
+            received.extend(body)
+
+        if total is not None and len(received) == total:
+            return self.reply(200, {'id': 'mock-video-id', 'kind': 'youtube#video'})
+        self.reply(308, headers={'Range': f'bytes=0-{len(received) - 1}'} if received else None)
+
+class MockYouTubeServer(MockServer):
+    """YouTube resumable upload endpoint at `endpoint`"""
+
+    handler = YouTubeHandler
+
+    def __init__(self):
+        super().__init__()
+        self.ids = itertools.count(1)
+        self.sessions = {}
+
+    @property
+    def endpoint(self):
+        return f"{self.url}/upload/youtube/v3/videos"
+
+    def new_session(self):
+        session_id = str(next(self.ids))
+        self.sessions[session_id] = bytearray()
+        return session_id
+
+    def chunk_ranges(self):
+        """Content-Range of every chunk PUT (status queries left out)"""
+        return [detail for method, detail in self.requests if method == 'PUT' and not detail.startswith('bytes */')]
+
+    def uploaded(self, session_id='1'):
+        return bytes(self.sessions[session_id])
+
+# ==================== FACEBOOK ====================
+
+# Graph API error subcode for a transfer at the wrong offset
+OFFSET_MISMATCH = 1363037
+
+class GraphHandler(MockHandler):
+    def read_form(self):
+        """Fields of a urlencoded or multipart POST (file parts stay bytes)"""
+        body = self.read_body()
+        content_type = self.headers.get('Content-Type', '')
+        if not content_type.startswith('multipart/form-data'):
+            return {name: values[0] for name, values in parse_qs(body.decode()).items()}
+        message = BytesParser(policy=HTTP).parsebytes(f'Content-Type: {content_type}\r\n\r\n'.encode() + body)
+        fields = {}
+        for part in message.iter_parts():
+            value = part.get_payload(decode=True)
+            fields[part.get_param('name', header='content-disposition')] = \
+                value if part.get_filename() else value.decode()
+        return fields
+
+    def error(self, message, status=400, **details):
+        self.reply(status, {'error': {'message': message, 'type': 'OAuthException', **details}})
+
+    def do_POST(self):
+        form = self.read_form()
+        phase = form.get('upload_phase')
+        if form.get('access_token') != self.mock.access_token:
+            return self.error('Invalid OAuth access token', code=190)
+
+        if phase == 'start':
+            self.mock.record('POST', 'start')
+            session_id = self.mock.new_session(int(form['file_size']))
+            return self.reply(200, {'upload_session_id': session_id, 'video_id': f'video-{session_id}',
+                                    **self.mock.next_range(session_id)})
+
+        upload = self.mock.sessions.get(form.get('upload_session_id'))
+        if upload is None:
+            return self.error('Invalid upload session', code=100)
+
+        if phase == 'transfer':
+            start = int(form['start_offset'])
+            self.mock.record('POST', f'transfer {start}')
+            fault = self.mock.next_fault()
+            if isinstance(fault, int):
+                return self.reply(fault)
+            if fault == 'transient':
+                return self.error('Service temporarily unavailable', code=2, is_transient=True)
+            if start != len(upload['data']):
+                return self.error('Start offset mismatch', code=6000, error_subcode=OFFSET_MISMATCH,
+                                  error_data=json.dumps(self.mock.next_range(form['upload_session_id'])))
+            upload['data'].extend(form['video_file_chunk'])
+            return self.reply(200, self.mock.next_range(form['upload_session_id']))
+
+        if phase == 'finish':
+            self.mock.record('POST', 'finish')
+            if len(upload['data']) != upload['size']:
+                return self.error(f"Upload incomplete: {len(upload['data'])} of {upload['size']} bytes", code=6000)
+            upload['finished'] = {name: value for name, value in form.items()
+                                  if name not in ('access_token', 'upload_phase', 'upload_session_id')}
+            return self.reply(200, {'success': True})
+
+        self.error(f'Unknown upload_phase {phase}', code=100)
+
+class MockGraphServer(MockServer):
+    """Graph API video upload at `graph_url`; asks for at most chunk_size bytes per transfer"""
+
+    handler = GraphHandler
+
+    def __init__(self, access_token='mock-token', chunk_size=300 * 1024):
+        super().__init__()
+        self.access_token = access_token
+        self.chunk_size = chunk_size
+        self.ids = itertools.count(1)
+        self.sessions = {}
+
+    @property
+    def graph_url(self):
+        return f"{self.url}/v18.0"
+
+    def new_session(self, size):
+        session_id = str(next(self.ids))
+        self.sessions[session_id] = {'size': size, 'data': bytearray(), 'finished': None}
+        return session_id
+
+    def next_range(self, session_id):
+        """Byte range the server wants next (start == end once it has everything), as Graph strings"""
+        upload = self.sessions[session_id]
+        start = len(upload['data'])
+        return {'start_offset': str(start), 'end_offset': str(min(start + self.chunk_size, upload['size']))}
+
+    def phases(self):
+        return [detail for method, detail in self.requests if method == 'POST']
+
+    def uploaded(self, session_id='1'):
+        return bytes(self.sessions[session_id]['data'])
@@ -0,0 +1,109 @@
+import os
+import sys
+import json
+import pickle
+import subprocess
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+PUBLISH_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'publish.py')
+VIDEO_BYTES = 384 * 1024
+
+@pytest.fixture
+def workdir(tmp_path):
+    """A directory with a video and a saved (unexpired) YouTube token, so no OAuth flow runs"""
+    pytest.importorskip('google.oauth2.credentials')
+    from google.oauth2.credentials import Credentials
+    creds = Credentials(token='mock-token', expiry=datetime.utcnow() + timedelta(hours=1))
+    with open(tmp_path / 'youtube_token.pickle', 'wb') as f:
+        pickle.dump(creds, f)
+    (tmp_path / 'video.mp4').write_bytes(os.urandom(VIDEO_BYTES))
+    return tmp_path
+
+def publish_env(youtube, graph):
+    return dict(
+        os.environ,
+        YOUTUBE_UPLOAD_ENDPOINT=youtube.endpoint,
+        FACEBOOK_GRAPH_URL=graph.graph_url,
+        FACEBOOK_PAGE_ID='mock-page',
+        FACEBOOK_ACCESS_TOKEN=graph.access_token,
+        # A hung follow fails the test instead of waiting out the default
+        UPLOAD_FOLLOW_TIMEOUT='20',
+    )
+
+def publish_command(video, *args):
+    return [sys.executable, PUBLISH_SCRIPT, video, '--youtube', '--facebook', '--chunk-mb', '0.25', *args]
+
+def run_publish(workdir, youtube, graph, *args):
+    return subprocess.run(
+        publish_command('video.mp4', *args),
+        cwd=workdir, env=publish_env(youtube, graph), capture_output=True, text=True, timeout=120,
+    )
+
+def follow_publish(workdir, youtube, graph, data, marker):
+    """Run publish.py --follow on growing.mp4 while appending data to it, then leave the marker"""
+    path = workdir / 'growing.mp4'
+    path.write_bytes(b'')
+    process = subprocess.Popen(
+        publish_command('growing.mp4', '--follow'),
+        cwd=workdir, env=publish_env(youtube, graph), stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+    )
+    piece = 64 * 1024
+    for start in range(0, len(data), piece):
+        with open(path, 'ab') as f:
+            f.write(data[start:start + piece])
+        time.sleep(0.2)
+    (workdir / f'growing.mp4{marker}').write_text(str(len(data)))
+    output, _ = process.communicate(timeout=120)
+    return process.returncode, output
+
+def publish_log(workdir, video='video.mp4'):
+    with open(workdir / video.replace('.mp4', '_publish_log.json')) as f:
+        return {result['platform']: result for result in json.load(f)['platforms']}
+
+def test_publishes_to_both_platforms_under_shared_limit(workdir, youtube, graph):
+    # 2 Mbit/s (250 KB/s) shared by 768 KB of uploads
+    result = run_publish(workdir, youtube, graph, '--max-upload-mbps', '2')
+
+    assert result.returncode == 0, result.stdout + result.stderr
+    video = (workdir / 'video.mp4').read_bytes()
+    assert youtube.uploaded() == video
+    assert graph.uploaded() == video
+
+    log = publish_log(workdir)
+    assert set(log) == {'youtube', 'facebook'}
+    assert log['youtube']['video_id'] == 'mock-video-id'
+    assert log['facebook']['video_id'] == 'video-1'
+    # Bytes are booked before they're sent, so the last slice starts (768 - 256) KB / 250 KB/s in
+    assert max(r['elapsed_s'] for r in log.values()) >= 1.8
+
+def test_failed_platform_does_not_cancel_the_other(workdir, youtube, graph):
+    # Permanent (non-retryable) error on Facebook's first chunk
+    graph.faults = [403]
+    result = run_publish(workdir, youtube, graph, '--max-upload-mbps', '8')
+
+    assert result.returncode == 1
+    assert 'Facebook upload failed' in result.stdout
+    assert youtube.uploaded() == (workdir / 'video.mp4').read_bytes()
+    assert set(publish_log(workdir)) == {'youtube'}
+
+def test_follow_uploads_the_finished_file_to_both_platforms(workdir, youtube, graph):
+    data = os.urandom(VIDEO_BYTES)
+    returncode, output = follow_publish(workdir, youtube, graph, data, '.done')
+
+    assert returncode == 0, output
+    assert youtube.uploaded() == data
+    assert graph.uploaded() == data
+    assert set(publish_log(workdir, 'growing.mp4')) == {'youtube', 'facebook'}
+
+def test_follow_aborts_both_platforms_when_writer_fails(workdir, youtube, graph):
+    start = time.time()
+    returncode, output = follow_publish(workdir, youtube, graph, os.urandom(VIDEO_BYTES), '.failed')
+
+    assert returncode == 1
+    assert output.count('growing.mp4 failed') == 2, output
+    # Well inside UPLOAD_FOLLOW_TIMEOUT: the marker ended it, not the idle timeout
+    assert time.time() - start < 15
+    assert not graph.sessions
@@ -0,0 +1,162 @@
+import os
+import time
+import threading
+
+import pytest
+import requests
+
+import resumable_upload
+from resumable_upload import YouTubeUpload, FacebookUpload, UploadError, GrowingFile
+
+CHUNK = resumable_upload.YOUTUBE_CHUNK_ALIGN
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(resumable_upload, 'backoff_delay', lambda attempt: 0)
+
+@pytest.fixture
+def video(tmp_path):
+    path = tmp_path / 'video.mp4'
+    path.write_bytes(os.urandom(3 * CHUNK + 1000))
+    return str(path)
+
+@pytest.fixture
+def fast_follow(monkeypatch):
+    monkeypatch.setattr(resumable_upload, 'FOLLOW_POLL_SECONDS', 0.02)
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+def youtube_upload(server, video, **kwargs):
+    metadata = {'snippet': {'title': 'Test Quiz'}, 'status': {'privacyStatus': 'private'}}
+    return YouTubeUpload(requests.Session(), video, metadata, chunk_size=CHUNK, endpoint=server.endpoint, **kwargs)
+
+def facebook_upload(server, video, **kwargs):
+    params = {'title': 'Test Quiz', 'description': 'Test yourself!'}
+    return FacebookUpload(video, server.access_token, params, graph_url=server.graph_url, **kwargs)
+
+# ==================== YOUTUBE ====================
+
+def test_youtube_uploads_in_chunks(youtube, video):
+    result = youtube_upload(youtube, video).run()
+
+    assert result['id'] == 'mock-video-id'
+    assert youtube.uploaded() == read(video)
+    assert youtube.chunk_ranges()[0] == f'bytes 0-{CHUNK - 1}/{os.path.getsize(video)}'
+    assert len(youtube.chunk_ranges()) == 4
+
+def test_youtube_resumes_from_range_after_partial_chunk(youtube, video):
+    # The second chunk is half stored, then the connection drops
+    youtube.faults = [None, 'partial']
+    result = youtube_upload(youtube, video).run()
+
+    assert result['id'] == 'mock-video-id'
+    assert youtube.uploaded() == read(video)
+    # The client asked what the server had and carried on from there, not from the chunk start
+    assert ('PUT', f'bytes */{os.path.getsize(video)}') in youtube.requests
+    resumed_at = CHUNK + CHUNK // 2
+    assert any(r.startswith(f'bytes {resumed_at}-') for r in youtube.chunk_ranges())
+
+def test_youtube_retries_503(youtube, video):
+    youtube.faults = [503, 503]
+    result = youtube_upload(youtube, video).run()
+
+    assert result['id'] == 'mock-video-id'
+    assert youtube.uploaded() == read(video)
+    assert [r for r in youtube.chunk_ranges() if r.startswith('bytes 0-')] == [youtube.chunk_ranges()[0]] * 3
+
+def test_youtube_resumes_saved_session_in_next_run(youtube, video):
+    youtube.faults = [None, 503, 503, 503]
+    with pytest.raises(UploadError):
+        youtube_upload(youtube, video, max_retries=2).run()
+    assert os.path.exists(video.replace('.mp4', '_youtube_upload.json'))
+
+    result = youtube_upload(youtube, video).run()
+
+    assert result['id'] == 'mock-video-id'
+    # Same session, continued from the first chunk's end
+    assert [method for method, _ in youtube.requests].count('POST') == 1
+    assert youtube.uploaded() == read(video)
+    assert not os.path.exists(video.replace('.mp4', '_youtube_upload.json'))
+
+def write_growing(path, data, piece_size, fail=False):
+    """Append data to path in pieces from a thread, then leave the .done (or .failed) marker"""
+    def write():
+        for start in range(0, len(data), piece_size):
+            with open(path, 'ab') as f:
+                f.write(data[start:start + piece_size])
+            time.sleep(0.05)
+        with open(path + ('.failed' if fail else '.done'), 'w') as f:
+            f.write(str(len(data)))
+    thread = threading.Thread(target=write)
+    thread.start()
+    return thread
+
+def test_youtube_follows_growing_file(youtube, tmp_path, fast_follow):
+    path = str(tmp_path / 'growing.mp4')
+    data = os.urandom(3 * CHUNK + 1000)
+    writer = write_growing(path, data, CHUNK // 4)
+
+    upload = youtube_upload(youtube, path, growing=GrowingFile(path, path + '.done', path + '.failed', idle_timeout=10))
+    result = upload.run()
+    writer.join()
+
+    assert result['id'] == 'mock-video-id'
+    assert youtube.uploaded() == data == read(path)
+    # Chunks went out before the writer was done; the size came with the last one
+    assert youtube.chunk_ranges()[0] == f'bytes 0-{CHUNK - 1}/*'
+    assert youtube.chunk_ranges()[-1].endswith(f'/{len(data)}')
+
+def test_youtube_follow_aborts_when_writer_fails(youtube, tmp_path, fast_follow):
+    path = str(tmp_path / 'growing.mp4')
+    writer = write_growing(path, os.urandom(CHUNK + 1000), CHUNK // 4, fail=True)
+
+    upload = youtube_upload(youtube, path, growing=GrowingFile(path, path + '.done', path + '.failed', idle_timeout=10))
+    start = time.time()
+    # The .failed marker ends it, not the idle timeout ("stopped growing")
+    with pytest.raises(UploadError, match='failed'):
+        upload.run()
+    writer.join()
+
+    assert time.time() - start < 5
+    assert youtube.uploaded() == read(path)[:CHUNK]
+
+# ==================== FACEBOOK ====================
+
+def test_facebook_uploads_and_finishes(graph, video):
+    video_id = facebook_upload(graph, video).run()
+
+    assert video_id == 'video-1'
+    assert graph.uploaded() == read(video)
+    # The server picked the chunk boundaries
+    transfers = [phase for phase in graph.phases() if phase.startswith('transfer')]
+    assert transfers == [f'transfer {offset}' for offset in range(0, os.path.getsize(video), graph.chunk_size)]
+    assert graph.phases()[-1] == 'finish'
+    assert graph.sessions['1']['finished'] == {'title': 'Test Quiz', 'description': 'Test yourself!'}
+    assert not os.path.exists(video.replace('.mp4', '_facebook_upload.json'))
+
+def test_facebook_retries_transient_error(graph, video):
+    graph.faults = ['transient', 503]
+    video_id = facebook_upload(graph, video).run()
+
+    assert video_id == 'video-1'
+    assert graph.uploaded() == read(video)
+    assert graph.phases().count('transfer 0') == 3
+
+def test_facebook_retries_are_not_nested(graph, video):
+    # Transient bodies and 5xx statuses share one retry budget per chunk
+    graph.faults = [503, 'transient'] * 5
+    with pytest.raises(UploadError):
+        facebook_upload(graph, video, max_retries=2).run()
+
+    assert graph.phases().count('transfer 0') == 3
+
+def test_facebook_resumes_saved_session_in_next_run(graph, video):
+    graph.faults = [None, 503, 503, 503]
+    with pytest.raises(UploadError):
+        facebook_upload(graph, video, max_retries=2).run()
+
+    assert facebook_upload(graph, video).run() == 'video-1'
+    assert graph.phases().count('start') == 1
+    assert graph.uploaded() == read(video)
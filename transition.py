@@ -1,48 +1,65 @@
-from moviepy import VideoFileClip, CompositeVideoClip, ColorClip, concatenate_videoclips, AudioFileClip, CompositeAudioClip, concatenate_audioclips
+from moviepy import VideoClip, VideoFileClip, CompositeVideoClip, ColorClip, concatenate_videoclips, AudioFileClip, CompositeAudioClip, concatenate_audioclips
+from moviepy.config import FFMPEG_BINARY
 import os
 import re
+import json
+import hashlib
+import bisect
+import time
+import shutil
+import subprocess
+import tempfile
+import queue
+import threading
+import wave
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 import numpy as np
+import audio_mix
+import encode_profiles
+import run_log
+from media_probe import FFPROBE_BINARY, ProbeError, probe_clips, validate_clips, probe_keyframes
+from pipeline_state import clear_write_markers, mark_written
 
-def normalize_audio_volume(audio_clip, target_level=-40.0):
-    """Normalize audio volume to a target dB level"""
-    # Get audio array
-    audio_array = audio_clip.to_soundarray()
-    
-    # Calculate RMS (root mean square) volume
-    rms = np.sqrt(np.mean(audio_array**2))
-    
-    if rms > 0:
-        # Convert to dB
-        current_db = 20 * np.log10(rms)
-        # Calculate gain needed
-        gain_db = target_level - current_db
-        gain_linear = 10 ** (gain_db / 20)
-        
-        # Apply gain (cap at reasonable levels)
-        gain_linear = min(gain_linear, 10.0)  # Max 10x amplification
-        
-        # Use multiply_volume effect directly
-        from moviepy.audio.fx.MultiplyVolume import MultiplyVolume
-        return audio_clip.with_effects([MultiplyVolume(gain_linear)])
-    
-    return audio_clip
+# Matte frames and other derived data are cached here between runs
+CACHE_DIR = os.getenv('QUIZ_CACHE_DIR', '.cache')
+
+# Transition windows re-encoded in segment mode are spliced between untouched
+# Remotion output, so they use the same codec, profile, pixel format and CRF
+# (Remotion's h264 default is 18) to keep the joins invisible.
+SEGMENT_X264_PARAMS = ['-pix_fmt', 'yuv420p', '-profile:v', 'high', '-crf', '18']
+
+# How far background music is lowered while narration plays
+DEFAULT_DUCK_DB = 10.0
+
+# moov up front for progressive playback; the fragmented layout only ever
+# appends, so the file can be uploaded while it is being written
+MOVFLAGS_FASTSTART = '+faststart'
+MOVFLAGS_FRAGMENTED = 'frag_keyframe+empty_moov+default_base_moof'
+
+# Live streaming: seconds of composited frames queued ahead of the send clock
+LIVE_BUFFER_SECONDS = 2.0
+
+# Background music is normalized to this integrated loudness before mixing,
+# or to the RMS level when it is too quiet to measure in LUFS (music
+# typically measures 2-3 LU above its RMS level)
+MUSIC_LEVEL_LUFS = -38.0
+MUSIC_LEVEL_DB = -40.0
 
 def join_two_clips_with_matte(clip1, clip2, matte_path, transition_duration=2.5, cover_time=1.0, transition_audio_path=None):
     """Join two video clips with a liquid matte transition"""
-    # Load the matte video
-    matte_clip = VideoFileClip(matte_path)
+    # Load the matte frames, resized to match Video 1 (cached between runs)
+    w, h = clip1.size
+    matte_frames, matte_duration = load_matte_frames(matte_path, w, h, clip1.fps)
     
     # Use actual matte duration if shorter than requested
-    TRANSITION_DURATION = min(transition_duration, matte_clip.duration)
+    TRANSITION_DURATION = min(transition_duration, matte_duration)
     COVER_TIME = min(cover_time, TRANSITION_DURATION / 2)
     
-    # Resize to match Video 1
-    w, h = clip1.size
     clip2 = clip2.resized((w, h))
-    matte_clip = matte_clip.resized((w, h))
     
-    # Convert to grayscale mask (luminance-based transparency)
-    matte = matte_clip.to_mask()
+    # Grayscale mask (luminance-based transparency)
+    matte = matte_mask_clip(matte_frames, clip1.fps, TRANSITION_DURATION)
 
     # 2. Create the White Liquid Overlay
     # We create a solid white block and apply the matte as its transparency mask.
@@ -96,17 +113,816 @@ def join_two_clips_with_matte(clip1, clip2, matte_path, transition_duration=2.5,
     
     return final_video
 
-def join_multiple_videos(folder_path, matte_path, output_path="output_combined.mp4", bg_music_paths=None, transition_audio_path=None, is_short=False, intro_path=None, outro_path=None, is_live=False):
-    """Join all question videos in a folder with liquid transitions (Optimized)"""
-    print(f"\n🚀 Starting Optimized Transition Script (Flattened Composition)...")
+def resize_matte(matte_clip_orig, w, h, is_short=False):
+    """Fit the matte clip to a (w, h) timeline"""
     if is_short:
-        print("📱 Mode: Vertical Shorts/Reels (9:16)")
-    
-    # Find all question videos in the folder
+        # Resize logic for Shorts (9:16)
+        # If matte is 16:9 (e.g. 1920x1080), we need to cover 1080x1920
+        # We resize height to match target height (1920), then center crop width to 1080
+        target_h = h
+        target_w = w
+
+        # Resize maintaining aspect ratio to cover height
+        if matte_clip_orig.h < target_h:
+             matte_clip_orig = matte_clip_orig.resized(height=target_h)
+
+        # If width is still too small (unlikely if 16:9 source), resize by width
+        if matte_clip_orig.w < target_w:
+             matte_clip_orig = matte_clip_orig.resized(width=target_w)
+
+        # Center crop to target dimensions
+        # Note: MoviePy v1 uses crop(x1=..., width=...), v2 might differ but we stick to basic resize for safety if crop is complex
+        # Simple resize (stretch) is safer if we don't want to debug crop syntax across versions
+        # But let's try to be smart: just resize to fill
+        matte_clip_orig = matte_clip_orig.resized((w, h))
+    else:
+        matte_clip_orig = matte_clip_orig.resized((w, h))
+
+    return matte_clip_orig
+
+def load_matte_frames(matte_path, w, h, fps, is_short=False):
+    """Return (alpha frames, matte duration) for a (w, h) timeline at `fps`.
+
+    The matte is decoded, resized and reduced to its mask channel (what
+    to_mask() uses) once, then kept in CACHE_DIR/matte as a (frames, h, w)
+    uint8 .npy keyed by matte hash, size, fps and crop mode. Frames are
+    memory-mapped read-only, so every overlay and pool worker shares them.
+    """
+    with open(matte_path, 'rb') as f:
+        digest = hashlib.sha1(f.read()).hexdigest()[:16]
+
+    cache_dir = os.path.join(CACHE_DIR, 'matte')
+    name = f"{digest}_{w}x{h}_{fps:g}fps_{'short' if is_short else 'long'}"
+    frames_path = os.path.join(cache_dir, name + '.npy')
+    meta_path = os.path.join(cache_dir, name + '.json')
+
+    if not (os.path.exists(frames_path) and os.path.exists(meta_path)):
+        print(f"  Caching matte frames for {w}x{h} @ {fps:g}fps...")
+        os.makedirs(cache_dir, exist_ok=True)
+        matte_clip = resize_matte(VideoFileClip(matte_path, audio=False), w, h, is_short)
+        count = int(matte_clip.duration * fps + 0.00001)
+
+        # Write under a temporary name so concurrent runs never see a partial cache
+        tmp_path = f"{frames_path}.{os.getpid()}.tmp"
+        frames = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.uint8, shape=(count, h, w))
+        for i in range(count):
+            frames[i] = matte_clip.get_frame(i / fps)[:, :, 0]
+        frames.flush()
+        del frames
+        os.replace(tmp_path, frames_path)
+
+        # The metadata file doubles as the "cache complete" marker
+        with open(meta_path, 'w') as f:
+            json.dump({'duration': matte_clip.duration}, f)
+        matte_clip.close()
+
+    with open(meta_path) as f:
+        duration = json.load(f)['duration']
+    return np.load(frames_path, mmap_mode='r'), duration
+
+def matte_mask_clip(frames, fps, duration):
+    """Mask clip that serves precomputed matte frames"""
+    last = len(frames) - 1
+
+    def frame_function(t):
+        return frames[min(int(fps * t + 0.00001), last)] / 255.0
+
+    return VideoClip(frame_function, is_mask=True, duration=duration)
+
+class LazyClip:
+    """A clip known from its probe info; the decoder is only opened while it is needed.
+
+    Duration and size come from media_probe, so laying out the timeline
+    opens nothing. The VideoFileClip reader (an ffmpeg process) starts on
+    the first get_frame() and stops on close(); a closed clip reopens if it
+    is asked for a frame again.
+    """
+
+    def __init__(self, info, size=None):
+        self.info = info
+        self.path = info['path']
+        self.duration = info['duration']
+        self.fps = info['fps']
+        self.size = tuple(size or (info['width'], info['height']))
+        self._reader_clip = None
+        self._clip = None
+
+    @property
+    def is_open(self):
+        return self._clip is not None
+
+    def open(self):
+        if self._clip is None:
+            self._reader_clip = VideoFileClip(self.path, audio=False)
+            clip = self._reader_clip
+            # MoviePy reports size as a list
+            self._clip = clip if tuple(clip.size) == self.size else clip.resized(self.size)
+        return self._clip
+
+    def get_frame(self, t):
+        return self.open().get_frame(t)
+
+    def close(self):
+        if self._reader_clip is not None:
+            self._reader_clip.close()
+        self._reader_clip = None
+        self._clip = None
+
+# Most clip decoders (ffmpeg reader processes) a compositor keeps open at once:
+# the clip on screen, the next one being opened and one spare for seeks
+DECODER_POOL_SIZE = 3
+# How long before a clip's start its decoder is opened in the background
+DECODER_LOOKAHEAD_SECONDS = 1.0
+
+class DecoderPool:
+    """Bounded set of open LazyClip decoders.
+
+    acquire() opens a clip (waiting for a prefetch in flight) and marks it
+    most recently used; once more than max_open are open, the least
+    recently used ones are closed. prefetch() opens a clip on a background
+    thread, so the ffmpeg start-up overlaps with compositing instead of
+    stalling the frame at the cut. Memory and process count therefore stay
+    the same whatever the number of clips.
+    """
+
+    def __init__(self, max_open=DECODER_POOL_SIZE):
+        self.max_open = max(1, max_open)
+        self.opened = 0
+        self._open = OrderedDict()
+        self._pending = {}
+        self._opener = ThreadPoolExecutor(max_workers=1)
+
+    def _wait(self, clip):
+        future = self._pending.pop(id(clip), None)
+        if future is not None:
+            future.result()
+
+    def acquire(self, clip):
+        """Open clip if needed and mark it most recently used; returns it"""
+        self._wait(clip)
+        if id(clip) in self._open:
+            self._open.move_to_end(id(clip))
+        else:
+            clip.open()
+            self._open[id(clip)] = clip
+            self.opened += 1
+        self._evict(keep=clip)
+        return clip
+
+    def prefetch(self, clip):
+        """Start opening clip in the background (no-op if open or already opening)"""
+        if id(clip) in self._open or id(clip) in self._pending:
+            return
+        self._pending[id(clip)] = self._opener.submit(clip.open)
+        self._open[id(clip)] = clip
+        self.opened += 1
+        self._evict(keep=clip)
+
+    def release(self, clip):
+        """Close clip's decoder now (its last frame has been used)"""
+        self._wait(clip)
+        if self._open.pop(id(clip), None) is not None:
+            clip.close()
+
+    def _evict(self, keep):
+        for key in list(self._open):
+            if len(self._open) <= self.max_open:
+                break
+            if key != id(keep):
+                self.release(self._open[key])
+
+    def close(self):
+        """Close every open decoder and stop the background opener"""
+        for clip in list(self._open.values()):
+            self.release(clip)
+        self._opener.shutdown()
+
+# Times closer than this are treated as equal when deciding which source is on screen
+TIME_EPSILON = 1e-6
+
+class TimelineCompositor:
+    """Frame source for the joined timeline.
+
+    The layout is always the same: clips play back to back and, around every
+    cut, a white overlay masked by the luma matte sits on top. Active sources
+    are looked up with bisect on the sorted start times, and the blend
+    frame*(1-a) + 255*a runs in place on buffers allocated once, so the cost
+    of a frame does not depend on how many clips the quiz has. Clips are
+    LazyClips whose decoders come from a DecoderPool: a clip is opened
+    DECODER_LOOKAHEAD_SECONDS before it starts and closed after its last
+    frame, so only a few decoders are open however long the quiz is.
+    """
+
+    def __init__(self, clips, starts, overlay_starts, matte_frames, fps, transition_duration, pool=None):
+        self.clips = clips
+        self.starts = list(starts)
+        self.ends = [start + clip.duration for start, clip in zip(starts, clips)]
+        self.overlay_starts = list(overlay_starts)
+        self.matte_frames = matte_frames
+        self.fps = fps
+        self.transition_duration = transition_duration
+
+        h, w = matte_frames.shape[1:]
+        self._alpha = np.empty((h, w, 1), dtype=np.float32)
+        self._blend = np.empty((h, w, 3), dtype=np.float32)
+        self._out = np.empty((h, w, 3), dtype=np.uint8)
+        self._black = np.zeros((h, w, 3), dtype=np.uint8)
+        self.pool = pool or DecoderPool()
+        self._current = None
+
+    def clip_index_at(self, t):
+        """Index of the clip on screen at time t, or None in a gap"""
+        i = bisect.bisect_right(self.starts, t + TIME_EPSILON) - 1
+        if i >= 0 and t < self.ends[i] - TIME_EPSILON:
+            return i
+        return None
+
+    def matte_index_at(self, t):
+        """Matte frame covering time t, or None when no transition is running"""
+        j = bisect.bisect_right(self.overlay_starts, t + TIME_EPSILON) - 1
+        if j < 0:
+            return None
+        local_t = t - self.overlay_starts[j]
+        if local_t >= self.transition_duration - TIME_EPSILON:
+            return None
+        return min(int(self.fps * local_t + 0.00001), len(self.matte_frames) - 1)
+
+    def get_frame(self, t):
+        """Composited RGB frame at time t (the returned buffer is reused)"""
+        i = self.clip_index_at(t)
+        if i != self._current:
+            # Frames are requested in timeline order, so the last clip is done
+            if self._current is not None:
+                self.pool.release(self.clips[self._current])
+            self._current = i
+        frame = self.pool.acquire(self.clips[i]).get_frame(t - self.starts[i]) if i is not None else self._black
+
+        # Get the next clip's decoder ready before the cut reaches it
+        upcoming = bisect.bisect_right(self.starts, t + TIME_EPSILON)
+        if upcoming < len(self.clips) and self.starts[upcoming] - t <= DECODER_LOOKAHEAD_SECONDS:
+            self.pool.prefetch(self.clips[upcoming])
+
+        m = self.matte_index_at(t)
+        if m is None:
+            return frame
+
+        # frame*(1-a) + 255*a == frame + a*(255-frame)
+        np.multiply(self.matte_frames[m][:, :, None], 1 / 255, out=self._alpha, dtype=np.float32)
+        np.subtract(255, frame, out=self._blend, dtype=np.float32)
+        self._blend *= self._alpha
+        self._blend += frame
+        np.copyto(self._out, self._blend, casting='unsafe')
+        return self._out
+
+    def close(self):
+        """Close every clip's decoder"""
+        self.pool.close()
+        for clip in self.clips:
+            clip.close()
+        self._current = None
+
+class FFmpegFrameWriter:
+    """Persistent ffmpeg encoder fed with raw rgb24 frames through stdin.
+
+    Frames are written straight from the caller's buffer (no conversion or
+    copy on our side) and the audio track, if any, is muxed in the same pass.
+    """
+
+    def __init__(self, output_path, size, fps, audio_path=None, codec="libx264", audio_codec="aac",
+                 preset="ultrafast", threads=None, bitrate=None, ffmpeg_params=None, show_progress=True):
+        w, h = size
+        cmd = [
+            FFMPEG_BINARY, '-y', '-v', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f'{w}x{h}', '-r', f'{fps:g}', '-i', '-'
+        ]
+        if audio_path:
+            cmd.extend(['-i', audio_path, '-map', '0:v:0', '-map', '1:a:0', '-c:a', audio_codec])
+        else:
+            cmd.append('-an')
+        cmd.extend(['-c:v', codec, '-preset', preset])
+        if threads:
+            cmd.extend(['-threads', str(threads)])
+        if bitrate:
+            cmd.extend(['-b:v', bitrate])
+        cmd.extend(ffmpeg_params or [])
+        cmd.append(output_path)
+
+        self.output_path = output_path
+        self.frame_shape = (h, w, 3)
+        self.show_progress = show_progress
+        self.frames_written = 0
+        self.bytes_written = 0
+        self.started_at = time.time()
+        self._last_report = self.started_at
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+
+    def write_frame(self, frame):
+        """Send one (h, w, 3) uint8 frame to the encoder"""
+        if frame.shape != self.frame_shape or frame.dtype != np.uint8:
+            raise ValueError(f"Expected {self.frame_shape} uint8 frame, got {frame.shape} {frame.dtype}")
+        if not frame.flags['C_CONTIGUOUS']:
+            frame = np.ascontiguousarray(frame)
+
+        self.proc.stdin.write(frame.data)
+        self.frames_written += 1
+        self.bytes_written += frame.nbytes
+
+        if self.show_progress and time.time() - self._last_report >= 1.0:
+            self.report(end='\r')
+
+    def report(self, end='\n'):
+        """Print the throughput so far"""
+        self._last_report = time.time()
+        elapsed = max(self._last_report - self.started_at, 1e-9)
+        print(
+            f"  Encoded {self.frames_written} frames | "
+            f"{self.frames_written / elapsed:.1f} frames/s | "
+            f"{self.bytes_written / elapsed / (1024 * 1024):.1f} MB/s written",
+            end=end
+        )
+
+    def close(self):
+        """Flush the encoder and wait for ffmpeg to finish the file"""
+        self.proc.stdin.close()
+        returncode = self.proc.wait()
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, self.proc.args)
+        if self.show_progress:
+            self.report()
+        elapsed = time.time() - self.started_at
+        run_log.emit(
+            'encode',
+            output=self.output_path,
+            frames=self.frames_written,
+            wall_s=round(elapsed, 3),
+            fps=round(self.frames_written / max(elapsed, 1e-9), 2),
+            raw_bytes=self.bytes_written,
+            output_bytes=os.path.getsize(self.output_path)
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.proc.kill()
+            self.proc.wait()
+
+def render_audio_track(audio_path, duration, clip_audio, transition_audio_path=None, transition_starts=(),
+                       transition_duration=None, bg_music_paths=None, work_dir=None, duck_db=DEFAULT_DUCK_DB):
+    """Mix clip audio, transition SFX and (normalized, looped) background music into one WAV.
+
+    clip_audio is a list of (path, start) for the clips that have sound.
+    Every source is decoded once and summed into a single float32 bus
+    (audio_mix.AudioBus). Background music is ducked by duck_db while the
+    clips' narration is playing (0 disables ducking).
+    Returns audio_path, or None if there is no audio.
+    """
+    sfx = None
+    if transition_audio_path and os.path.exists(transition_audio_path) and transition_starts:
+        # One decoded copy, trimmed or looped to the transition length, reused at every cut
+        sfx = audio_mix.decode_audio(transition_audio_path)
+        sfx_frames = int(round(transition_duration * audio_mix.SAMPLE_RATE))
+        if 0 < len(sfx) < sfx_frames:
+            sfx = np.tile(sfx, (sfx_frames // len(sfx) + 1, 1))
+        sfx = sfx[:sfx_frames]
+
+    music_tracks = []
+    if bg_music_paths:
+        print("\nAdding background music...")
+        for music_path in bg_music_paths:
+            if os.path.exists(music_path):
+                print(f"  Loading: {os.path.basename(music_path)}")
+                loudness = audio_mix.load_loudness(music_path)
+                if loudness['lufs'] is not None:
+                    print(f"    Measured {loudness['lufs']:.1f} LUFS, normalizing to {MUSIC_LEVEL_LUFS:g} LUFS")
+                elif loudness['rms_db'] is not None:
+                    print(f"    Measured {loudness['rms_db']:.1f} dB RMS, normalizing to {MUSIC_LEVEL_DB:g} dB")
+                gain = audio_mix.loudness_gain(loudness, MUSIC_LEVEL_LUFS, MUSIC_LEVEL_DB)
+                music_tracks.append((music_path, gain, loudness['duration']))
+
+    if not clip_audio and sfx is None and not music_tracks:
+        return None
+
+    print("  Rendering audio track...")
+    bus = audio_mix.AudioBus(duration, work_dir or os.path.dirname(os.path.abspath(audio_path)))
+    for path, start in clip_audio:
+        # Clip audio (the narration) keys the background music ducking
+        bus.add_file(path, start, sidechain=True)
+    if sfx is not None:
+        bus.add_repeated(sfx, transition_starts)
+    if music_tracks:
+        envelope = None
+        if duck_db > 0 and clip_audio:
+            envelope = bus.duck_envelope(duck_db)
+            ducked = np.mean(envelope < 1.0) * 100
+            print(f"  Ducking music by {duck_db:g} dB under narration ({ducked:.0f}% of the timeline)")
+        print(f"  Mixing {len(music_tracks)} background track(s), looped to {duration:.1f}s...")
+        bus.add_looped(music_tracks, envelope=envelope)
+    return bus.write_wav(audio_path)
+
+# ==================== SEGMENTED JOIN MODES ====================
+# The timeline is cut into independent segments: one window around each cut
+# (tail of clip N + matte + head of clip N+1) and one body per clip between
+# windows. "segment" mode re-encodes only the windows and stream-copies the
+# bodies (which then have to start and end on keyframes of the source clip,
+# so windows are widened outwards to the nearest usable keyframes).
+# "parallel" mode re-encodes every segment. Either way the segments are
+# rendered on a process pool and stitched with the concat demuxer.
+
+def plan_segments(durations, keyframes, fps, transition_duration, cover_time):
+    """Split the joined timeline into clip bodies and transition windows.
+
+    Uses the same arithmetic as the flattened composition: clip i starts at
+    the sum of the previous durations and the overlay for cut i starts
+    COVER_TIME before clip i ends.
+
+    keyframes[i] is the keyframe list of clip i if its body may be
+    stream-copied, or None if it has to be re-encoded.
+
+    Returns (starts, segments). Each segment is a dict with 'kind' set to
+    'copy' (clip index plus local 'start'/'end' in that clip) or 'render'
+    (global 'start'/'end' on the timeline, snapped to the frame grid).
+    """
+    eps = 0.5 / fps
+    starts = []
+    current_time = 0.0
+    for duration in durations:
+        starts.append(current_time)
+        current_time += duration
+    total = current_time
+    last = len(durations) - 1
+
+    def snap(t):
+        return round(t * fps) / fps
+
+    segments = []
+    cursor = 0.0
+    for i, duration in enumerate(durations):
+        # Overlay of the previous cut reaches this far into the clip...
+        head = 0.0 if i == 0 else transition_duration - cover_time
+        # ...and the overlay of the next cut starts here
+        tail = duration if i == last else duration - cover_time
+
+        if keyframes[i] is None:
+            kind = 'render'
+            body_start, body_end = head, tail
+        else:
+            kind = 'copy'
+            body_start = next((k for k in keyframes[i] if k >= head - eps), None)
+            if i == last:
+                body_end = duration
+            else:
+                body_end = max((k for k in keyframes[i] if k <= tail + eps), default=None)
+
+        if body_start is None or body_end is None or body_end - body_start < eps:
+            # No usable body: the clip is re-encoded as part of the windows around it
+            continue
+
+        global_start = snap(starts[i] + body_start)
+        if global_start - cursor > eps:
+            segments.append({'kind': 'render', 'start': cursor, 'end': global_start})
+        if kind == 'copy':
+            segments.append({'kind': 'copy', 'clip': i, 'start': body_start, 'end': body_end})
+            cursor = starts[i] + body_end
+        else:
+            cursor = snap(starts[i] + body_end)
+            segments.append({'kind': 'render', 'start': global_start, 'end': cursor})
+
+    if total - cursor > eps:
+        segments.append({'kind': 'render', 'start': cursor, 'end': total})
+
+    return starts, segments
+
+def render_window(job):
+    """Render one slice of the timeline (video only) to an MPEG-TS segment.
+
+    Runs in a pool worker, so the job only carries paths and timings and the
+    worker opens just the clips visible in its window.
+    """
+    w, h = job['size']
+    fps = job['fps']
+    matte_frames, _ = load_matte_frames(job['matte_path'], w, h, fps, job['is_short'])
+
+    clips = [LazyClip(info, (w, h)) for info, _ in job['clips']]
+    starts = [start for _, start in job['clips']]
+
+    compositor = TimelineCompositor(
+        clips, starts, job['overlay_starts'], matte_frames, fps, job['transition_duration']
+    )
+
+    # Sample at the same global frame times the single-pass render uses
+    first_frame = round(job['start'] * fps)
+    frames = round((job['end'] - job['start']) * fps)
+
+    with FFmpegFrameWriter(
+        job['output'], (w, h), fps,
+        preset=job['preset'],
+        threads=job['threads'],
+        ffmpeg_params=job['ffmpeg_params'],
+        show_progress=False
+    ) as writer:
+        for n in range(frames):
+            writer.write_frame(compositor.get_frame((first_frame + n) / fps))
+
+    compositor.close()
+    return job['output']
+
+def extract_clip_body(job):
+    """Stream-copy the [start, end) video of a clip into an MPEG-TS segment.
+
+    The segment muxer cuts on the first keyframe at or after each split time,
+    so splitting half a frame early lands exactly on the planned keyframes.
+    """
+    eps = 0.5 / job['fps']
+    split_times = []
+    if job['start'] > 0:
+        split_times.append(job['start'] - eps)
+    if job['end'] < job['duration'] - eps:
+        split_times.append(job['end'] - eps)
+
+    cmd = [
+        FFMPEG_BINARY, '-y', '-v', 'error', '-i', job['path'],
+        '-map', '0:v:0', '-c', 'copy', '-bsf:v', 'h264_mp4toannexb',
+        '-f', 'segment', '-segment_format', 'mpegts', '-reset_timestamps', '1'
+    ]
+    if split_times:
+        cmd.extend(['-segment_times', ','.join(f'{t:.6f}' for t in split_times)])
+    cmd.append(job['output'])
+    subprocess.run(cmd, check=True)
+
+    # Piece 0 is the head that gets re-encoded, unless the body starts the clip
+    return job['output'] % (1 if job['start'] > 0 else 0)
+
+def run_segment_job(job):
+    """Pool entry point: render a window or copy a clip body"""
+    if job['kind'] == 'copy':
+        return extract_clip_body(job)
+    return render_window(job)
+
+def concat_segments(segment_files, output_path, audio_path=None, work_dir=None, movflags=MOVFLAGS_FASTSTART):
+    """Stitch (path, duration) segments with the concat demuxer (video is stream-copied)"""
+    work_dir = work_dir or os.path.dirname(segment_files[0][0])
+    list_path = os.path.join(work_dir, 'segments.txt')
+    with open(list_path, 'w') as f:
+        for path, duration in segment_files:
+            f.write(f"file '{os.path.abspath(path)}'\n")
+            f.write(f"duration {duration:.6f}\n")
+
+    cmd = [FFMPEG_BINARY, '-y', '-v', 'error', '-f', 'concat', '-safe', '0', '-i', list_path]
+    if audio_path:
+        # The mixed track arrives as PCM, so audio gets its one AAC pass here
+        cmd.extend(['-i', audio_path, '-map', '0:v:0', '-map', '1:a:0', '-c:a', 'aac'])
+    cmd.extend(['-c:v', 'copy', '-movflags', movflags, output_path])
+    subprocess.run(cmd, check=True)
+
+SEGMENT_CACHE_DIRNAME = '.segments'
+
+# Bump when segment encoding changes in a way the cache keys don't capture
+SEGMENT_CACHE_VERSION = 1
+
+class SegmentCache:
+    """Rendered timeline segments kept between joins (segment/parallel modes).
+
+    Segments are keyed by what decides their bytes: the content hash of the
+    clips they show, their offsets relative to those clips and the encode
+    settings. Absolute timeline positions are left out, so changing one clip
+    only invalidates the body and windows touching it, even when its new
+    duration shifts everything after it.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        os.makedirs(cache_dir, exist_ok=True)
+        try:
+            with open(self.index_path) as f:
+                self.files = json.load(f).get('files', {})
+        except (OSError, ValueError):
+            self.files = {}
+        self.used = set()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(*parts):
+        payload = json.dumps([SEGMENT_CACHE_VERSION, *parts])
+        return hashlib.sha1(payload.encode()).hexdigest()
+
+    def file_hash(self, path):
+        """Content hash of an input file, only re-read when its size or mtime changes"""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        entry = self.files.get(path)
+        if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+            return entry['sha1']
+
+        digest = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        self.files[path] = {'size': stat.st_size, 'mtime': stat.st_mtime, 'sha1': digest.hexdigest()}
+        return self.files[path]['sha1']
+
+    def segment_path(self, key):
+        return os.path.join(self.cache_dir, key + '.ts')
+
+    def lookup(self, key):
+        """Return the cached segment for key, or None if it has to be rendered"""
+        path = self.segment_path(key)
+        self.used.add(path)
+        if os.path.exists(path):
+            self.hits += 1
+            return path
+        self.misses += 1
+        return None
+
+    def store(self, key, rendered_path):
+        path = self.segment_path(key)
+        os.replace(rendered_path, path)
+        return path
+
+    def save(self):
+        """Write the index and drop segments the current timeline no longer uses"""
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.endswith('.ts') and path not in self.used:
+                os.remove(path)
+        self.files = {path: entry for path, entry in self.files.items() if os.path.exists(path)}
+
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': SEGMENT_CACHE_VERSION, 'files': self.files}, f)
+        os.replace(tmp_path, self.index_path)
+
+def write_segmented(clips, clip_paths, matte_path, is_short, transition_duration, cover_time, audio_path, output_path,
+                    mode="segment", workers=None, ffmpeg_params=None, preset="ultrafast", cache_dir=None,
+                    movflags=MOVFLAGS_FASTSTART):
+    """Render the timeline as independent segments on a process pool and concatenate them.
+
+    clips are LazyClips at the output size. With cache_dir, rendered segments
+    are kept there and reused by later joins, so only segments touching
+    changed clips are rendered again.
+    """
+    w, h = clips[0].size
+    fps = clips[0].fps
+    workers = workers or os.cpu_count() or 1
+
+    keyframes = [None] * len(clips)
+    if mode == "segment":
+        print("\nProbing clips for keyframes...")
+        for i, (clip, path) in enumerate(zip(clips, clip_paths)):
+            info = clip.info
+            # Bodies can only be copied when they already look like the output stream
+            compatible = (
+                info['codec'] == 'h264'
+                and info['pix_fmt'] == 'yuv420p'
+                and (info['width'], info['height']) == (w, h)
+                and abs(clip.fps - fps) < 0.01
+            )
+            if compatible:
+                keyframes[i] = probe_keyframes(path)
+
+    starts, segments = plan_segments(
+        [clip.duration for clip in clips], keyframes, fps,
+        transition_duration, cover_time
+    )
+    overlay_starts = [starts[i + 1] - cover_time for i in range(len(clips) - 1)]
+
+    rendered = sum(s['end'] - s['start'] for s in segments if s['kind'] == 'render')
+    copied = sum(s['end'] - s['start'] for s in segments if s['kind'] == 'copy')
+    print(f"  {len(segments)} segments: re-encoding {rendered:.1f}s, stream-copying {copied:.1f}s")
+
+    cache = None
+    if cache_dir:
+        cache = SegmentCache(cache_dir)
+        clip_hashes = [cache.file_hash(path) for path in clip_paths]
+        matte_hash = cache.file_hash(matte_path)
+
+    # Work files live next to the cache so finished segments can be moved in
+    work_dir = tempfile.mkdtemp(prefix='segments_', dir=cache_dir or os.path.dirname(os.path.abspath(output_path)))
+    try:
+        jobs = []
+        job_keys = []
+        segment_paths = [None] * len(segments)
+        durations = []
+        for n, segment in enumerate(segments):
+            if segment['kind'] == 'copy':
+                i = segment['clip']
+                durations.append(segment['end'] - segment['start'])
+                if cache:
+                    key = SegmentCache.key(
+                        'copy', clip_hashes[i], round(segment['start'], 6), round(segment['end'], 6), fps
+                    )
+                    segment_paths[n] = cache.lookup(key)
+                    if segment_paths[n]:
+                        continue
+                    job_keys.append((n, key))
+                else:
+                    job_keys.append((n, None))
+                jobs.append({
+                    'kind': 'copy',
+                    'path': clip_paths[i],
+                    'start': segment['start'],
+                    'end': segment['end'],
+                    'duration': clips[i].duration,
+                    'fps': fps,
+                    'output': os.path.join(work_dir, f'body-{n:04d}-%02d.ts'),
+                })
+                continue
+
+            window_start, window_end = segment['start'], segment['end']
+            visible = [
+                i for i, clip in enumerate(clips)
+                if starts[i] < window_end and starts[i] + clip.duration > window_start
+            ]
+            visible_overlays = [
+                start for start in overlay_starts
+                if start < window_end and start + transition_duration > window_start
+            ]
+            durations.append(round((window_end - window_start) * fps) / fps)
+
+            if cache:
+                # Frames are sampled on the global grid, so key on offsets from the first frame
+                t0 = round(window_start * fps) / fps
+                key = SegmentCache.key(
+                    'render',
+                    [(clip_hashes[i], round(t0 - starts[i], 6)) for i in visible],
+                    [round(t0 - start, 6) for start in visible_overlays],
+                    round((window_end - window_start) * fps),
+                    [w, h], fps, transition_duration, is_short, matte_hash,
+                    preset, ffmpeg_params
+                )
+                segment_paths[n] = cache.lookup(key)
+                if segment_paths[n]:
+                    continue
+                job_keys.append((n, key))
+            else:
+                job_keys.append((n, None))
+
+            jobs.append({
+                'kind': 'render',
+                'start': window_start,
+                'end': window_end,
+                'clips': [(clips[i].info, starts[i]) for i in visible],
+                'overlay_starts': visible_overlays,
+                'transition_duration': transition_duration,
+                'matte_path': matte_path,
+                'is_short': is_short,
+                'size': (w, h),
+                'fps': fps,
+                'preset': preset,
+                # Leave x264 threads to the pool instead of oversubscribing
+                'threads': max(1, (os.cpu_count() or 1) // workers),
+                'ffmpeg_params': ffmpeg_params,
+                'output': os.path.join(work_dir, f'window-{n:04d}.ts'),
+            })
+
+        if cache:
+            print(f"  ♻️  Segments: {cache.hits} reused, {cache.misses} to render")
+        if jobs:
+            print(f"  Rendering on {workers} worker process(es)...")
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(run_segment_job, job) for job in jobs]
+                for done, future in enumerate(as_completed(futures), start=1):
+                    future.result()
+                    print(f"  Segments done: {done}/{len(jobs)}", end='\r')
+            print()
+            for (n, key), future in zip(job_keys, futures):
+                segment_paths[n] = cache.store(key, future.result()) if cache else future.result()
+        segment_files = list(zip(segment_paths, durations))
+
+        print("  Concatenating segments (stream copy)...")
+        concat_start = time.time()
+        concat_segments(segment_files, output_path, audio_path, work_dir=work_dir, movflags=movflags)
+        run_log.emit(
+            'segments',
+            mode=mode,
+            segments=len(segments),
+            jobs=len(jobs),
+            reused=cache.hits if cache else 0,
+            rendered_s=round(rendered, 3),
+            copied_s=round(copied, 3),
+            concat_wall_s=round(time.time() - concat_start, 3),
+            output_bytes=os.path.getsize(output_path)
+        )
+        if cache:
+            cache.save()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def find_clip_paths(folder_path, intro_path=None, outro_path=None, verbose=True):
+    """Timeline order of a quiz: intro, question-N.mp4 by N, outro.
+
+    intro/outro default to intro.mp4 / outro.mp4 in the folder. Returns None
+    (after saying why) if there is nothing to join; verbose lists the clips.
+    """
     video_files = []
     if not os.path.exists(folder_path):
         print(f"Error: Folder '{folder_path}' not found.")
-        return
+        return None
     
     # Check for intro and outro
     final_intro_path = None
@@ -141,219 +957,526 @@ def join_multiple_videos(folder_path, matte_path, output_path="output_combined.m
     
     if len(video_files) == 0:
         print(f"No question videos found in '{folder_path}'")
-        return
+        return None
     
-    print(f"Found {len(video_files)} question videos:")
-    for num, path in video_files:
-        print(f"  - Question {num}: {os.path.basename(path)}")
+    if verbose:
+        print(f"Found {len(video_files)} question videos:")
+        for num, path in video_files:
+            print(f"  - Question {num}: {os.path.basename(path)}")
+
+        if has_intro:
+            print(f"  ✓ Intro: {os.path.basename(final_intro_path)}")
+        if has_outro:
+            print(f"  ✓ Outro: {os.path.basename(final_outro_path)}")
+        print()
     
+    clip_paths = [path for _, path in video_files]
     if has_intro:
-        print(f"  ✓ Intro: {os.path.basename(final_intro_path)}")
+        clip_paths.insert(0, final_intro_path)
     if has_outro:
-        print(f"  ✓ Outro: {os.path.basename(final_outro_path)}")
-    print()
-    
-    # Load all clips
-    clips = []
-    
-    # Add intro if exists
-    if has_intro:
-        print("Loading intro...")
-        clips.append(VideoFileClip(final_intro_path))
+        clip_paths.append(final_outro_path)
+    return clip_paths
+
+def layout_timeline(infos, cover_time):
+    """Place clips back to back; returns (starts, overlay_starts, clip_audio, duration).
+
+    infos are media_probe clip infos. Every cut gets a matte overlay
+    starting cover_time before it; clip_audio lists (path, start) for the
+    clips that have sound.
+    """
+    starts = []
+    overlay_starts = []
+    clip_audio = []
+    current_time = 0.0
+
+    for i, info in enumerate(infos):
+        # Add clip to timeline
+        starts.append(current_time)
+        if info['has_audio']:
+            clip_audio.append((info['path'], current_time))
+
+        # If not the last clip, add transition overlay
+        if i < len(infos) - 1:
+            # Overlay starts before current clip ends to cover the cut
+            overlay_starts.append(current_time + info['duration'] - cover_time)
+
+        current_time += info['duration']
+
+    return starts, overlay_starts, clip_audio, current_time
+
+def load_clip_infos(clip_paths):
+    """Probe and validate a quiz's clips; None (after saying why) if they cannot be joined"""
+    print(f"Probing {len(clip_paths)} clips...")
+    try:
+        infos = probe_clips(clip_paths)
+    except ProbeError as e:
+        print(f"Error: {e}")
+        return None
+    errors = validate_clips(infos)
+    for error in errors:
+        print(f"Error: {error}")
+    return None if errors else infos
+
+def join_multiple_videos(folder_path, matte_path, output_path="output_combined.mp4", bg_music_paths=None, transition_audio_path=None, is_short=False, intro_path=None, outro_path=None, is_live=False, mode="full", workers=None, segment_cache=True, duck_db=DEFAULT_DUCK_DB, fragmented=False, stream_url=None, playlist=None, loops=0, live_buffer=LIVE_BUFFER_SECONDS, encode_profile=None):
+    """Join all question videos in a folder with liquid transitions (Optimized)
+
+    mode="full" re-encodes the whole timeline in one pass; mode="segment"
+    re-encodes only the transition windows and stream-copies the clip bodies;
+    mode="parallel" re-encodes every window and body as its own segment.
+    Segmented modes render on a pool of `workers` processes (default: all cores)
+    and, with segment_cache, keep their segments in <folder>/.segments so a
+    re-join only renders the segments around changed clips.
+    fragmented writes a fragmented MP4 that can be uploaded while it grows.
+    encode_profile names an encode_profiles profile (default: shorts,
+    long-form or live to match the output).
+    stream_url switches to live mode: nothing is written to output_path;
+    this folder and the `playlist` folders are streamed to the RTMP URL (or
+    .flv file) in real time, `loops` times over (0: until interrupted).
+
+    Returns output_path (stream_url when live), or None if there was nothing to join.
+    """
+    if stream_url:
+        return stream_live(
+            [folder_path] + list(playlist or []), matte_path, stream_url,
+            bg_music_paths=bg_music_paths,
+            transition_audio_path=transition_audio_path,
+            is_short=is_short,
+            intro_path=intro_path,
+            outro_path=outro_path,
+            duck_db=duck_db,
+            buffer_seconds=live_buffer,
+            loops=loops
+        )
+
+    print(f"\n🚀 Starting Optimized Transition Script (Flattened Composition)...")
+    if is_short:
+        print("📱 Mode: Vertical Shorts/Reels (9:16)")
+
+    if mode == "segment":
+        if is_live:
+            # Copied bodies keep Remotion's GOP/bitrate, which Live ingest rejects
+            print("⚠️ Warning: --live needs a full re-encode, ignoring segment mode")
+            mode = "full"
+        elif not shutil.which(FFPROBE_BINARY):
+            print(f"⚠️ Warning: {FFPROBE_BINARY} not found, falling back to full render")
+            mode = "full"
+        else:
+            print("✂️  Join mode: segment (re-encode transition windows only)")
+    elif mode == "parallel":
+        print("⚡ Join mode: parallel (render every segment on a process pool)")
+    if is_live and encode_profile not in (None, 'live'):
+        print(f"⚠️ Warning: --live needs the live profile's GOP and bitrate, ignoring '{encode_profile}'")
+        encode_profile = 'live'
+    profile = encode_profiles.get_profile(encode_profile or encode_profiles.default_profile(is_short, is_live))
+    print(encode_profiles.describe(profile))
+    movflags = MOVFLAGS_FRAGMENTED if fragmented else MOVFLAGS_FASTSTART
+    if fragmented:
+        print("🧩 Output: fragmented MP4 (can be uploaded while it is written)")
     
-    # Add question clips
-    print(f"Loading {len(video_files)} question clips...")
-    for i, (num, path) in enumerate(video_files):
-        print(f"  Loading clip {i+1}/{len(video_files)}: {os.path.basename(path)}...", end='\r')
-        clips.append(VideoFileClip(path))
-    print("\nAll clips loaded successfully.")
+    clip_paths = find_clip_paths(folder_path, intro_path, outro_path)
+    if not clip_paths:
+        return
     
-    # Add outro if exists
-    if has_outro:
-        print("Loading outro...")
-        clips.append(VideoFileClip(final_outro_path))
+    # Probe all clips (no decoders are opened until a clip is on screen)
+    infos = load_clip_infos(clip_paths)
+    if not infos:
+        return
     
-    if len(clips) == 1:
+    if len(infos) == 1:
         print("Only one video found, no transitions needed.")
-        clips[0].write_videofile(
+        VideoFileClip(clip_paths[0]).write_videofile(
             output_path, 
             codec="libx264", 
             audio_codec="aac",
-            threads=8,
-            preset='ultrafast'
+            threads=profile['threads'],
+            preset=profile['preset'],
+            ffmpeg_params=['-movflags', movflags] + encode_profiles.ffmpeg_args(profile, infos[0]['fps'])
         )
-        return
+        return output_path
 
-    # --- OPTIMIZED FLATTENED COMPOSITION ---
+    # --- OPTIMIZED TIMELINE COMPOSITION ---
     print("Preparing composition...")
     
     # Master properties from first clip
-    w, h = clips[0].size
+    w, h = infos[0]['width'], infos[0]['height']
+    fps = infos[0]['fps']
+    clips = [LazyClip(info, (w, h)) for info in infos]
     
-    # Prepare Matte Overlay Master
-    # We create one overlay and reuse it (by copying/time-shifting)
-    matte_clip_orig = VideoFileClip(matte_path)
-    
-    if is_short:
-        # Resize logic for Shorts (9:16)
-        # If matte is 16:9 (e.g. 1920x1080), we need to cover 1080x1920
-        # We resize height to match target height (1920), then center crop width to 1080
-        target_h = h
-        target_w = w
-        
-        # Resize maintaining aspect ratio to cover height
-        if matte_clip_orig.h < target_h:
-             matte_clip_orig = matte_clip_orig.resized(height=target_h)
-        
-        # If width is still too small (unlikely if 16:9 source), resize by width
-        if matte_clip_orig.w < target_w:
-             matte_clip_orig = matte_clip_orig.resized(width=target_w)
-             
-        # Center crop to target dimensions
-        # Note: MoviePy v1 uses crop(x1=..., width=...), v2 might differ but we stick to basic resize for safety if crop is complex
-        # Simple resize (stretch) is safer if we don't want to debug crop syntax across versions
-        # But let's try to be smart: just resize to fill
-        matte_clip_orig = matte_clip_orig.resized((w, h)) 
-    else:
-        matte_clip_orig = matte_clip_orig.resized((w, h))
-
-    TRANSITION_DURATION = min(2.5, matte_clip_orig.duration)
+    # Prepare Matte (decoded once, shared by every transition)
+    matte_frames, matte_duration = load_matte_frames(matte_path, w, h, fps, is_short)
+    TRANSITION_DURATION = min(2.5, matte_duration)
     COVER_TIME = min(1.0, TRANSITION_DURATION / 2)
     
-    # Create the mask and color clip once
-    matte_mask = matte_clip_orig.to_mask()
-    white_screen = ColorClip(size=(w, h), color=(255, 255, 255), duration=TRANSITION_DURATION)
-    overlay_master = white_screen.with_mask(matte_mask)
-    
-    # Prepare Transition Audio Master
-    transition_audio_master = None
-    if transition_audio_path and os.path.exists(transition_audio_path):
-        ta = AudioFileClip(transition_audio_path)
-        # Loop/Trim logic
-        if ta.duration > TRANSITION_DURATION:
-            ta = ta.subclipped(0, TRANSITION_DURATION)
-        elif ta.duration < TRANSITION_DURATION:
-            loops = int(TRANSITION_DURATION / ta.duration) + 1
-            ta = concatenate_audioclips([ta] * loops).subclipped(0, TRANSITION_DURATION)
-        transition_audio_master = ta
-
-    final_clips = []
-    final_audio_clips = []
-    current_time = 0.0
-    
     print(f"Stitching {len(clips)} clips...")
-    
-    for i, clip in enumerate(clips):
-        # Resize if needed
-        if clip.size != (w, h):
-            clip = clip.resized((w, h))
-        
-        # Add clip to timeline
-        final_clips.append(clip.with_start(current_time))
-        if clip.audio:
-            final_audio_clips.append(clip.audio.with_start(current_time))
-            
-        # If not the last clip, add transition overlay
-        if i < len(clips) - 1:
-            # Overlay starts before current clip ends to cover the cut
-            overlay_start = current_time + clip.duration - COVER_TIME
-            final_clips.append(overlay_master.with_start(overlay_start))
-            
-            if transition_audio_master:
-                final_audio_clips.append(transition_audio_master.with_start(overlay_start))
-        
-        current_time += clip.duration
+    starts, overlay_starts, clip_audio, current_time = layout_timeline(infos, COVER_TIME)
 
-    # Create final composite
-    # We use a flat list of clips instead of recursive nesting
-    final_video = CompositeVideoClip(final_clips, size=(w, h))
-    final_video = final_video.with_duration(current_time)
-    
-    # Handle Audio
-    if final_audio_clips:
-        video_audio = CompositeAudioClip(final_audio_clips)
-    else:
-        video_audio = None
-    
-    # Add Background Music
-    if bg_music_paths:
-        print("\nAdding background music...")
-        bg_tracks = []
-        
-        # Load all background music tracks
-        for music_path in bg_music_paths:
-            if os.path.exists(music_path):
-                print(f"  Loading: {os.path.basename(music_path)}")
-                audio_clip = AudioFileClip(music_path)
-                
-                # Normalize volume
-                print(f"    Normalizing volume...")
-                audio_clip = normalize_audio_volume(audio_clip, target_level=-40.0)
-                
-                bg_tracks.append(audio_clip)
-        
-        if bg_tracks:
-            # Concatenate all music tracks
-            print(f"  Combining {len(bg_tracks)} track(s)...")
-            bg_music = concatenate_audioclips(bg_tracks)
-            
-            # Loop the music if video is longer
-            if bg_music.duration < final_video.duration:
-                loops_needed = int(final_video.duration / bg_music.duration) + 1
-                print(f"  Looping music {loops_needed} time(s) to match video duration...")
-                bg_music = concatenate_audioclips([bg_music] * loops_needed)
-            
-            # Trim to match video duration
-            bg_music = bg_music.subclipped(0, final_video.duration)
-            
-            # Mix with existing audio
-            if video_audio:
-                print("  Mixing background music with video audio...")
-                final_audio = CompositeAudioClip([video_audio, bg_music])
-            else:
-                final_audio = bg_music
-            final_video = final_video.with_audio(final_audio)
-    elif video_audio:
-        final_video = final_video.with_audio(video_audio)
-    
     # Render final video
-    print("\nRendering final video (Optimized)...")
-    
-    # Try to use hardware acceleration if available (VideoToolbox for Mac)
-    # Note: MoviePy uses libx264 by default. We can try to pass codec='h264_videotoolbox'
-    # but it might require specific ffmpeg build. Safe bet is libx264 with ultrafast.
-    
-    ffmpeg_params = [
-        '-movflags', '+faststart',
-        '-pix_fmt', 'yuv420p'
-    ]
-    
-    bitrate = None
-    if is_live:
-        print("  Configuring for YouTube Live (30fps, 4500kbps, 2s GOP)...")
-        # YouTube Live specs:
-        # - Keyframe interval: 2 seconds (at 30fps = 60 frames)
-        # - Bitrate: 4500Kbps (for 1080p)
-        ffmpeg_params.extend([
-            '-g', '60',              # GOP size 60 (2 seconds at 30fps)
-            '-keyint_min', '60',     # Minimum GOP size
-            '-sc_threshold', '0',    # Disable scene cut detection
-            '-b:v', '4500k',         # Video bitrate
-            '-maxrate', '4500k',     # Max bitrate
-            '-bufsize', '9000k'      # Buffer size (2x bitrate)
-        ])
-        bitrate = "4500k"
-
-    final_video.write_videofile(
-        output_path, 
-        codec="libx264",
-        audio_codec="aac",
-        threads=16,  # Maximize threads for M4
-        preset='ultrafast',  # Fastest encoding
-        ffmpeg_params=ffmpeg_params,
-        bitrate=bitrate
-    )
+    # libx264 everywhere (no hardware encoder to detect); the profile sets preset,
+    # rate control and GOP, and threads follow the CPU count
+    ffmpeg_params = encode_profiles.ffmpeg_args(profile, fps)
+
+    compositor = None
+    work_dir = tempfile.mkdtemp(prefix='render_', dir=os.path.dirname(os.path.abspath(output_path)))
+    try:
+        # Clip audio, transition SFX and background music mixed once into a single PCM track
+        # (uncompressed so the final mux does the only AAC pass)
+        audio_path = render_audio_track(
+            os.path.join(work_dir, 'audio.wav'), current_time, clip_audio,
+            transition_audio_path=transition_audio_path,
+            transition_starts=overlay_starts,
+            transition_duration=TRANSITION_DURATION,
+            bg_music_paths=bg_music_paths,
+            work_dir=work_dir,
+            duck_db=duck_db
+        )
+
+        if mode in ("segment", "parallel"):
+            print(f"\nRendering segments ({mode} mode)...")
+            write_segmented(
+                clips, clip_paths, matte_path, is_short, TRANSITION_DURATION, COVER_TIME, audio_path, output_path,
+                mode=mode,
+                workers=workers,
+                # Copied bodies set the quality bar for the windows; in parallel mode every segment is ours
+                ffmpeg_params=SEGMENT_X264_PARAMS if mode == "segment" else ffmpeg_params,
+                preset=profile['preset'],
+                cache_dir=os.path.join(folder_path, SEGMENT_CACHE_DIRNAME) if segment_cache else None,
+                movflags=movflags
+            )
+            print(f"\n✅ Video saved to: {output_path}")
+            return output_path
+
+        # Create final composite
+        # A dedicated compositor instead of a CompositeVideoClip walking every layer per frame
+        compositor = TimelineCompositor(clips, starts, overlay_starts, matte_frames, fps, TRANSITION_DURATION)
+        total_frames = round(current_time * fps)
+
+        print("\nRendering final video (Optimized)...")
+        with FFmpegFrameWriter(
+            output_path, (w, h), fps,
+            audio_path=audio_path,
+            threads=profile['threads'],
+            preset=profile['preset'],
+            ffmpeg_params=['-movflags', movflags] + ffmpeg_params
+        ) as writer:
+            for n in range(total_frames):
+                writer.write_frame(compositor.get_frame(n / fps))
+    finally:
+        if compositor is not None:
+            compositor.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
     print(f"\n✅ Video saved to: {output_path}")
+    return output_path
+
+# ==================== LIVE STREAMING ====================
+# Instead of writing a file, the timeline is composited frame by frame and
+# pushed to an RTMP ingest (or an .flv file) at real-time speed, quiz after
+# quiz, for as long as the stream runs. Only a few seconds of frames are
+# queued ahead of the clock; the only file on disk is each quiz's PCM mix.
+
+# Bytes per PCM sample frame (16-bit, all channels)
+PCM_FRAME_BYTES = 2 * audio_mix.CHANNELS
+
+class LiveQuiz:
+    """One quiz laid out for streaming: compositor and mixed audio"""
+
+    def __init__(self, folder_path, compositor, size, fps, total_frames, audio_path, work_dir):
+        self.folder_path = folder_path
+        self.compositor = compositor
+        self.size = size
+        self.fps = fps
+        self.total_frames = total_frames
+        self.audio_path = audio_path
+        self.work_dir = work_dir
+
+    def close(self):
+        self.compositor.close()
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+def prepare_live_quiz(folder_path, matte_path, size=None, fps=None, bg_music_paths=None, transition_audio_path=None,
+                      is_short=False, intro_path=None, outro_path=None, duck_db=DEFAULT_DUCK_DB, verbose=True):
+    """Lay out a quiz and mix its audio for a (w, h) @ fps stream.
+
+    size and fps default to the quiz's first clip. Returns None if the
+    folder has no clips that can be joined.
+    """
+    clip_paths = find_clip_paths(folder_path, intro_path, outro_path, verbose=verbose)
+    if not clip_paths:
+        return None
+
+    infos = load_clip_infos(clip_paths)
+    if not infos:
+        return None
+
+    size = tuple(size or (infos[0]['width'], infos[0]['height']))
+    fps = fps or infos[0]['fps']
+    clips = [LazyClip(info, size) for info in infos]
+    work_dir = tempfile.mkdtemp(prefix='live_')
+    try:
+        matte_frames, matte_duration = load_matte_frames(matte_path, size[0], size[1], fps, is_short)
+        transition_duration = min(2.5, matte_duration)
+        cover_time = min(1.0, transition_duration / 2)
+        starts, overlay_starts, clip_audio, duration = layout_timeline(infos, cover_time)
+
+        audio_path = render_audio_track(
+            os.path.join(work_dir, 'audio.wav'), duration, clip_audio,
+            transition_audio_path=transition_audio_path,
+            transition_starts=overlay_starts,
+            transition_duration=transition_duration,
+            bg_music_paths=bg_music_paths,
+            work_dir=work_dir,
+            duck_db=duck_db
+        )
+    except BaseException:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+
+    compositor = TimelineCompositor(clips, starts, overlay_starts, matte_frames, fps, transition_duration)
+    return LiveQuiz(folder_path, compositor, size, fps, round(duration * fps), audio_path, work_dir)
+
+class LiveStreamWriter:
+    """Persistent ffmpeg pushing FLV to an RTMP URL (or a file) at real-time speed.
+
+    Frames go into a queue bounded to buffer_seconds and a sender thread
+    hands frame n to ffmpeg at t0 + n/fps. Each frame's share of the PCM
+    audio goes through its own queue and thread to a second pipe, so ffmpeg
+    can read either input when it needs to; timestamps come from frame and
+    sample counts, so pacing never moves audio against video. When the
+    producer falls behind, the sender counts an underrun and moves the clock
+    instead of bursting to catch up.
+    """
+
+    def __init__(self, target, size, fps, buffer_seconds=LIVE_BUFFER_SECONDS, profile=None, show_progress=True):
+        w, h = size
+        profile = profile or encode_profiles.get_profile('live')
+        self.target = target
+        self.fps = fps
+        self.frame_shape = (h, w, 3)
+        self.show_progress = show_progress
+        self.frames_queued = 0
+        self.frames_sent = 0
+        self.underruns = 0
+        self.error = None
+        depth = max(1, round(buffer_seconds * fps))
+        self.frames = queue.Queue(maxsize=depth)
+        self.audio = queue.Queue(maxsize=depth)
+
+        audio_read, self._audio_pipe = os.pipe()
+        cmd = [
+            FFMPEG_BINARY, '-y', '-v', 'error',
+            # Both inputs are fully described, and probing would wait for seconds of
+            # audio the bounded buffer never holds while video backs up
+            '-probesize', '32', '-analyzeduration', '0', '-thread_queue_size', '512',
+            '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f'{w}x{h}', '-r', f'{fps:g}', '-i', '-',
+            '-probesize', '32', '-analyzeduration', '0', '-thread_queue_size', '512',
+            '-f', 's16le', '-ar', str(audio_mix.SAMPLE_RATE), '-ac', str(audio_mix.CHANNELS),
+            '-i', f'pipe:{audio_read}',
+            '-map', '0:v:0', '-map', '1:a:0',
+            '-c:v', 'libx264', '-preset', profile['preset'], '-threads', str(profile['threads']),
+            *encode_profiles.ffmpeg_args(profile, fps),
+            '-c:a', 'aac', '-b:a', '128k',
+            '-f', 'flv', target
+        ]
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, pass_fds=(audio_read,))
+        os.close(audio_read)
+
+        self._last_report = time.time()
+        self._threads = [
+            threading.Thread(target=self._guarded, args=(self._send_video,), daemon=True),
+            threading.Thread(target=self._guarded, args=(self._send_audio,), daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def samples_for_next_frame(self):
+        """PCM sample frames that go with the next queued video frame (no drift over the stream)"""
+        n = self.frames_queued
+        rate = audio_mix.SAMPLE_RATE
+        return round((n + 1) * rate / self.fps) - round(n * rate / self.fps)
+
+    def _put(self, q, item):
+        while True:
+            if self.error is not None:
+                raise RuntimeError(f"Live stream to {self.target} failed: {self.error}")
+            try:
+                q.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def put(self, frame, audio):
+        """Queue one frame and its PCM bytes, blocking while the buffer is full"""
+        if frame.shape != self.frame_shape or frame.dtype != np.uint8:
+            raise ValueError(f"Expected {self.frame_shape} uint8 frame, got {frame.shape} {frame.dtype}")
+        # Copied: the compositor reuses its output buffer for the next frame
+        self._put(self.frames, np.array(frame, order='C'))
+        self._put(self.audio, audio)
+        self.frames_queued += 1
+
+    def _guarded(self, loop):
+        try:
+            loop()
+        except (OSError, ValueError) as e:
+            # ffmpeg went away (ingest closed the connection, bad URL, ...)
+            self.error = e
+
+    def _send_video(self):
+        clock = None
+        while True:
+            try:
+                frame = self.frames.get(timeout=1 / self.fps)
+            except queue.Empty:
+                if clock is not None:
+                    self.underruns += 1
+                frame = self.frames.get()
+            if frame is None:
+                return
+
+            now = time.monotonic()
+            if clock is None:
+                clock = now
+            due = clock + self.frames_sent / self.fps
+            if due > now:
+                time.sleep(due - now)
+            elif now - due > 1 / self.fps:
+                # Late: restart the clock here rather than sending a burst
+                clock += now - due
+
+            self.proc.stdin.write(frame.data)
+            self.frames_sent += 1
+
+            if self.show_progress and time.time() - self._last_report >= 5.0:
+                self.report(end='\r')
+
+    def _send_audio(self):
+        # Not paced: the producer can only get buffer_seconds ahead of the video
+        while True:
+            chunk = self.audio.get()
+            if chunk is None:
+                return
+            view = memoryview(chunk)
+            while view:
+                view = view[os.write(self._audio_pipe, view):]
+
+    def report(self, end='\n'):
+        """Print stream time, buffer fill and underruns"""
+        self._last_report = time.time()
+        streamed = self.frames_sent / self.fps
+        print(
+            f"  📡 {int(streamed // 60)}:{streamed % 60:04.1f} streamed | "
+            f"{self.frames.qsize() / self.fps:.1f}s buffered | {self.underruns} underrun(s)   ",
+            end=end
+        )
+
+    def close(self, abort=False):
+        """Send what is queued and let ffmpeg finish the stream.
+
+        abort drops the queued frames first (Ctrl+C), so the stream ends
+        right away but an .flv sink is still finalized.
+        """
+        # Video first: ffmpeg holds back the audio input until the video one ends
+        closers = (self.proc.stdin.close, lambda: os.close(self._audio_pipe))
+        for q, thread, close in zip((self.frames, self.audio), self._threads, closers):
+            if abort:
+                while True:
+                    try:
+                        q.get_nowait()
+                    except queue.Empty:
+                        break
+            while thread.is_alive():
+                try:
+                    q.put(None, timeout=0.5)
+                    break
+                except queue.Full:
+                    continue
+            thread.join()
+            try:
+                close()
+            except OSError:
+                pass
+        returncode = self.proc.wait()
+        if self.show_progress:
+            self.report()
+        if not abort and (returncode != 0 or self.error is not None):
+            raise RuntimeError(f"Live stream to {self.target} failed (ffmpeg exit {returncode}): {self.error}")
+
+def stream_live(folder_paths, matte_path, target, bg_music_paths=None, transition_audio_path=None, is_short=False,
+                intro_path=None, outro_path=None, duck_db=DEFAULT_DUCK_DB, buffer_seconds=LIVE_BUFFER_SECONDS, loops=0):
+    """Stream quizzes back to back to target (rtmp:// URL or .flv path) in real time.
+
+    The playlist repeats `loops` times (0: until interrupted). The stream
+    takes its size and frame rate from the first quiz; while one quiz plays,
+    the next one is opened and its audio mixed on a background thread.
+    Returns target, or None if no quiz had clips.
+    """
+    print(f"\n📡 Live stream to {target} ({'forever' if not loops else f'{loops} loop(s)'}, "
+          f"{buffer_seconds:g}s buffer)")
+    # Every quiz is probed and validated before the stream starts
+    playable = []
+    for path in folder_paths:
+        clip_paths = find_clip_paths(path, intro_path, outro_path)
+        if clip_paths and load_clip_infos(clip_paths):
+            playable.append(path)
+    folder_paths = playable
+    if not folder_paths:
+        return None
+
+    def playlist():
+        loop = 0
+        while not loops or loop < loops:
+            yield from folder_paths
+            loop += 1
+
+    options = dict(bg_music_paths=bg_music_paths, transition_audio_path=transition_audio_path, is_short=is_short,
+                   intro_path=intro_path, outro_path=outro_path, duck_db=duck_db, verbose=False)
+    upcoming = playlist()
+    quiz = prepare_live_quiz(next(upcoming), matte_path, **options)
+    size, fps = quiz.size, quiz.fps
+    print(f"  Stream format: {size[0]}x{size[1]} @ {fps:g}fps")
+    profile = encode_profiles.get_profile('live')
+    print(encode_profiles.describe(profile))
+
+    writer = LiveStreamWriter(target, size, fps, buffer_seconds=buffer_seconds, profile=profile)
+    prefetch = ThreadPoolExecutor(max_workers=1)
+    pending = None
+    aborted = False
+    try:
+        while quiz is not None:
+            next_folder = next(upcoming, None)
+            if next_folder is not None:
+                pending = prefetch.submit(prepare_live_quiz, next_folder, matte_path, size, fps, **options)
+
+            print(f"\n▶️  Now streaming: {quiz.folder_path} ({quiz.total_frames / fps:.1f}s)")
+            underruns = writer.underruns
+            wav = wave.open(quiz.audio_path, 'rb') if quiz.audio_path else None
+            try:
+                for n in range(quiz.total_frames):
+                    frame = quiz.compositor.get_frame(n / fps)
+                    samples = writer.samples_for_next_frame()
+                    audio = wav.readframes(samples) if wav else b''
+                    # Silence for quizzes without audio and for rounding at the end of the mix
+                    audio += bytes(samples * PCM_FRAME_BYTES - len(audio))
+                    writer.put(frame, audio)
+            finally:
+                if wav:
+                    wav.close()
+                quiz.close()
+            run_log.emit('live_quiz', folder=quiz.folder_path, frames=quiz.total_frames,
+                         underruns=writer.underruns - underruns, target=target)
+
+            quiz = pending.result() if pending else None
+            pending = None
+    except KeyboardInterrupt:
+        print("\n⏹️  Stopping live stream...")
+        aborted = True
+    finally:
+        if pending is not None:
+            upcoming_quiz = pending.result()
+            if upcoming_quiz:
+                upcoming_quiz.close()
+        prefetch.shutdown()
+        writer.close(abort=aborted)
+    print(f"\n✅ Live stream ended: {writer.frames_sent / fps:.1f}s sent, {writer.underruns} underrun(s)")
+    return target
 
 if __name__ == "__main__":
     import sys
@@ -410,18 +1533,49 @@ if __name__ == "__main__":
     parser.add_argument('--intro', type=str, help='Path to intro video')
     parser.add_argument('--outro', type=str, help='Path to outro video')
     parser.add_argument('--live', action='store_true', help='Optimize for YouTube Live')
+    parser.add_argument('--mode', choices=['full', 'segment', 'parallel'], default='full', help='full: single-pass render, segment: re-encode transition windows only, parallel: render all segments on a process pool')
+    parser.add_argument('--workers', type=int, help='Worker processes for segment/parallel modes (default: CPU count)')
+    parser.add_argument('--duck-db', type=float, default=DEFAULT_DUCK_DB, help='Lower background music by this many dB under narration (0 to disable)')
+    parser.add_argument('--no-segment-cache', action='store_true', help='Render every segment instead of reusing unchanged ones from <folder>/.segments')
+    parser.add_argument('--fragmented', action='store_true', help='Write a fragmented MP4 and leave <output>.done when finished, so publish.py --follow can upload while encoding')
+    parser.add_argument('--stream', metavar='URL', help='Live mode: stream to an rtmp:// URL (or an .flv file) in real time instead of writing output_path')
+    parser.add_argument('--playlist', nargs='+', default=[], metavar='FOLDER', help='More quiz folders to stream after folder_path (with --stream)')
+    parser.add_argument('--loops', type=int, default=0, help='Times to play the playlist with --stream (default: 0, until Ctrl+C)')
+    parser.add_argument('--encode-profile', choices=list(encode_profiles.PROFILES), help='x264 preset/CRF/GOP profile (default: shorts, long-form or live to match the output; see encode_profiles.py)')
+    parser.add_argument('--live-buffer', type=float, default=LIVE_BUFFER_SECONDS, help=f'Seconds of frames rendered ahead of the stream clock (default: {LIVE_BUFFER_SECONDS:g})')
     
     args = parser.parse_args()
     
     print()
-    join_multiple_videos(
-        args.folder_path, 
-        transition_blob, 
-        args.output_path, 
-        bg_music_paths=bg_music_files if bg_music_files else None,
-        transition_audio_path=transition_audio,
-        is_short=args.short,
-        intro_path=args.intro,
-        outro_path=args.outro,
-        is_live=args.live
-    )
\ No newline at end of file
+    # A follower (publish.py --follow) uploads until <output>.done / .failed shows up
+    clear_write_markers(args.output_path)
+    try:
+        result = join_multiple_videos(
+            args.folder_path, 
+            transition_blob, 
+            args.output_path, 
+            bg_music_paths=bg_music_files if bg_music_files else None,
+            transition_audio_path=transition_audio,
+            is_short=args.short,
+            intro_path=args.intro,
+            outro_path=args.outro,
+            is_live=args.live,
+            mode=args.mode,
+            workers=args.workers,
+            segment_cache=not args.no_segment_cache,
+            duck_db=args.duck_db,
+            fragmented=args.fragmented,
+            stream_url=args.stream,
+            playlist=args.playlist,
+            loops=args.loops,
+            live_buffer=args.live_buffer,
+            encode_profile=args.encode_profile
+        )
+    except BaseException:
+        if args.fragmented:
+            mark_written(args.output_path, False)
+        raise
+    if args.fragmented:
+        mark_written(args.output_path, bool(result))
+    if not result:
+        sys.exit(1)